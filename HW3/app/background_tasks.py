@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from . import models, cache
+from . import models, owner_stats, changes  # noqa: F401 - изменения ссылок попадают в журнал link_changes
 import logging
 import os
 import traceback
@@ -32,10 +32,9 @@ def cleanup_expired_links(db: Session) -> None:
             )
             db.add(expired_link)
             link.is_active = False
-            
-            cache.delete_link_cache(link.short_code)
         
         db.commit()
+        owner_stats.refresh_summaries(db, {link.owner_id for link in expired_links})
         logger.info(f"Moved {len(expired_links)} expired links to archive")
     except Exception as e:
         db.rollback()
@@ -59,9 +58,9 @@ def cleanup_unused_links(db: Session, days: int = DEFAULT_UNUSED_DAYS) -> None:
         for link in unused_links:
             logger.debug(f"Deactivating unused link: {link.short_code}")
             link.is_active = False
-            cache.delete_link_cache(link.short_code)
         
         db.commit()
+        owner_stats.refresh_summaries(db, {link.owner_id for link in unused_links})
         logger.info(f"Deactivated {len(unused_links)} unused links")
     except Exception as e:
         db.rollback()
@@ -0,0 +1,517 @@
+"""
+Массовый импорт ссылок из CSV или NDJSON
+
+Файл читается потоком и обрабатывается пачками по IMPORT_BATCH_SIZE строк:
+пачка проверяется целиком одним вызовом pydantic (List[LinkCreate]),
+занятость всех ее кодов проверяется одним запросом IN (...) на шард,
+а строки пишутся через COPY на PostgreSQL или многострочным INSERT
+на остальных СУБД вместе с записями журнала изменений (app.changes).
+Если алиас заняли после проверки, пачка записывается заново с
+ON CONFLICT DO NOTHING, и отклоняются только строки с занятыми кодами.
+
+Коды для строк без алиаса выделяются блоком из счетчика code_sequences
+и переводятся в строку той же биекцией, что и в генераторе данных
+(datagen.short_code_for). Блок пачки сохраняется в задаче до записи
+ссылок, поэтому после сбоя пачка повторяется с теми же кодами: строки,
+которые уже записаны с тем же адресом и владельцем, не дублируются.
+
+Прогресс хранится в import_jobs после каждой зафиксированной пачки;
+возобновленная задача пропускает уже обработанные строки файла.
+
+Пример запуска:
+    python -m app.bulk_import links.csv --owner-id 1
+    python -m app.bulk_import --resume 3f2c9a...
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import cache, changes, datagen, group_commit, models, owner_stats, schemas, sharding
+from .database import SessionLocal
+from .metrics import registry as metrics_registry
+from .sharding import shard_index
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+IMPORT_DIR = os.getenv("IMPORT_DIR", "imports")
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+# Наибольший размер загружаемого файла (в том виде, в каком он пришел, до распаковки gzip)
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+# Задача в статусе running без прогресса дольше этого времени считается прерванной
+IMPORT_STALE_SECONDS = float(os.getenv("IMPORT_STALE_SECONDS", "300"))
+
+FORMATS = ("csv", "ndjson")
+CODE_SEQUENCE = "links"
+# Номера генератора данных начинаются с нуля: импорт выделяет коды из второй половины пространства
+CODE_SEQUENCE_START = datagen.CODE_SPACE // 2
+
+LINK_COLUMNS = ["short_code", "original_url", "custom_alias", "clicks", "created_at", "expires_at", "is_active", "owner_id"]
+CHANGE_COLUMNS = ["short_code", "action", "changed_at"]
+
+# Синонимы колонок входного файла
+_FIELD_NAMES = {"url": "original_url", "alias": "custom_alias"}
+
+_rows_adapter = TypeAdapter(List[schemas.LinkCreate])
+
+import_rows = metrics_registry.counter("import_rows_total", "Rows processed by bulk link imports by result")
+
+
+def detect_format(file_name: str) -> Optional[str]:
+    """Формат по расширению файла (.csv, .ndjson, .jsonl, в том числе с .gz)"""
+    name = file_name.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return None
+
+
+def open_source(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def _normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+    normalized = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        key = key.strip()
+        # Пустая ячейка CSV - отсутствующее значение
+        normalized[_FIELD_NAMES.get(key, key)] = None if value == "" else value
+    return normalized
+
+
+def read_rows(stream: IO[str], input_format: str) -> Iterator[Dict[str, Any]]:
+    """
+    Потоковое чтение строк файла
+
+    Args:
+        stream: Текстовый поток
+        input_format: csv (с заголовком) или ndjson
+
+    Returns:
+        Итератор словарей original_url, custom_alias, expires_at; строка,
+        которую не удалось разобрать, содержит только ключ _error
+    """
+    if input_format == "csv":
+        for row in csv.DictReader(stream):
+            yield _normalize(row)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {"_error": f"invalid JSON: {e}"}
+            continue
+        yield _normalize(row) if isinstance(row, dict) else {"_error": "expected a JSON object"}
+
+
+def _batches(rows: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    while True:
+        batch = list(itertools.islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _parse_expiry(value: Any) -> Optional[datetime]:
+    if not value or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def validate_batch(rows: Sequence[Dict[str, Any]]) -> Tuple[List[Tuple[int, schemas.LinkCreate, Optional[datetime]]], Dict[int, str]]:
+    """
+    Проверка пачки строк одним вызовом валидатора
+
+    При ошибках валидатор вызывается второй раз только для остальных строк.
+
+    Returns:
+        Корректные строки (номер в пачке, данные, срок действия) и ошибки по номерам строк
+    """
+    errors: Dict[int, str] = {i: row["_error"] for i, row in enumerate(rows) if "_error" in row}
+    candidates = [i for i in range(len(rows)) if i not in errors]
+    try:
+        links = _rows_adapter.validate_python([rows[i] for i in candidates])
+    except ValidationError as e:
+        for error in e.errors():
+            index = candidates[error["loc"][0]]
+            field = ".".join(str(part) for part in error["loc"][1:])
+            errors.setdefault(index, f"{field}: {error['msg']}" if field else error["msg"])
+        candidates = [i for i in candidates if i not in errors]
+        links = _rows_adapter.validate_python([rows[i] for i in candidates])
+
+    valid = []
+    aliases = set()
+    for index, link in zip(candidates, links):
+        try:
+            expires_at = _parse_expiry(link.expires_at)
+        except ValueError as e:
+            errors[index] = f"expires_at: invalid date format: {e}"
+            continue
+        if link.custom_alias:
+            if link.custom_alias in aliases:
+                errors[index] = "custom_alias: duplicated in file"
+                continue
+            aliases.add(link.custom_alias)
+        valid.append((index, link, expires_at))
+    return valid, errors
+
+
+def allocate_codes(db: Session, count: int, name: str = CODE_SEQUENCE) -> int:
+    """
+    Выделение блока из count номеров коротких кодов (фиксирует вызывающий)
+
+    Returns:
+        Первый номер блока; коды - datagen.short_code_for(номер)
+    """
+    while True:
+        sequence = db.query(models.CodeSequence).filter(models.CodeSequence.name == name).with_for_update().first()
+        if sequence is not None:
+            break
+        try:
+            db.add(models.CodeSequence(name=name, next_value=CODE_SEQUENCE_START))
+            db.commit()
+        except IntegrityError:
+            # Счетчик одновременно создала другая задача
+            db.rollback()
+    start = sequence.next_value
+    sequence.next_value = start + count
+    return start
+
+
+def _session_index(short_code: str, source_count: int) -> int:
+    return shard_index(short_code, source_count) if source_count > 1 else 0
+
+
+class _Source:
+    """Сессии источников ссылок, открываются при первом обращении"""
+
+    def __init__(self, session_factories: Sequence[Callable[[], Session]]) -> None:
+        self.session_factories = session_factories
+        self.sessions: Dict[int, Session] = {}
+
+    def session(self, index: int) -> Session:
+        if index not in self.sessions:
+            self.sessions[index] = self.session_factories[index]()
+        return self.sessions[index]
+
+    def by_source(self, short_codes: Iterable[str]) -> Dict[int, List[str]]:
+        groups: Dict[int, List[str]] = {}
+        for short_code in short_codes:
+            groups.setdefault(_session_index(short_code, len(self.session_factories)), []).append(short_code)
+        return groups
+
+    def existing(self, short_codes: Iterable[str]) -> Dict[str, Tuple[str, Optional[int]]]:
+        """Занятые коды: один запрос на источник"""
+        found = {}
+        for index, codes in self.by_source(short_codes).items():
+            rows = self.session(index).query(
+                models.Link.short_code, models.Link.original_url, models.Link.owner_id
+            ).filter(models.Link.short_code.in_(codes))
+            found.update((row.short_code, (row.original_url, row.owner_id)) for row in rows)
+        return found
+
+    def close(self) -> None:
+        for session in self.sessions.values():
+            session.close()
+        self.sessions.clear()
+
+
+def _insert_links(db: Session, links: List[Dict[str, Any]], now: datetime) -> Set[str]:
+    """
+    Запись ссылок и журнала изменений в одной транзакции
+
+    Занятость кодов проверяется до записи, и /links/shorten может занять
+    алиас в промежутке. Тогда пачка откатывается и записывается через
+    INSERT ... ON CONFLICT DO NOTHING (group_commit.insert_links).
+
+    Returns:
+        Записанные коды; остальные коды пачки уже заняты
+    """
+    journal = [{"short_code": link["short_code"], "action": changes.CREATE, "changed_at": now} for link in links]
+    bind = db.get_bind()
+    try:
+        if bind.dialect.name == "postgresql":
+            raw = db.connection().connection
+            datagen.copy_rows(raw, models.Link.__tablename__, LINK_COLUMNS, links)
+            datagen.copy_rows(raw, models.LinkChange.__tablename__, CHANGE_COLUMNS, journal)
+        else:
+            db.execute(insert(models.Link), links)
+            db.execute(insert(models.LinkChange), journal)
+        db.commit()
+        return {link["short_code"] for link in links}
+    except (IntegrityError, bind.dialect.loaded_dbapi.IntegrityError):
+        # COPY идет через DBAPI-соединение, его ошибки не оборачиваются SQLAlchemy
+        db.rollback()
+    inserted = group_commit.insert_links(db, links)
+    db.commit()
+    return set(inserted)
+
+
+def _errors(job: models.ImportJob) -> List[str]:
+    return json.loads(job.errors or "[]")
+
+
+def create_job(db: Session, path: str, input_format: str, owner_id: Optional[int] = None,
+               batch_size: int = IMPORT_BATCH_SIZE, job_id: Optional[str] = None) -> models.ImportJob:
+    job = models.ImportJob(
+        id=job_id or uuid.uuid4().hex,
+        owner_id=owner_id,
+        path=path,
+        format=input_format,
+        batch_size=batch_size,
+        status="pending",
+        rows_read=0,
+        rows_imported=0,
+        rows_rejected=0,
+        batches_committed=0,
+        updated_at=datetime.now()
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def claim(db: Session, job_id: str, stale_seconds: float = IMPORT_STALE_SECONDS) -> bool:
+    """
+    Перевод задачи в статус running, если ее не выполняет другой процесс
+
+    Задача running без прогресса дольше stale_seconds считается прерванной.
+    """
+    now = datetime.now()
+    claimed = db.query(models.ImportJob).filter(
+        models.ImportJob.id == job_id,
+        models.ImportJob.status != "completed",
+        or_(models.ImportJob.status != "running", models.ImportJob.updated_at < now - timedelta(seconds=stale_seconds))
+    ).update({"status": "running", "updated_at": now}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def import_batch(
+    job: models.ImportJob,
+    job_db: Session,
+    source: _Source,
+    rows: Sequence[Dict[str, Any]],
+) -> Dict[str, int]:
+    """
+    Импорт одной пачки и фиксация прогресса задачи
+
+    Returns:
+        Количество импортированных и отклоненных строк пачки
+    """
+    first_row = job.rows_read + 1
+    valid, errors = validate_batch(rows)
+
+    generated = [item for item in valid if not item[1].custom_alias]
+    if generated and job.pending_block is None:
+        job.pending_block = allocate_codes(job_db, len(generated))
+        job.updated_at = datetime.now()
+        job_db.commit()
+    codes = {index: link.custom_alias for index, link, _ in valid if link.custom_alias}
+    codes.update(
+        (index, datagen.short_code_for(job.pending_block + offset)) for offset, (index, _, _) in enumerate(generated)
+    )
+
+    existing = source.existing(codes.values())
+    # Сгенерированный код может совпасть с чужим алиасом: такие строки получают новые коды
+    collided = [index for index, _, _ in generated if codes[index] in existing]
+    while collided:
+        start = allocate_codes(job_db, len(collided))
+        job_db.commit()
+        for offset, index in enumerate(collided):
+            codes[index] = datagen.short_code_for(start + offset)
+        found = source.existing(codes[index] for index in collided)
+        existing.update(found)
+        collided = [index for index in collided if codes[index] in found]
+
+    now = datetime.now()
+    pending: Dict[int, List[Dict[str, Any]]] = {}
+    already_imported = 0
+    for index, link, expires_at in valid:
+        short_code = codes[index]
+        original_url = str(link.original_url)
+        if short_code in existing:
+            if existing[short_code] == (original_url, job.owner_id):
+                # Строка записана до сбоя или файл импортирован повторно
+                already_imported += 1
+            else:
+                errors[index] = "custom_alias: already in use"
+            continue
+        pending.setdefault(_session_index(short_code, len(source.session_factories)), []).append({
+            "short_code": short_code,
+            "original_url": original_url,
+            "custom_alias": link.custom_alias,
+            "clicks": 0,
+            "created_at": now,
+            "expires_at": expires_at,
+            "is_active": True,
+            "owner_id": job.owner_id,
+        })
+
+    lost: Set[str] = set()
+    for index, links in pending.items():
+        inserted = _insert_links(source.session(index), links, now)
+        lost.update(link["short_code"] for link in links if link["short_code"] not in inserted)
+    for index, _, _ in valid:
+        if codes[index] in lost:
+            # Код занят после проверки занятости
+            errors[index] = "custom_alias: already in use"
+
+    imported = already_imported + sum(len(links) for links in pending.values()) - len(lost)
+    messages = _errors(job)
+    for index in sorted(errors):
+        if len(messages) >= IMPORT_MAX_ERRORS:
+            break
+        messages.append(f"row {first_row + index}: {errors[index]}")
+
+    job.rows_read += len(rows)
+    job.rows_imported += imported
+    job.rows_rejected += len(errors)
+    job.batches_committed += 1
+    job.pending_block = None
+    job.errors = json.dumps(messages)
+    job.updated_at = datetime.now()
+    job_db.commit()
+
+    import_rows.inc(imported, labels={"result": "imported"})
+    import_rows.inc(len(errors), labels={"result": "rejected"})
+    if job.owner_id is not None and pending:
+        cache.invalidate_owner_stats([job.owner_id])
+    return {"imported": imported, "rejected": len(errors)}
+
+
+def _default_job_session() -> Session:
+    return SessionLocal()
+
+
+def run_job(
+    job_id: str,
+    job_session_factory: Optional[Callable[[], Session]] = None,
+    session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Выполнение или возобновление задачи импорта
+
+    Строки, учтенные в rows_read, пропускаются; незавершенная пачка
+    повторяется с сохраненным блоком кодов.
+
+    Args:
+        job_id: Идентификатор задачи
+        job_session_factory: Фабрика сессий основной БД (задачи и счетчик кодов)
+        session_factories: Фабрики сессий шардов ссылок или основной БД
+
+    Returns:
+        Итог задачи или None, если ее уже выполняет другой процесс
+    """
+    job_db = (job_session_factory or _default_job_session)()
+    source = _Source(session_factories or sharding.session_factories())
+    try:
+        if not claim(job_db, job_id):
+            logger.warning(f"Import job {job_id} is completed or already running")
+            return None
+        job = job_db.get(models.ImportJob, job_id)
+        started = time.perf_counter()
+        skipped = job.rows_read
+        if skipped:
+            logger.info(f"Resuming import job {job_id} after {skipped} rows")
+        try:
+            with open_source(job.path) as stream:
+                rows = read_rows(stream, job.format)
+                for _ in itertools.islice(rows, skipped):
+                    pass
+                for batch in _batches(rows, job.batch_size):
+                    import_batch(job, job_db, source, batch)
+                    rate = (job.rows_read - skipped) / (time.perf_counter() - started)
+                    logger.info(
+                        f"Import job {job_id}: {job.rows_read} rows read, {job.rows_imported} imported, "
+                        f"{job.rows_rejected} rejected ({rate:.0f} rows/s)"
+                    )
+        except Exception as e:
+            logger.error(f"Import job {job_id} failed: {str(e)}")
+            job_db.rollback()
+            source.close()
+            job.status = "failed"
+            job.updated_at = datetime.now()
+            job_db.commit()
+            raise
+
+        if job.owner_id is not None:
+            for index in range(len(source.session_factories)):
+                owner_stats.refresh_summaries(source.session(index), [job.owner_id])
+        job.status = "completed"
+        job.updated_at = datetime.now()
+        job_db.commit()
+        return job_summary(job)
+    finally:
+        source.close()
+        job_db.close()
+
+
+def job_summary(job: models.ImportJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "format": job.format,
+        "rows_read": job.rows_read,
+        "rows_imported": job.rows_imported,
+        "rows_rejected": job.rows_rejected,
+        "batches_committed": job.batches_committed,
+        "errors": _errors(job),
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Массовый импорт ссылок из CSV или NDJSON")
+    parser.add_argument("file", nargs="?", help="Файл .csv, .ndjson или .jsonl (можно .gz)")
+    parser.add_argument("--format", choices=FORMATS, help="Формат, если его нельзя определить по расширению")
+    parser.add_argument("--owner-id", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--resume", metavar="JOB_ID", help="Возобновить прерванную задачу")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.resume:
+        job_id = args.resume
+    else:
+        if not args.file:
+            parser.error("file or --resume is required")
+        input_format = args.format or detect_format(args.file)
+        if input_format is None:
+            parser.error("cannot detect the file format, use --format")
+        db = _default_job_session()
+        try:
+            job_id = create_job(db, os.path.abspath(args.file), input_format, args.owner_id, args.batch_size).id
+        finally:
+            db.close()
+        logger.info(f"Created import job {job_id}")
+
+    cache.init_redis()
+    result = run_job(job_id)
+    if result is not None:
+        logger.info(f"Import job {job_id} finished: {result['rows_imported']} imported, {result['rows_rejected']} rejected")
+
+
+if __name__ == "__main__":
+    main()
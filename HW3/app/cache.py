@@ -1,8 +1,16 @@
 import redis
 import json
-from typing import Any, Optional, Dict
+import math
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Iterable, Optional, Dict, List, Tuple, TypeVar
 from datetime import datetime
 from .config import REDIS_HOST, REDIS_PORT, REDIS_DB, TESTING
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, LRUCache
+from .hash_ring import RingRedis
+from . import shared_table
 import os
 import logging
 
@@ -10,55 +18,136 @@ logger = logging.getLogger(__name__)
 
 LINK_PREFIX = "link:"
 STATS_PREFIX = "stats:"
+OWNER_STATS_PREFIX = "owner_stats:"
+LOCK_PREFIX = "lock:"
+STALE_PREFIX = "stale:"
+DELTA_PREFIX = "delta:"
 
 CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", str(CACHE_TTL * 2)))
+OWNER_STATS_TTL = int(os.getenv("OWNER_STATS_TTL", "60"))
+CACHE_LOCK_TTL_MS = int(os.getenv("CACHE_LOCK_TTL_MS", "2000"))
+CACHE_LOCK_WAIT = float(os.getenv("CACHE_LOCK_WAIT", "0.5"))
+CACHE_LOCK_POLL = float(os.getenv("CACHE_LOCK_POLL", "0.02"))
+# 0 отключает вероятностное досрочное обновление (XFetch), 1.0 - рекомендуемое значение
+CACHE_XFETCH_BETA = float(os.getenv("CACHE_XFETCH_BETA", "0"))
+CACHE_FALLBACK_SIZE = int(os.getenv("CACHE_FALLBACK_SIZE", "10000"))
+CACHE_FALLBACK_TTL = float(os.getenv("CACHE_FALLBACK_TTL", "60"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+# Несколько узлов через запятую (host:port или redis://...) включают согласованное хеширование
+REDIS_NODES = [node.strip() for node in os.getenv("REDIS_NODES", "").split(",") if node.strip()]
+REDIS_RING_VNODES = int(os.getenv("REDIS_RING_VNODES", "160"))
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+T = TypeVar("T")
 
 _memory_cache: Dict[str, Any] = {}
 
+# Используется, пока Redis недоступен или предохранитель разомкнут
+_fallback_cache = LRUCache(maxsize=CACHE_FALLBACK_SIZE, ttl=CACHE_FALLBACK_TTL)
+
+redis_breaker = CircuitBreaker(
+    "redis",
+    failure_rate_threshold=float(os.getenv("REDIS_BREAKER_FAILURE_RATE", "0.5")),
+    consecutive_failures=int(os.getenv("REDIS_BREAKER_CONSECUTIVE_FAILURES", "5")),
+    slow_call_seconds=float(os.getenv("REDIS_BREAKER_SLOW_CALL_MS", "250")) / 1000,
+    open_seconds=float(os.getenv("REDIS_BREAKER_OPEN_SECONDS", "5")),
+)
+
+def _node_client(node: str) -> redis.Redis:
+    if "://" not in node:
+        node = f"redis://{node}/{REDIS_DB}"
+    return redis.from_url(
+        node,
+        decode_responses=True,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+    )
+
 redis_client = None
-if not TESTING:
+
+def init_redis() -> None:
+    """
+    Создание клиента Redis при запуске приложения, а не при импорте модуля
+
+    Соединение открывается при первой команде. Повторный вызов ничего не делает.
+    """
+    global redis_client
+    if TESTING or redis_client is not None:
+        return
     try:
         redis_url = os.getenv("REDIS_URL")
-        if redis_url:
-            redis_client = redis.from_url(redis_url, decode_responses=True)
-            logger.info("Connected to Redis using REDIS_URL")
+        if REDIS_NODES:
+            redis_client = RingRedis({node: _node_client(node) for node in REDIS_NODES}, vnodes=REDIS_RING_VNODES)
+            logger.info(f"Configured {len(REDIS_NODES)} Redis nodes with consistent hashing")
+        elif redis_url:
+            redis_client = redis.from_url(
+                redis_url,
+                decode_responses=True,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT
+            )
+            logger.info("Configured Redis using REDIS_URL")
         else:
             redis_client = redis.Redis(
                 host=REDIS_HOST, 
                 port=REDIS_PORT, 
                 db=REDIS_DB, 
-                decode_responses=True
+                decode_responses=True,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT
             )
-            logger.info(f"Connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
+            logger.info(f"Configured Redis at {REDIS_HOST}:{REDIS_PORT}")
     except Exception as e:
         logger.error(f"Redis connection error: {e}")
         redis_client = None
 
+def _redis_call(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Вызов Redis через предохранитель"""
+    return redis_breaker.call(fn, *args, **kwargs)
+
+def _log_redis_error(message: str, e: Exception) -> None:
+    # Отказы разомкнутого предохранителя ожидаемы и не засоряют журнал
+    if not isinstance(e, CircuitOpenError):
+        logger.error(f"{message}: {e}")
+
 def set_link_cache(short_code: str, url: str) -> None:
     """Кэширование ссылки"""
+    if shared_table.link_table:
+        shared_table.link_table.invalidate(short_code)
     if TESTING:
         _memory_cache[f"{LINK_PREFIX}{short_code}"] = url
         return
         
+    key = f"{LINK_PREFIX}{short_code}"
+    _fallback_cache.set(key, url)
     if redis_client:
         try:
-            key = f"{LINK_PREFIX}{short_code}"
-            redis_client.set(key, url, ex=CACHE_TTL)
+            _redis_call(redis_client.set, key, url, ex=CACHE_TTL)
         except Exception as e:
-            logger.error(f"Error setting link cache: {e}")
+            _log_redis_error("Error setting link cache", e)
 
 def get_link_cache(short_code: str) -> Optional[str]:
     """Получение ссылки из кэша"""
     if TESTING:
         return _memory_cache.get(f"{LINK_PREFIX}{short_code}")
         
+    key = f"{LINK_PREFIX}{short_code}"
     if redis_client:
         try:
-            key = f"{LINK_PREFIX}{short_code}"
-            return redis_client.get(key)
+            url = _redis_call(redis_client.get, key)
+            if url is not None:
+                _fallback_cache.set(key, url)
+            return url
         except Exception as e:
-            logger.error(f"Error getting link from cache: {e}")
-    return None
+            _log_redis_error("Error getting link from cache", e)
+    return _fallback_cache.get(key)
 
 def set_stats_cache(short_code: str, stats: Dict[str, Any]) -> None:
     """Кэширование статистики ссылки"""
@@ -66,12 +155,14 @@ def set_stats_cache(short_code: str, stats: Dict[str, Any]) -> None:
         _memory_cache[f"{STATS_PREFIX}{short_code}"] = json.dumps(stats)
         return
         
+    key = f"{STATS_PREFIX}{short_code}"
+    data = json.dumps(stats)
+    _fallback_cache.set(key, data)
     if redis_client:
         try:
-            key = f"{STATS_PREFIX}{short_code}"
-            redis_client.set(key, json.dumps(stats), ex=CACHE_TTL)
+            _redis_call(redis_client.set, key, data, ex=CACHE_TTL)
         except Exception as e:
-            logger.error(f"Error setting stats cache: {e}")
+            _log_redis_error("Error setting stats cache", e)
 
 def get_stats_cache(short_code: str) -> Optional[Dict[str, Any]]:
     """Получение статистики ссылки из кэша"""
@@ -79,30 +170,52 @@ def get_stats_cache(short_code: str) -> Optional[Dict[str, Any]]:
         data = _memory_cache.get(f"{STATS_PREFIX}{short_code}")
         return json.loads(data) if data else None
         
+    key = f"{STATS_PREFIX}{short_code}"
     if redis_client:
         try:
-            key = f"{STATS_PREFIX}{short_code}"
-            data = redis_client.get(key)
-            if data:
-                return json.loads(data)
+            data = _redis_call(redis_client.get, key)
+            return json.loads(data) if data else None
         except Exception as e:
-            logger.error(f"Error getting stats from cache: {e}")
-    return None
+            _log_redis_error("Error getting stats from cache", e)
+    data = _fallback_cache.get(key)
+    return json.loads(data) if data else None
 
 def delete_link_cache(short_code: str) -> None:
     """Удаление ссылки из кэша"""
+    invalidate_links([short_code])
+
+def invalidate_links(short_codes: Iterable[str]) -> None:
+    """
+    Удаление ссылок и их статистики из всех уровней кэша одной командой Redis
+
+    Args:
+        short_codes: Короткие коды измененных ссылок
+    """
+    keys = []
+    for short_code in short_codes:
+        if shared_table.link_table:
+            shared_table.link_table.invalidate(short_code)
+        link_key = f"{LINK_PREFIX}{short_code}"
+        stats_key = f"{STATS_PREFIX}{short_code}"
+        keys.extend((
+            link_key, stats_key,
+            f"{STALE_PREFIX}{link_key}", f"{STALE_PREFIX}{stats_key}",
+            f"{DELTA_PREFIX}{link_key}", f"{DELTA_PREFIX}{stats_key}",
+        ))
+    if not keys:
+        return
     if TESTING:
-        _memory_cache.pop(f"{LINK_PREFIX}{short_code}", None)
-        _memory_cache.pop(f"{STATS_PREFIX}{short_code}", None)
+        for key in keys:
+            _memory_cache.pop(key, None)
         return
-        
+
+    for key in keys:
+        _fallback_cache.pop(key)
     if redis_client:
         try:
-            link_key = f"{LINK_PREFIX}{short_code}"
-            stats_key = f"{STATS_PREFIX}{short_code}"
-            redis_client.delete(link_key, stats_key)
+            _redis_call(redis_client.delete, *keys)
         except Exception as e:
-            logger.error(f"Error deleting from cache: {e}")
+            _log_redis_error("Error deleting from cache", e)
 
 def increment_link_clicks(short_code: str) -> None:
     """Инкремент счетчика кликов в кэше"""
@@ -116,13 +229,365 @@ def increment_link_clicks(short_code: str) -> None:
             _memory_cache[stats_key] = json.dumps(stats)
         return
         
+    try:
+        stats = get_stats_cache(short_code)
+        if stats:
+            stats['clicks'] += 1
+            stats['last_used'] = datetime.now().isoformat()
+            set_stats_cache(short_code, stats)
+    except Exception as e:
+        logger.error(f"Error incrementing clicks in cache: {e}")
+
+
+class _Flight:
+    """Загрузка значения, выполняющаяся в данный момент"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_inflight: Dict[str, _Flight] = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key: str, loader: Callable[[], T]) -> T:
+    """
+    Выполнение loader не более одного раза на ключ в рамках процесса
+
+    Одновременные вызовы с тем же ключом ждут завершения первого
+    и получают его результат (или его исключение).
+    """
+    with _inflight_lock:
+        flight = _inflight.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _inflight[key] = _Flight()
+
+    if not is_leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = loader()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        flight.done.set()
+
+
+def should_refresh_early(delta: float, ttl_remaining: float, beta: Optional[float] = None) -> bool:
+    """
+    Решение о досрочном обновлении ключа (XFetch)
+
+    Args:
+        delta: Время последней загрузки значения в секундах
+        ttl_remaining: Оставшееся время жизни ключа в секундах
+        beta: Агрессивность обновления, 0 отключает механизм
+
+    Returns:
+        True, если значение стоит перезагрузить до истечения TTL
+    """
+    beta = CACHE_XFETCH_BETA if beta is None else beta
+    if beta <= 0 or delta <= 0:
+        return False
+    return delta * beta * -math.log(1.0 - random.random()) >= ttl_remaining
+
+
+def _get_raw(key: str) -> Tuple[Optional[str], bool]:
+    """Значение ключа и признак необходимости досрочного обновления"""
+    if TESTING:
+        return _memory_cache.get(key), False
+    if not redis_client:
+        return _fallback_cache.get(key), False
+    try:
+        if CACHE_XFETCH_BETA <= 0:
+            return _redis_call(redis_client.get, key), False
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        pipe.get(f"{DELTA_PREFIX}{key}")
+        value, pttl, delta = _redis_call(pipe.execute)
+        if value is None:
+            return None, False
+        return value, should_refresh_early(float(delta or 0), max(pttl or 0, 0) / 1000)
+    except Exception as e:
+        _log_redis_error(f"Error getting {key} from cache", e)
+        return _fallback_cache.get(key), False
+
+
+def _set_raw(key: str, value: str, delta: float, ttl: int = CACHE_TTL) -> None:
+    """Запись значения вместе с устаревшей копией и временем загрузки"""
+    if TESTING:
+        _memory_cache[key] = value
+        return
+    _fallback_cache.set(key, value)
     if redis_client:
         try:
-            stats_key = f"{STATS_PREFIX}{short_code}"
-            stats = get_stats_cache(short_code)
-            if stats:
-                stats['clicks'] += 1
-                stats['last_used'] = datetime.now().isoformat()
-                set_stats_cache(short_code, stats)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(key, value, ex=ttl)
+            pipe.set(f"{STALE_PREFIX}{key}", value, ex=CACHE_STALE_TTL)
+            if CACHE_XFETCH_BETA > 0:
+                pipe.set(f"{DELTA_PREFIX}{key}", delta, ex=ttl)
+            _redis_call(pipe.execute)
         except Exception as e:
-            logger.error(f"Error incrementing clicks in cache: {e}")
+            _log_redis_error(f"Error setting {key} in cache", e)
+
+
+def _load_and_store(key: str, loader: Callable[[], Optional[str]], ttl: int = CACHE_TTL) -> Optional[str]:
+    started = time.perf_counter()
+    value = loader()
+    if value is not None:
+        _set_raw(key, value, time.perf_counter() - started, ttl)
+    return value
+
+
+def _wait_for_value(key: str) -> Optional[str]:
+    """Ожидание значения, которое загружает другой воркер"""
+    stale = _redis_call(redis_client.get, f"{STALE_PREFIX}{key}")
+    if stale is not None:
+        return stale
+    deadline = time.monotonic() + CACHE_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_LOCK_POLL)
+        value = _redis_call(redis_client.get, key)
+        if value is not None:
+            return value
+    return None
+
+
+def _load_with_lock(key: str, loader: Callable[[], Optional[str]], ttl: int = CACHE_TTL) -> Optional[str]:
+    """
+    Загрузка при промахе с короткой блокировкой в Redis
+
+    Воркер, получивший блокировку, загружает значение. Остальные сразу получают
+    устаревшую копию, если она есть, или ждут появления свежего значения;
+    по истечении ожидания загружают значение сами.
+    """
+    if TESTING or not redis_client:
+        return _load_and_store(key, loader, ttl)
+
+    lock_key = f"{LOCK_PREFIX}{key}"
+    token = uuid.uuid4().hex
+    try:
+        acquired = _redis_call(redis_client.set, lock_key, token, nx=True, px=CACHE_LOCK_TTL_MS)
+        if not acquired:
+            value = _wait_for_value(key)
+            if value is not None:
+                return value
+    except Exception as e:
+        _log_redis_error(f"Error acquiring cache lock for {key}", e)
+        acquired = False
+
+    try:
+        return _load_and_store(key, loader, ttl)
+    finally:
+        if acquired:
+            try:
+                _redis_call(redis_client.eval, _RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+            except Exception as e:
+                _log_redis_error(f"Error releasing cache lock for {key}", e)
+
+
+def _get_or_load(key: str, loader: Callable[[], Optional[str]], ttl: int = CACHE_TTL) -> Optional[str]:
+    value, refresh_early = _get_raw(key)
+    if value is not None:
+        if not refresh_early:
+            return value
+        with _inflight_lock:
+            if key in _inflight:
+                return value
+    return single_flight(key, lambda: _load_with_lock(key, loader, ttl))
+
+
+def load_link(short_code: str, loader: Callable[[], Optional[str]]) -> Optional[str]:
+    """
+    Получение ссылки из кэша с загрузкой при промахе
+
+    Сначала проверяется общая таблица популярных ссылок (если включена),
+    затем Redis.
+
+    Args:
+        short_code: Короткий код ссылки
+        loader: Загрузка оригинального URL из БД, None если ссылки нет
+
+    Returns:
+        Оригинальный URL или None
+    """
+    if shared_table.link_table:
+        url, deleted = shared_table.link_table.get_url(short_code)
+        if url is not None or deleted:
+            return url
+    return _get_or_load(f"{LINK_PREFIX}{short_code}", loader)
+
+
+def load_stats(short_code: str, loader: Callable[[], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    """
+    Получение статистики из кэша с загрузкой при промахе
+
+    Args:
+        short_code: Короткий код ссылки
+        loader: Загрузка статистики из БД, None если ссылки нет
+
+    Returns:
+        Статистика ссылки или None
+    """
+    def load_raw() -> Optional[str]:
+        stats = loader()
+        return json.dumps(stats) if stats is not None else None
+
+    data = _get_or_load(f"{STATS_PREFIX}{short_code}", load_raw)
+    return json.loads(data) if data else None
+
+
+def load_owner_stats(owner_id: int, loader: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Сводная статистика владельца из кэша (на OWNER_STATS_TTL секунд) с загрузкой при промахе
+
+    Args:
+        owner_id: Идентификатор владельца
+        loader: Расчет статистики по БД
+
+    Returns:
+        Сводная статистика владельца
+    """
+    data = _get_or_load(f"{OWNER_STATS_PREFIX}{owner_id}", lambda: json.dumps(loader()), OWNER_STATS_TTL)
+    return json.loads(data)
+
+
+def invalidate_owner_stats(owner_ids: Iterable[int]) -> None:
+    """Удаление сводной статистики владельцев из всех уровней кэша одной командой Redis"""
+    keys = []
+    for owner_id in owner_ids:
+        key = f"{OWNER_STATS_PREFIX}{owner_id}"
+        keys.extend((key, f"{STALE_PREFIX}{key}", f"{DELTA_PREFIX}{key}"))
+    if not keys:
+        return
+    if TESTING:
+        for key in keys:
+            _memory_cache.pop(key, None)
+        return
+
+    for key in keys:
+        _fallback_cache.pop(key)
+    if redis_client:
+        try:
+            _redis_call(redis_client.delete, *keys)
+        except Exception as e:
+            _log_redis_error("Error deleting owner stats from cache", e)
+
+
+def stats_from_link(link: Any) -> Dict[str, Any]:
+    """Представление ссылки в формате кэша статистики"""
+    return {
+        "original_url": link.original_url,
+        "short_code": link.short_code,
+        "created_at": link.created_at.isoformat(),
+        "clicks": link.clicks,
+        "last_used": link.last_used.isoformat() if link.last_used else None,
+        "expires_at": link.expires_at.isoformat() if link.expires_at else None,
+        "owner_id": link.owner_id,
+        "version": link.version
+    }
+
+
+def set_many_links(links: List[Dict[str, Any]]) -> None:
+    """
+    Запись пачки ссылок и их статистики в кэш одним конвейером
+
+    Args:
+        links: Статистика ссылок в формате stats_from_link
+    """
+    if TESTING:
+        for stats in links:
+            _memory_cache[f"{LINK_PREFIX}{stats['short_code']}"] = stats["original_url"]
+            _memory_cache[f"{STATS_PREFIX}{stats['short_code']}"] = json.dumps(stats)
+        return
+
+    for stats in links:
+        _fallback_cache.set(f"{LINK_PREFIX}{stats['short_code']}", stats["original_url"])
+        _fallback_cache.set(f"{STATS_PREFIX}{stats['short_code']}", json.dumps(stats))
+
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for stats in links:
+                link_key = f"{LINK_PREFIX}{stats['short_code']}"
+                stats_key = f"{STATS_PREFIX}{stats['short_code']}"
+                data = json.dumps(stats)
+                pipe.set(link_key, stats["original_url"], ex=CACHE_TTL)
+                pipe.set(stats_key, data, ex=CACHE_TTL)
+                pipe.set(f"{STALE_PREFIX}{link_key}", stats["original_url"], ex=CACHE_STALE_TTL)
+                pipe.set(f"{STALE_PREFIX}{stats_key}", data, ex=CACHE_STALE_TTL)
+            _redis_call(pipe.execute)
+        except Exception as e:
+            _log_redis_error("Error setting links in cache", e)
+
+
+def refresh_link(stats: Dict[str, Any], removed: Iterable[str] = ()) -> None:
+    """
+    Замена ссылки и ее статистики в кэше новыми значениями одним конвейером
+
+    Вместо удаления после фиксации и повторной загрузки при следующем чтении
+    ключи ссылки сразу перезаписываются, а ключи прежних кодов удаляются.
+
+    Args:
+        stats: Статистика ссылки в формате stats_from_link
+        removed: Прежние короткие коды ссылки (после смены алиаса)
+    """
+    short_code = stats["short_code"]
+    link_key = f"{LINK_PREFIX}{short_code}"
+    stats_key = f"{STATS_PREFIX}{short_code}"
+    data = json.dumps(stats)
+    stale_keys = [f"{DELTA_PREFIX}{link_key}", f"{DELTA_PREFIX}{stats_key}"]
+    for code in [short_code, *removed]:
+        if shared_table.link_table:
+            shared_table.link_table.invalidate(code)
+        if code == short_code:
+            continue
+        old_link_key = f"{LINK_PREFIX}{code}"
+        old_stats_key = f"{STATS_PREFIX}{code}"
+        stale_keys.extend((
+            old_link_key, old_stats_key,
+            f"{STALE_PREFIX}{old_link_key}", f"{STALE_PREFIX}{old_stats_key}",
+            f"{DELTA_PREFIX}{old_link_key}", f"{DELTA_PREFIX}{old_stats_key}",
+        ))
+    if TESTING:
+        for key in stale_keys:
+            _memory_cache.pop(key, None)
+        _memory_cache[link_key] = stats["original_url"]
+        _memory_cache[stats_key] = data
+        return
+
+    for key in stale_keys:
+        _fallback_cache.pop(key)
+    _fallback_cache.set(link_key, stats["original_url"])
+    _fallback_cache.set(stats_key, data)
+    if redis_client:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(*stale_keys)
+            pipe.set(link_key, stats["original_url"], ex=CACHE_TTL)
+            pipe.set(stats_key, data, ex=CACHE_TTL)
+            pipe.set(f"{STALE_PREFIX}{link_key}", stats["original_url"], ex=CACHE_STALE_TTL)
+            pipe.set(f"{STALE_PREFIX}{stats_key}", data, ex=CACHE_STALE_TTL)
+            _redis_call(pipe.execute)
+        except Exception as e:
+            _log_redis_error("Error refreshing link in cache", e)
+
+
+def circuit_state() -> Dict[str, Any]:
+    """Состояние предохранителя Redis и резервного кэша"""
+    state = {**redis_breaker.snapshot(), "fallback_entries": len(_fallback_cache)}
+    if isinstance(redis_client, RingRedis):
+        state["nodes"] = redis_client.nodes_state()
+    if shared_table.link_table:
+        state["shared_table"] = shared_table.link_table.snapshot()
+    return state
@@ -0,0 +1,314 @@
+"""
+Журнал изменений ссылок
+
+Каждое создание, изменение, деактивация и архивирование ссылки записывается
+в таблицу link_changes в той же транзакции (обработчик before_flush сессии),
+поэтому изменение и запись о нем фиксируются или откатываются вместе.
+После фиксации процесс, сделавший изменение, сразу сбрасывает кэш этих
+ссылок; остальные воркеры читают журнал по порядку (ChangeFeed) и сбрасывают
+свои уровни кэша пачками. По тому же журналу строятся дельты снимков
+для узлов перенаправления (app.snapshot).
+
+Пример повторной обработки журнала с начала:
+    python -m app.changes --from-id 0
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session
+from . import cache, models, sharding
+from .config import TESTING
+import argparse
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CREATE = "create"
+UPDATE = "update"
+DEACTIVATE = "deactivate"
+ARCHIVE = "archive"
+
+CHANGE_FEED_ENABLED = os.getenv("CHANGE_FEED_ENABLED", str(not TESTING)).lower() in ("true", "1", "t")
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "1"))
+CHANGE_FEED_BATCH_SIZE = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500"))
+CHANGE_RETENTION_HOURS = float(os.getenv("CHANGE_RETENTION_HOURS", "24"))
+# Сколько ждать запись журнала с пропущенным номером, прежде чем считать ее откатом
+CHANGE_FEED_GAP_SECONDS = float(os.getenv("CHANGE_FEED_GAP_SECONDS", "60"))
+
+# Коды и владельцы ссылок, измененных в текущей транзакции сессии
+_PENDING = "link_changes"
+_PENDING_OWNERS = "link_owners"
+
+_TRACKED_ATTRIBUTES = ("short_code", "original_url", "expires_at", "is_active")
+
+
+def record(session: Session, short_code: str, action: str, owner_id: Optional[int] = None,
+           invalidate: bool = True) -> None:
+    """
+    Запись изменения в журнал в транзакции сессии
+
+    Нужна для массовых UPDATE, которые не проходят через before_flush.
+    Если известен владелец, после фиксации сбрасывается и его сводная статистика.
+    С invalidate=False кэш ссылки после фиксации не сбрасывается: вызывающий
+    сам записывает в него новые значения (cache.refresh_link).
+    """
+    session.add(models.LinkChange(short_code=short_code, action=action, changed_at=datetime.now()))
+    if invalidate:
+        session.info.setdefault(_PENDING, set()).add(short_code)
+    if owner_id is not None:
+        session.info.setdefault(_PENDING_OWNERS, set()).add(owner_id)
+
+
+def _link_changes(session: Session) -> List[Any]:
+    """Изменения ссылок сессии: (короткий код, действие, владелец)"""
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, models.Link):
+            changes.append((obj.short_code, CREATE, obj.owner_id))
+        elif isinstance(obj, models.ExpiredLink):
+            changes.append((obj.short_code, ARCHIVE, obj.owner_id))
+
+    for obj in session.dirty:
+        if not isinstance(obj, models.Link):
+            continue
+        attrs = inspect(obj).attrs
+        if not any(attrs[name].history.has_changes() for name in _TRACKED_ATTRIBUTES):
+            continue
+        for old_code in attrs.short_code.history.deleted or ():
+            changes.append((old_code, DEACTIVATE, obj.owner_id))
+        if attrs.is_active.history.has_changes() and not obj.is_active:
+            changes.append((obj.short_code, DEACTIVATE, obj.owner_id))
+        else:
+            changes.append((obj.short_code, UPDATE, obj.owner_id))
+
+    for obj in session.deleted:
+        if isinstance(obj, models.Link):
+            changes.append((obj.short_code, DEACTIVATE, obj.owner_id))
+    return changes
+
+
+@event.listens_for(Session, "before_flush")
+def _record_changes(session: Session, flush_context: Any, instances: Any) -> None:
+    for short_code, action, owner_id in _link_changes(session):
+        record(session, short_code, action, owner_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    short_codes = session.info.pop(_PENDING, None)
+    if short_codes:
+        cache.invalidate_links(short_codes)
+    owner_ids = session.info.pop(_PENDING_OWNERS, None)
+    if owner_ids:
+        cache.invalidate_owner_stats(owner_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop(_PENDING, None)
+    session.info.pop(_PENDING_OWNERS, None)
+
+
+def latest_id(db: Session) -> int:
+    return db.query(func.max(models.LinkChange.id)).scalar() or 0
+
+
+def oldest_id(db: Session) -> Optional[int]:
+    """Номер самой старой записи журнала, оставшейся после prune (None - журнал пуст)"""
+    return db.query(func.min(models.LinkChange.id)).scalar()
+
+
+def read_changes(db: Session, after_id: int, limit: int = CHANGE_FEED_BATCH_SIZE) -> List[models.LinkChange]:
+    """Записи журнала после after_id по порядку"""
+    return db.query(models.LinkChange).filter(
+        models.LinkChange.id > after_id
+    ).order_by(models.LinkChange.id).limit(limit).all()
+
+
+def settled_id(after_id: int, changes: Sequence[models.LinkChange],
+               gap_seconds: float = CHANGE_FEED_GAP_SECONDS) -> int:
+    """
+    Номер записи, до которой журнал прочитан без пропусков
+
+    Номера записей выдаются до фиксации, и транзакции фиксируются не по их
+    порядку: пропуск в номерах - запись, которая еще может появиться. Курсор
+    не продвигается за первый пропуск, пока запись после него не старше
+    gap_seconds; после этого пропуск считается откатом.
+
+    Args:
+        after_id: Курсор, до которого журнал уже прочитан без пропусков
+        changes: Записи после after_id по порядку номеров
+
+    Returns:
+        Новый курсор
+    """
+    now = datetime.now().astimezone()
+    settled = after_id
+    for change in changes:
+        if change.id != settled + 1:
+            changed_at = change.changed_at
+            if changed_at is None:
+                break
+            cutoff = now - timedelta(seconds=gap_seconds)
+            if (cutoff if changed_at.tzinfo else cutoff.replace(tzinfo=None)) < changed_at:
+                break
+        settled = change.id
+    return settled
+
+
+def prune(db: Session, retention_hours: float = CHANGE_RETENTION_HOURS) -> int:
+    """Удаление записей журнала старше retention_hours часов"""
+    cutoff = datetime.now() - timedelta(hours=retention_hours)
+    deleted = db.query(models.LinkChange).filter(models.LinkChange.changed_at < cutoff).delete(
+        synchronize_session=False
+    )
+    db.commit()
+    return deleted
+
+
+def invalidate_caches(changes: Sequence[models.LinkChange]) -> None:
+    cache.invalidate_links({change.short_code for change in changes})
+
+
+class ChangeFeed:
+    """
+    Чтение журнала изменений из основной БД или со всех шардов
+
+    Для каждого источника хранится курсор: номер записи, до которой журнал
+    прочитан без пропусков (settled_id). Записи после курсора перечитываются
+    при каждом опросе, пока пропуски в номерах не заполнятся или не устареют,
+    а обработчики получают только еще не обработанные из них. Без start_ids
+    чтение начинается с текущего конца журнала: изменения, сделанные до
+    запуска процесса, уже не могут быть в его кэше.
+    """
+
+    def __init__(
+        self,
+        session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+        handlers: Optional[List[Callable[[Sequence[models.LinkChange]], Any]]] = None,
+        batch_size: int = CHANGE_FEED_BATCH_SIZE,
+        start_ids: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.session_factories = list(session_factories or sharding.session_factories())
+        self.handlers = handlers if handlers is not None else [invalidate_caches]
+        self.batch_size = batch_size
+        self.cursors: Optional[List[int]] = list(start_ids) if start_ids is not None else None
+        self.processed = 0
+        # Обработанные записи после курсора каждого источника
+        self._seen: Dict[int, Set[int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _start_from_end(self) -> List[int]:
+        cursors = []
+        for factory in self.session_factories:
+            db = factory()
+            try:
+                cursors.append(latest_id(db))
+            finally:
+                db.close()
+        return cursors
+
+    def poll(self) -> int:
+        """
+        Обработка новых записей всех источников пачками
+
+        Returns:
+            Количество обработанных записей
+        """
+        if self.cursors is None:
+            self.cursors = self._start_from_end()
+            return 0
+        processed = 0
+        for index, factory in enumerate(self.session_factories):
+            seen = self._seen.setdefault(index, set())
+            after_id = settled = self.cursors[index]
+            db = factory()
+            try:
+                while True:
+                    changes = read_changes(db, after_id, self.batch_size)
+                    if not changes:
+                        break
+                    if settled == after_id:
+                        # Курсор дошел до конца предыдущей пачки без пропусков
+                        settled = settled_id(settled, changes)
+                    after_id = changes[-1].id
+                    fresh = [change for change in changes if change.id not in seen]
+                    if fresh:
+                        for handler in self.handlers:
+                            handler(fresh)
+                        seen.update(change.id for change in fresh)
+                        processed += len(fresh)
+                    if len(changes) < self.batch_size:
+                        break
+            finally:
+                db.close()
+            self.cursors[index] = settled
+            self._seen[index] = {change_id for change_id in seen if change_id > settled}
+        self.processed += processed
+        return processed
+
+    def prune(self, retention_hours: float = CHANGE_RETENTION_HOURS) -> int:
+        deleted = 0
+        for factory in self.session_factories:
+            db = factory()
+            try:
+                deleted += prune(db, retention_hours)
+            finally:
+                db.close()
+        return deleted
+
+    def run(self, interval: float = CHANGE_FEED_POLL_SECONDS, prune_every: float = 3600.0) -> None:
+        next_prune = time.monotonic() + prune_every
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + prune_every
+                    self.prune()
+            except Exception as e:
+                logger.error(f"Change feed poll failed: {e}")
+            self._stop.wait(interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"cursors": self.cursors, "processed": self.processed}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Повторная обработка журнала изменений ссылок")
+    parser.add_argument("--from-id", type=int, default=0, help="Начать после этой записи (на каждом источнике)")
+    parser.add_argument("--dry-run", action="store_true", help="Только вывести изменения")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cache.init_redis()
+    printed: Set[str] = set()
+
+    def show(changes: Iterable[models.LinkChange]) -> None:
+        for change in changes:
+            print(f"{change.id}\t{change.changed_at.isoformat()}\t{change.action}\t{change.short_code}")
+            printed.add(change.short_code)
+
+    handlers = [show] if args.dry_run else [show, invalidate_caches]
+    feed = ChangeFeed(handlers=handlers, start_ids=[args.from_id] * len(sharding.session_factories()))
+    feed.poll()
+    logger.info(f"Replayed {feed.processed} changes for {len(printed)} links")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional, Tuple, TypeVar
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен: предохранитель разомкнут"""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для вызовов внешнего сервиса
+
+    Отслеживает долю ошибок и медленных вызовов в скользящем окне
+    из последних window_size вызовов. Размыкается, когда доля превышает
+    failure_rate_threshold или подряд случилось consecutive_failures ошибок.
+    Через open_seconds пропускает до half_open_max_calls пробных вызовов:
+    успех замыкает цепь, ошибка снова размыкает ее.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        consecutive_failures: int = 5,
+        window_size: int = 50,
+        min_calls: int = 10,
+        slow_call_seconds: float = 0.25,
+        open_seconds: float = 5.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.consecutive_failures = consecutive_failures
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._window: Deque[bool] = deque(maxlen=window_size)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._consecutive = 0
+        self._half_open_calls = 0
+        self._avg_latency = 0.0
+        self._rejected = 0
+        self._opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self.clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuit '{self.name}' is half-open, probing")
+        return self._state
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._opened_count += 1
+        self._window.clear()
+        logger.warning(f"Circuit '{self.name}' opened")
+
+    def _before_call(self) -> None:
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            if state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(f"Circuit '{self.name}' is half-open")
+                self._half_open_calls += 1
+
+    def _after_call(self, latency: float, failed: bool) -> None:
+        with self._lock:
+            self._avg_latency = latency if self._avg_latency == 0 else 0.9 * self._avg_latency + 0.1 * latency
+            failed = failed or latency > self.slow_call_seconds
+
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                    self._consecutive = 0
+                    self._window.clear()
+                    logger.info(f"Circuit '{self.name}' closed")
+                return
+
+            self._window.append(failed)
+            self._consecutive = self._consecutive + 1 if failed else 0
+            if self._state != CLOSED:
+                return
+            if self._consecutive >= self.consecutive_failures:
+                self._open()
+            elif len(self._window) >= self.min_calls:
+                failure_rate = sum(self._window) / len(self._window)
+                if failure_rate >= self.failure_rate_threshold:
+                    self._open()
+
+    def call(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Вызов функции через предохранитель
+
+        Raises:
+            CircuitOpenError: если цепь разомкнута
+        """
+        self._before_call()
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._after_call(time.perf_counter() - started, failed=True)
+            raise
+        self._after_call(time.perf_counter() - started, failed=False)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._window.clear()
+            self._consecutive = 0
+            self._half_open_calls = 0
+            self._avg_latency = 0.0
+            self._rejected = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Состояние предохранителя для /healthz"""
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "failure_rate": round(sum(self._window) / len(self._window), 3) if self._window else 0.0,
+                "calls_in_window": len(self._window),
+                "avg_latency_ms": round(self._avg_latency * 1000, 3),
+                "rejected_calls": self._rejected,
+                "times_opened": self._opened_count,
+            }
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш в памяти процесса с временем жизни записей"""
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: OrderedDict[Hashable, Tuple[Any, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self.clock():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = self.clock() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
@@ -0,0 +1,469 @@
+"""
+События переходов и агрегаты по времени
+
+Перенаправление только добавляет событие (код, время, referrer, user-agent)
+в кольцевой буфер процесса. Фоновый поток пачками записывает события
+в таблицу click_events (на шарде ссылки) и сворачивает новые события
+в агрегаты click_rollups по минутам, часам и дням. Номер последнего
+учтенного события хранится в click_rollup_cursors и обновляется в той же
+транзакции, что и агрегаты; строка курсора блокируется (FOR UPDATE),
+поэтому агрегаты считают не более одного воркера за раз. Курсор не уходит
+за пропуск в номерах событий, пока тот не устареет (_committed_prefix).
+
+В той же транзакции хеши посетителей (IP и user-agent) добавляются
+в HyperLogLog-скетчи ссылки за день и за все время (app.hll): оценка
+уникальных посетителей за период объединяет дневные скетчи. После
+свертки пересчитываются сводки владельцев ссылок (app.owner_stats).
+"""
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+from sqlalchemy import and_, func, insert, literal_column, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ColumnElement, FunctionElement
+from sqlalchemy.types import DateTime
+from . import hll, leaderboard, models, owner_stats, sharding
+from .config import TESTING
+from .metrics import registry as metrics_registry
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLICK_EVENTS_ENABLED = os.getenv("CLICK_EVENTS_ENABLED", str(not TESTING)).lower() in ("true", "1", "t")
+CLICK_BUFFER_SIZE = int(os.getenv("CLICK_BUFFER_SIZE", "100000"))
+CLICK_FLUSH_SECONDS = float(os.getenv("CLICK_FLUSH_SECONDS", "1"))
+CLICK_FLUSH_BATCH = int(os.getenv("CLICK_FLUSH_BATCH", "5000"))
+CLICK_ROLLUP_SECONDS = float(os.getenv("CLICK_ROLLUP_SECONDS", "10"))
+CLICK_ROLLUP_BATCH = int(os.getenv("CLICK_ROLLUP_BATCH", "10000"))
+CLICK_EVENT_RETENTION_DAYS = int(os.getenv("CLICK_EVENT_RETENTION_DAYS", "7"))
+# Сколько ждать событие с пропущенным номером, прежде чем считать его вставку откатом
+CLICK_ROLLUP_GAP_SECONDS = float(os.getenv("CLICK_ROLLUP_GAP_SECONDS", "60"))
+
+ROLLUP_CURSOR = "rollup"
+ALL_TIME = "all"
+
+GRANULARITIES = ("minute", "hour", "day")
+BUCKET_SECONDS = {"minute": 60, "hour": 3600, "day": 86400}
+# Период по умолчанию для /links/{short_code}/timeseries
+DEFAULT_RANGES = {"minute": timedelta(hours=1), "hour": timedelta(days=7), "day": timedelta(days=90)}
+
+events_recorded = metrics_registry.counter("click_events_recorded_total", "Click events added to the buffer")
+events_dropped = metrics_registry.counter("click_events_dropped_total", "Click events lost (buffer overflow or write error)")
+events_written = metrics_registry.counter("click_events_written_total", "Click events written to the database")
+buffer_size = metrics_registry.gauge("click_buffer_events", "Click events waiting in the buffer")
+
+Event = Tuple[str, datetime, Optional[str], Optional[str], Optional[str]]
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    """Начало минуты, часа или дня, в который попадает moment"""
+    if granularity == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class bucket_floor(FunctionElement):
+    """Начало минуты, часа или дня в SQL (как bucket_start): date_trunc, в SQLite - strftime"""
+    type = DateTime()
+    name = "bucket_floor"
+    inherit_cache = True
+
+    def __init__(self, moment: Any, granularity: str) -> None:
+        super().__init__(moment, literal_column(f"'{granularity}'"))
+
+
+_SQLITE_BUCKET_FORMATS = {"minute": "%Y-%m-%d %H:%M:00", "hour": "%Y-%m-%d %H:00:00", "day": "%Y-%m-%d 00:00:00"}
+
+
+@compiles(bucket_floor)
+def _compile_bucket_floor(element: bucket_floor, compiler: Any, **kw: Any) -> str:
+    moment, granularity = element.clauses.clauses
+    return f"date_trunc({compiler.process(granularity, **kw)}, {compiler.process(moment, **kw)})"
+
+
+@compiles(bucket_floor, "sqlite")
+def _compile_bucket_floor_sqlite(element: bucket_floor, compiler: Any, **kw: Any) -> str:
+    moment, granularity = element.clauses.clauses
+    bucket_format = _SQLITE_BUCKET_FORMATS[granularity.name.strip("'")]
+    return f"strftime('{bucket_format}', {compiler.process(moment, **kw)})"
+
+
+def rollup_of_link(rollup: Any, link: Any) -> ColumnElement:
+    """
+    Условие соединения агрегатов со ссылкой
+
+    Код мог принадлежать удаленной ссылке другого владельца, поэтому
+    учитываются только агрегаты не раньше того, в который попадает создание
+    ссылки (переходы по прежней ссылке в этом же интервале не отделить).
+    """
+    return and_(
+        rollup.short_code == link.short_code,
+        or_(*(
+            and_(rollup.granularity == granularity, rollup.bucket_start >= bucket_floor(link.created_at, granularity))
+            for granularity in GRANULARITIES
+        )),
+    )
+
+
+def event_of_link(event: Any, link: Any) -> ColumnElement:
+    """Условие соединения событий переходов со ссылкой: только переходы после ее создания"""
+    return and_(event.short_code == link.short_code, event.clicked_at >= link.created_at)
+
+
+def user_agent_hash(user_agent: Optional[str]) -> Optional[str]:
+    if not user_agent:
+        return None
+    return hashlib.blake2b(user_agent.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def visitor_hash(client_ip: Optional[str], user_agent: Optional[str]) -> Optional[str]:
+    """Обезличенный идентификатор посетителя: 64-битный хеш IP и user-agent"""
+    if not client_ip and not user_agent:
+        return None
+    return hashlib.blake2b(f"{client_ip or ''}|{user_agent or ''}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+class ClickBuffer:
+    """
+    Кольцевой буфер событий процесса
+
+    Добавление не блокирует запрос: при переполнении вытесняются
+    самые старые события (и учитываются как потерянные).
+    """
+
+    def __init__(self, maxsize: int = CLICK_BUFFER_SIZE) -> None:
+        self._events: Deque[Event] = deque(maxlen=maxsize)
+        self.recorded = 0
+        self.dropped = 0
+
+    def record(
+        self,
+        short_code: str,
+        referrer: Optional[str] = None,
+        user_agent: Optional[str] = None,
+        client_ip: Optional[str] = None,
+    ) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((short_code, datetime.now(), referrer[:512] if referrer else None, user_agent, client_ip))
+        self.recorded += 1
+
+    def drain(self, limit: int) -> List[Event]:
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._events.popleft())
+            except IndexError:
+                break
+        return events
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+buffer = ClickBuffer()
+
+events_recorded.set_function(lambda: buffer.recorded)
+events_dropped.set_function(lambda: buffer.dropped)
+buffer_size.set_function(lambda: len(buffer))
+
+
+def _source_index(short_code: str) -> int:
+    return sharding.shards.index_for(short_code) if sharding.shards.enabled else 0
+
+
+def flush(
+    click_buffer: ClickBuffer = buffer,
+    session_factories: Optional[List[Callable[[], Session]]] = None,
+    source_index: Callable[[str], int] = _source_index,
+    batch_size: int = CLICK_FLUSH_BATCH,
+) -> int:
+    """
+    Запись накопленных событий в click_events пачками
+
+    Returns:
+        Количество записанных событий
+    """
+    factories = session_factories or sharding.session_factories()
+    written = 0
+    while True:
+        events = click_buffer.drain(batch_size)
+        if not events:
+            return written
+        leaderboard.add_clicks(Counter(event[0] for event in events))
+        groups: Dict[int, List[Dict[str, Any]]] = {}
+        for short_code, clicked_at, referrer, user_agent, client_ip in events:
+            groups.setdefault(source_index(short_code), []).append({
+                "short_code": short_code,
+                "clicked_at": clicked_at,
+                "referrer": referrer,
+                "user_agent_hash": user_agent_hash(user_agent),
+                "visitor_hash": visitor_hash(client_ip, user_agent),
+            })
+        for index, rows in groups.items():
+            db = factories[index]()
+            try:
+                db.execute(insert(models.ClickEvent), rows)
+                db.commit()
+                written += len(rows)
+                events_written.inc(len(rows))
+            except Exception as e:
+                db.rollback()
+                click_buffer.dropped += len(rows)
+                logger.error(f"Failed to write {len(rows)} click events: {e}")
+            finally:
+                db.close()
+        if len(events) < batch_size:
+            return written
+
+
+def _committed_prefix(last_event_id: int, events: List[Any], gap_seconds: float = CLICK_ROLLUP_GAP_SECONDS) -> List[Any]:
+    """
+    События, которые можно свернуть, не пропустив ни одного
+
+    Номера событий выдаются до фиксации, а воркеры записывают события
+    одновременно: пропуск в номерах - вставка, которая еще может появиться.
+    Свертка останавливается перед пропуском, пока событие после него не
+    старше gap_seconds (события попадают в таблицу через секунды после
+    перехода); после этого пропуск считается откатом.
+    """
+    cutoff = datetime.now().astimezone() - timedelta(seconds=gap_seconds)
+    for i, event in enumerate(events):
+        if event.id != last_event_id + 1:
+            clicked_at = event.clicked_at
+            if clicked_at is None or (cutoff if clicked_at.tzinfo else cutoff.replace(tzinfo=None)) < clicked_at:
+                return events[:i]
+        last_event_id = event.id
+    return events
+
+
+def rollup(db: Session, batch_size: int = CLICK_ROLLUP_BATCH) -> int:
+    """
+    Свертка новых событий источника в агрегаты
+
+    Returns:
+        Количество учтенных событий
+    """
+    try:
+        cursor = db.query(models.ClickRollupCursor).filter(
+            models.ClickRollupCursor.name == ROLLUP_CURSOR
+        ).with_for_update().first()
+        if cursor is None:
+            cursor = models.ClickRollupCursor(name=ROLLUP_CURSOR, last_event_id=0)
+            db.add(cursor)
+            db.flush()
+
+        events = db.query(
+            models.ClickEvent.id, models.ClickEvent.short_code, models.ClickEvent.clicked_at,
+            models.ClickEvent.visitor_hash
+        ).filter(
+            models.ClickEvent.id > cursor.last_event_id
+        ).order_by(models.ClickEvent.id).limit(batch_size).all()
+        events = _committed_prefix(cursor.last_event_id, events)
+        if not events:
+            db.rollback()
+            return 0
+
+        counts: Counter = Counter()
+        visitors: Dict[Tuple[str, str], Set[int]] = {}
+        for event in events:
+            for granularity in GRANULARITIES:
+                counts[(event.short_code, granularity, bucket_start(event.clicked_at, granularity))] += 1
+            if event.visitor_hash:
+                value = int(event.visitor_hash, 16)
+                visitors.setdefault((event.short_code, event.clicked_at.date().isoformat()), set()).add(value)
+                visitors.setdefault((event.short_code, ALL_TIME), set()).add(value)
+
+        for (short_code, granularity, start), clicks in counts.items():
+            updated = db.query(models.ClickRollup).filter(
+                models.ClickRollup.short_code == short_code,
+                models.ClickRollup.granularity == granularity,
+                models.ClickRollup.bucket_start == start
+            ).update({models.ClickRollup.clicks: models.ClickRollup.clicks + clicks}, synchronize_session=False)
+            if not updated:
+                db.add(models.ClickRollup(
+                    short_code=short_code, granularity=granularity, bucket_start=start, clicks=clicks
+                ))
+        _update_sketches(db, visitors)
+
+        cursor.last_event_id = events[-1].id
+        db.commit()
+    except IntegrityError:
+        # Другой воркер одновременно создал курсор или агрегат, события учтет следующий проход
+        db.rollback()
+        return 0
+    except Exception:
+        db.rollback()
+        raise
+
+    try:
+        owner_stats.refresh_for_codes(db, {event.short_code for event in events})
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to refresh owner summaries: {e}")
+    return len(events)
+
+
+def _update_sketches(db: Session, visitors: Dict[Tuple[str, str], Set[int]]) -> None:
+    """Добавление хешей посетителей в скетчи (короткий код, период), недостающие скетчи создаются"""
+    codes = sorted({short_code for short_code, _ in visitors})
+    sketches: Dict[Tuple[str, str], models.VisitorSketch] = {}
+    for i in range(0, len(codes), 500):
+        for sketch in db.query(models.VisitorSketch).filter(
+            models.VisitorSketch.short_code.in_(codes[i:i + 500]),
+            models.VisitorSketch.period.in_({period for _, period in visitors})
+        ):
+            sketches[(sketch.short_code, sketch.period)] = sketch
+
+    for (short_code, period), hashes in visitors.items():
+        sketch = sketches.get((short_code, period))
+        estimator = hll.HyperLogLog.from_bytes(sketch.registers) if sketch else hll.HyperLogLog()
+        estimator.update(hashes)
+        if sketch:
+            sketch.registers = estimator.to_bytes()
+        else:
+            db.add(models.VisitorSketch(short_code=short_code, period=period, registers=estimator.to_bytes()))
+
+
+def unique_visitors(db: Session, short_code: str, start: Optional[date] = None, end: Optional[date] = None) -> int:
+    """
+    Оценка числа уникальных посетителей ссылки
+
+    Без start и end - за все время, иначе объединение дневных скетчей
+    за дни от start до end включительно.
+
+    Returns:
+        Оценка (относительная стандартная ошибка hll.relative_error())
+    """
+    query = db.query(models.VisitorSketch.registers).filter(models.VisitorSketch.short_code == short_code)
+    if start is None and end is None:
+        query = query.filter(models.VisitorSketch.period == ALL_TIME)
+    else:
+        query = query.filter(models.VisitorSketch.period != ALL_TIME)
+        if start is not None:
+            query = query.filter(models.VisitorSketch.period >= start.isoformat())
+        if end is not None:
+            query = query.filter(models.VisitorSketch.period <= end.isoformat())
+
+    estimator = hll.HyperLogLog()
+    for row in query:
+        estimator.merge(hll.HyperLogLog.from_bytes(row.registers))
+    return estimator.count()
+
+
+def top_links(db: Session, since: datetime, n: int) -> List[Tuple[str, int]]:
+    """
+    Самые популярные ссылки источника с момента since по минутным агрегатам
+
+    Используется, когда рейтинг в Redis (app.leaderboard) недоступен.
+
+    Returns:
+        Список (короткий код, число переходов) по убыванию
+    """
+    total = func.sum(models.ClickRollup.clicks)
+    rows = db.query(models.ClickRollup.short_code, total.label("clicks")).filter(
+        models.ClickRollup.granularity == "minute",
+        models.ClickRollup.bucket_start >= bucket_start(since, "minute")
+    ).group_by(models.ClickRollup.short_code).order_by(total.desc()).limit(n).all()
+    return [(row.short_code, int(row.clicks)) for row in rows]
+
+
+def prune(db: Session, retention_days: int = CLICK_EVENT_RETENTION_DAYS) -> int:
+    """Удаление старых событий и минутных агрегатов; часовые и дневные остаются"""
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    deleted = db.query(models.ClickEvent).filter(models.ClickEvent.clicked_at < cutoff).delete(
+        synchronize_session=False
+    )
+    deleted += db.query(models.ClickRollup).filter(
+        models.ClickRollup.granularity == "minute",
+        models.ClickRollup.bucket_start < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def timeseries(db: Session, short_code: str, granularity: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """
+    Число переходов по интервалам от start до end, пустые интервалы с нулем
+
+    Returns:
+        Список {"bucket": начало интервала, "clicks": число переходов}
+    """
+    first = bucket_start(start, granularity)
+    rows = db.query(models.ClickRollup.bucket_start, models.ClickRollup.clicks).filter(
+        models.ClickRollup.short_code == short_code,
+        models.ClickRollup.granularity == granularity,
+        models.ClickRollup.bucket_start >= first,
+        models.ClickRollup.bucket_start <= end
+    ).all()
+    clicks = {row.bucket_start.replace(tzinfo=None): row.clicks for row in rows}
+
+    points = []
+    moment = first
+    while moment <= end:
+        points.append({"bucket": moment, "clicks": clicks.get(moment, 0)})
+        moment = bucket_start(moment + timedelta(seconds=BUCKET_SECONDS[granularity]), granularity)
+    return points
+
+
+class ClickPipeline:
+    """Фоновая запись событий из буфера, свертка в агрегаты и удаление старых данных"""
+
+    def __init__(
+        self,
+        flush_interval: float = CLICK_FLUSH_SECONDS,
+        rollup_interval: float = CLICK_ROLLUP_SECONDS,
+        prune_interval: float = 3600.0,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.prune_interval = prune_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _each_source(self, fn: Callable[[Session], int]) -> int:
+        total = 0
+        for factory in sharding.session_factories():
+            db = factory()
+            try:
+                total += fn(db)
+            finally:
+                db.close()
+        return total
+
+    def run(self) -> None:
+        next_rollup = time.monotonic() + self.rollup_interval
+        next_prune = time.monotonic() + self.prune_interval
+        while not self._stop.wait(self.flush_interval):
+            try:
+                flush()
+                leaderboard.rotate()
+                if time.monotonic() >= next_rollup:
+                    next_rollup = time.monotonic() + self.rollup_interval
+                    self._each_source(rollup)
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + self.prune_interval
+                    self._each_source(prune)
+            except Exception as e:
+                logger.error(f"Click pipeline failed: {e}")
+        flush()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="click-pipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
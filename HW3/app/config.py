@@ -5,6 +5,7 @@ from typing import Optional
 SECRET_KEY = os.getenv("SECRET_KEY", "YOUR_SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+ADMIN_USERNAMES = [name for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name]
 
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
@@ -26,3 +27,25 @@ elif DATABASE_URL_FROM_ENV:
     DATABASE_URL = DATABASE_URL_FROM_ENV
 else:
     DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+
+REPLICA_DATABASE_URLS = [url for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url]
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "10"))
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+SHARD_DATABASE_URLS = [url for url in os.getenv("SHARD_DATABASE_URLS", "").split(",") if url]
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "t")
+DB_POOL_USE_LIFO = os.getenv("DB_POOL_USE_LIFO", "True").lower() in ("true", "1", "t")
+# Совместимость с PgBouncer в режиме transaction: без подготовленных выражений на сервере
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "False").lower() in ("true", "1", "t")
+
+# Создание таблиц при запуске воркера; по умолчанию схема создается командой python -m app.migrate
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "False").lower() in ("true", "1", "t")
+
+# Общая для воркеров хеш-таблица популярных ссылок в файле, отображенном в память (пусто - выключена)
+SHARED_TABLE_PATH = os.getenv("SHARED_TABLE_PATH", "")
+SHARED_TABLE_MAX_LINKS = int(os.getenv("SHARED_TABLE_MAX_LINKS", "100000"))
+SHARED_TABLE_REFRESH_SECONDS = float(os.getenv("SHARED_TABLE_REFRESH_SECONDS", "30"))
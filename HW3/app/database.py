@@ -1,15 +1,157 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
-from typing import Generator
-from .config import DATABASE_URL, TESTING
+from sqlalchemy.pool import QueuePool
+from fastapi import Depends, Request, Response
+from typing import Any, Callable, Dict, Generator, List, Optional
+from .config import (
+    DATABASE_URL, TESTING, REPLICA_DATABASE_URLS, REPLICA_RETRY_SECONDS, READ_YOUR_WRITES_SECONDS,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_POOL_USE_LIFO,
+    DB_PGBOUNCER
+)
+from .metrics import registry
+import itertools
+import logging
+import threading
+import time
 
-if TESTING:
-    engine = create_engine(
-        DATABASE_URL, 
-        connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_engine(DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+PRIMARY_READ_HEADER = "X-Read-Primary"
+PRIMARY_READ_COOKIE = "read_primary"
+
+# INSERT ... ON CONFLICT по диалектам
+_CONFLICT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+pool_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled database connection"
+)
+pool_timeouts = registry.counter("db_pool_timeouts_total", "Connection checkouts that hit pool_timeout")
+pool_checked_out = registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool")
+pool_overflow = registry.gauge("db_pool_overflow", "Connections open above pool_size")
+pool_size = registry.gauge("db_pool_size", "Configured pool size")
+
+
+class PoolTelemetry:
+    """Счетчики пула соединений одного движка"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.labels = {"engine": name}
+        self.checkouts = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.timeouts = 0
+        self.wait_max = 0.0
+        self._lock = threading.Lock()
+
+    def on_checkout(self, *args: Any) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def on_checkin(self, *args: Any) -> None:
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def record_wait(self, seconds: float) -> None:
+        pool_wait_seconds.observe(seconds, self.labels)
+        with self._lock:
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_timeout(self) -> None:
+        pool_timeouts.inc(labels=self.labels)
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        waits = pool_wait_seconds.count(self.labels)
+        return {
+            "checkouts": self.checkouts,
+            "checked_out": self.checked_out,
+            "max_checked_out": self.max_checked_out,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(pool_wait_seconds.sum(self.labels) / waits * 1000, 3) if waits else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который измеряет ожидание свободного соединения"""
+
+    telemetry: Optional[PoolTelemetry] = None
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.telemetry:
+                self.telemetry.record_timeout()
+            raise
+        finally:
+            if self.telemetry:
+                self.telemetry.record_wait(time.perf_counter() - started)
+
+    def recreate(self) -> QueuePool:
+        pool = super().recreate()
+        pool.telemetry = self.telemetry
+        return pool
+
+
+pool_telemetry: Dict[str, PoolTelemetry] = {}
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    Параметры create_engine для URL: настройки пула из config.py
+
+    SQLite использует собственные пулы SQLAlchemy без настроек размера.
+    В режиме PgBouncer отключаются подготовленные выражения драйвера
+    (psycopg2 их не использует, для psycopg 3 задается prepare_threshold).
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False}} if TESTING else {}
+
+    options: Dict[str, Any] = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_use_lifo": DB_POOL_USE_LIFO,
+    }
+    if DB_PGBOUNCER and parsed.get_driver_name() == "psycopg":
+        options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+
+def instrument_engine(engine: Engine, name: str) -> PoolTelemetry:
+    """Подключение счетчиков пула и метрик к движку"""
+    telemetry = PoolTelemetry(name)
+    event.listen(engine, "checkout", telemetry.on_checkout)
+    event.listen(engine, "checkin", telemetry.on_checkin)
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.telemetry = telemetry
+    for gauge, method in ((pool_checked_out, "checkedout"), (pool_overflow, "overflow"), (pool_size, "size")):
+        if callable(getattr(engine.pool, method, None)):
+            gauge.set_function(lambda method=method: getattr(engine.pool, method)(), telemetry.labels)
+    pool_telemetry[name] = telemetry
+    return telemetry
+
+
+def create_instrumented_engine(url: str, name: str) -> Engine:
+    new_engine = create_engine(url, **engine_options(url))
+    instrument_engine(new_engine, name)
+    return new_engine
+
+
+engine = create_instrumented_engine(DATABASE_URL, "primary")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -20,3 +162,106 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+class ReplicaRouter:
+    """
+    Выбор реплики для чтения
+
+    Реплики выбираются по кругу среди доступных. Реплика, на которой
+    произошла ошибка подключения, исключается на retry_seconds;
+    если доступных реплик нет, чтение идет с основной БД.
+    """
+
+    def __init__(self, primary: Engine, replicas: List[Engine], retry_seconds: float = REPLICA_RETRY_SECONDS) -> None:
+        self.primary = primary
+        self.replicas = replicas
+        self.retry_seconds = retry_seconds
+        self._counter = itertools.count()
+        self._unhealthy_until: Dict[Engine, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def choose(self) -> Engine:
+        now = time.monotonic()
+        with self._lock:
+            healthy = [r for r in self.replicas if self._unhealthy_until.get(r, 0) <= now]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._counter) % len(healthy)]
+
+    def mark_unhealthy(self, replica: Engine) -> None:
+        if replica is self.primary:
+            return
+        logger.warning(f"Replica {replica.url.host} marked unhealthy for {self.retry_seconds}s")
+        with self._lock:
+            self._unhealthy_until[replica] = time.monotonic() + self.retry_seconds
+
+    def probe(self) -> List[Dict[str, Any]]:
+        """Проверка реплик: доступные возвращаются в ротацию"""
+        result = []
+        for replica in self.replicas:
+            started = time.perf_counter()
+            try:
+                with replica.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                with self._lock:
+                    self._unhealthy_until.pop(replica, None)
+                result.append({"host": replica.url.host, "status": "healthy",
+                               "latency_ms": round((time.perf_counter() - started) * 1000, 3)})
+            except Exception as e:
+                self.mark_unhealthy(replica)
+                result.append({"host": replica.url.host, "status": "unhealthy", "error": str(e)})
+        return result
+
+
+read_router = ReplicaRouter(engine, [
+    create_instrumented_engine(url, f"replica{i}") for i, url in enumerate(REPLICA_DATABASE_URLS)
+])
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def wants_primary(request: Request) -> bool:
+    """Запрос просит читать с основной БД (заголовок или cookie после записи)"""
+    return request.headers.get(PRIMARY_READ_HEADER, "").lower() in ("1", "true") or \
+        PRIMARY_READ_COOKIE in request.cookies
+
+
+def mark_primary_reads(response: Response) -> None:
+    """Чтение своих записей: следующие READ_YOUR_WRITES_SECONDS секунд клиент читает с основной БД"""
+    if read_router.enabled:
+        response.set_cookie(PRIMARY_READ_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True)
+
+
+def is_replica(db: Session) -> bool:
+    return db.info.get("replica", False)
+
+
+def conflict_insert(db: Session) -> Optional[Callable[..., Any]]:
+    """Конструктор INSERT ... ON CONFLICT для СУБД сессии или None, если СУБД его не поддерживает"""
+    return _CONFLICT_INSERTS.get(db.get_bind().dialect.name)
+
+
+def get_read_db(request: Request, db: Session = Depends(get_db)) -> Generator[Session, None, None]:
+    """
+    Сессия для чтения: реплика, если они настроены
+
+    Без реплик и при запросе чтения с основной БД возвращается сессия get_db.
+    """
+    if not read_router.enabled or wants_primary(request):
+        yield db
+        return
+
+    replica = read_router.choose()
+    read_db = ReadSessionLocal(bind=replica, info={"replica": replica is not engine})
+    try:
+        yield read_db
+    except DBAPIError as e:
+        if e.connection_invalidated or isinstance(e.orig, (ConnectionError, OSError)):
+            read_router.mark_unhealthy(replica)
+        raise
+    finally:
+        read_db.close()
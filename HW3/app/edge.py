@@ -0,0 +1,160 @@
+"""
+Узел, который только перенаправляет
+
+Не подключается ни к PostgreSQL, ни к Redis: ссылки загружаются в память
+из последнего снимка и его дельт (см. app.snapshot), каталог снимков
+периодически проверяется, новые дельты применяются к загруженным ссылкам,
+новый полный снимок загружается целиком и подменяет их. Клики на таком
+узле не учитываются.
+
+Пример запуска:
+    EDGE_SNAPSHOT_DIR=/var/lib/edge python -m app.server --app app.edge:app
+"""
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from .metrics import registry as metrics_registry
+from .snapshot import SnapshotFile, latest_files
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EDGE_SNAPSHOT_DIR = os.getenv("EDGE_SNAPSHOT_DIR", "snapshots")
+EDGE_RELOAD_SECONDS = float(os.getenv("EDGE_RELOAD_SECONDS", "10"))
+
+edge_links = metrics_registry.gauge("edge_links", "Links loaded on the redirect-only node")
+edge_reloads = metrics_registry.counter("edge_reloads_total", "Snapshot and delta loads by kind")
+
+
+class EdgeStore:
+    """
+    Ссылки узла в памяти: short_code -> (URL, срок действия)
+
+    Полный снимок загружается в новый словарь, который затем подменяет
+    текущий; дельты применяются к текущему словарю на месте.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.links: Dict[str, Tuple[str, Optional[float]]] = {}
+        self.snapshot: Optional[str] = None
+        self.deltas: List[str] = []
+        self.loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _apply(self, links: Dict[str, Tuple[str, Optional[float]]], name: str) -> int:
+        count = 0
+        for record in SnapshotFile(os.path.join(self.directory, name)):
+            if record.original_url is None:
+                links.pop(record.short_code, None)
+            else:
+                links[record.short_code] = (record.original_url, record.expires_at)
+            count += 1
+        return count
+
+    def reload(self) -> bool:
+        """
+        Загрузка нового снимка или новых дельт
+
+        Returns:
+            True, если набор ссылок изменился
+        """
+        snapshot, deltas = latest_files(self.directory)
+        if snapshot is None:
+            return False
+        with self._lock:
+            if snapshot == self.snapshot and deltas == self.deltas:
+                return False
+            try:
+                if snapshot != self.snapshot or deltas[:len(self.deltas)] != self.deltas:
+                    links: Dict[str, Tuple[str, Optional[float]]] = {}
+                    self._apply(links, snapshot)
+                    for name in deltas:
+                        self._apply(links, name)
+                    self.links = links
+                    edge_reloads.inc(labels={"kind": "snapshot"})
+                else:
+                    for name in deltas[len(self.deltas):]:
+                        self._apply(self.links, name)
+                        edge_reloads.inc(labels={"kind": "delta"})
+            except (OSError, ValueError) as e:
+                # Файл мог быть подменен или удален во время чтения, повтор на следующей проверке
+                logger.error(f"Failed to load snapshot from {self.directory}: {e}")
+                return False
+            self.snapshot, self.deltas = snapshot, deltas
+            self.loaded_at = time.time()
+        edge_links.set(len(self.links))
+        logger.info(f"Loaded {snapshot} with {len(deltas)} deltas: {len(self.links)} links")
+        return True
+
+    def get(self, short_code: str) -> Optional[Tuple[str, Optional[float]]]:
+        return self.links.get(short_code)
+
+    def snapshot_info(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "snapshot": self.snapshot,
+            "deltas": len(self.deltas),
+            "links": len(self.links),
+            "loaded_at": self.loaded_at,
+        }
+
+
+store = EdgeStore(EDGE_SNAPSHOT_DIR)
+
+
+def _watch(stop: threading.Event, interval: float) -> None:
+    while not stop.wait(interval):
+        try:
+            store.reload()
+        except Exception as e:
+            logger.error(f"Snapshot reload failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    store.reload()
+    stop = threading.Event()
+    watcher = threading.Thread(target=_watch, args=(stop, EDGE_RELOAD_SECONDS), name="edge-reload", daemon=True)
+    watcher.start()
+    yield
+    stop.set()
+
+
+app = FastAPI(title="URL Shortener edge", lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+
+@app.get("/healthz")
+def health_check() -> JSONResponse:
+    """Состояние узла: без загруженного снимка узел не готов"""
+    info = store.snapshot_info()
+    return JSONResponse(status_code=200 if info["snapshot"] else 503, content=info)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(metrics_registry.render())
+
+
+@app.get("/{short_code}", response_class=RedirectResponse, status_code=307)
+def redirect_to_url(short_code: str) -> str:
+    """
+    Перенаправление по ссылке из загруженного снимка
+
+    Args:
+        short_code: Короткий код ссылки
+
+    Returns:
+        Оригинальный URL для перенаправления
+    """
+    link = store.get(short_code)
+    if link is None:
+        raise HTTPException(status_code=404, detail="Link not found")
+    original_url, expires_at = link
+    if expires_at is not None and expires_at < time.time():
+        raise HTTPException(status_code=404, detail="Link has expired")
+    return original_url
@@ -0,0 +1,227 @@
+"""
+Потоковая выгрузка данных пользователя: ссылки, архив, агрегаты и события переходов
+
+Строки читаются курсором на стороне сервера (yield_per) пачками
+по EXPORT_BATCH_SIZE с каждого источника по очереди. Каждая пачка
+сериализуется в CSV или NDJSON, сжимается gzip на лету и сразу
+отдается клиенту, поэтому память не зависит от числа строк.
+Parquet (нужен pyarrow) пишется группами строк по пачке и сжимается
+zstd внутри файла.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import clicks, models
+from .metrics import registry as metrics_registry
+import csv
+import io
+import json
+import logging
+import os
+import zlib
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+export_rows = metrics_registry.counter("export_rows_total", "Rows streamed by data exports by dataset")
+
+
+class Column(NamedTuple):
+    name: str
+    kind: str  # str, int, bool или datetime
+
+
+DATASETS: Dict[str, Tuple[Column, ...]] = {
+    "links": (
+        Column("short_code", "str"), Column("original_url", "str"), Column("custom_alias", "str"),
+        Column("clicks", "int"), Column("created_at", "datetime"), Column("last_used", "datetime"),
+        Column("expires_at", "datetime"), Column("is_active", "bool"),
+    ),
+    "expired_links": (
+        Column("short_code", "str"), Column("original_url", "str"), Column("created_at", "datetime"),
+        Column("expired_at", "datetime"), Column("total_clicks", "int"),
+    ),
+    "click_rollups": (
+        Column("short_code", "str"), Column("granularity", "str"), Column("bucket_start", "datetime"),
+        Column("clicks", "int"),
+    ),
+    "click_events": (
+        Column("short_code", "str"), Column("clicked_at", "datetime"), Column("referrer", "str"),
+    ),
+}
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _statement(dataset: str, owner_id: int) -> Any:
+    """Запрос строк набора данных владельца в порядке колонок DATASETS"""
+    if dataset == "links":
+        table = models.Link
+        return select(*(getattr(table, column.name) for column in DATASETS[dataset])).where(
+            table.owner_id == owner_id
+        ).order_by(table.id)
+    if dataset == "expired_links":
+        table = models.ExpiredLink
+        return select(*(getattr(table, column.name) for column in DATASETS[dataset])).where(
+            table.owner_id == owner_id
+        ).order_by(table.id)
+    if dataset == "click_rollups":
+        table, condition = models.ClickRollup, clicks.rollup_of_link(models.ClickRollup, models.Link)
+    else:
+        table, condition = models.ClickEvent, clicks.event_of_link(models.ClickEvent, models.Link)
+    # История прежней ссылки с тем же кодом другого владельца не выгружается
+    return select(*(getattr(table, column.name) for column in DATASETS[dataset])).join(
+        models.Link, condition
+    ).where(models.Link.owner_id == owner_id).order_by(table.id)
+
+
+def batches(
+    dataset: str,
+    owner_id: int,
+    sessions: Iterable[Session],
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[Sequence[Any]]:
+    """
+    Пачки строк набора данных со всех источников по очереди
+
+    Args:
+        sessions: Сессии источников (ShardSessions.each_source), следующая
+            запрашивается, когда строки предыдущей прочитаны
+    """
+    for db in sessions:
+        result = db.execute(_statement(dataset, owner_id).execution_options(yield_per=batch_size))
+        try:
+            for partition in result.partitions():
+                export_rows.inc(len(partition), labels={"dataset": dataset})
+                yield partition
+        finally:
+            # Выгрузка могла быть прервана (клиент отключился): курсор закрывается сразу
+            result.close()
+
+
+def _text(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def csv_chunks(columns: Sequence[Column], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in columns])
+    for batch in rows:
+        writer.writerows([_text(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(columns: Sequence[Column], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    names = [column.name for column in columns]
+    for batch in rows:
+        lines = [json.dumps(dict(zip(names, map(_text, row))), ensure_ascii=False) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Файл для записи, содержимое которого забирается частями по мере записи"""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Наивные значения - местное время приложения (datetime.now())
+    return value.astimezone(timezone.utc) if value is not None else None
+
+
+def parquet_chunks(columns: Sequence[Column], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"str": pa.string(), "int": pa.int64(), "bool": pa.bool_(), "datetime": pa.timestamp("us", tz="UTC")}
+    schema = pa.schema([(column.name, types[column.kind]) for column in columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for batch in rows:
+            data = {
+                column.name: [_utc(row[i]) if column.kind == "datetime" else row[i] for row in batch]
+                for i, column in enumerate(columns)
+            }
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Сжатие потока в формат gzip без накопления всего вывода"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(
+    dataset: str,
+    owner_id: int,
+    output_format: str,
+    compress: bool,
+    sessions: Iterable[Session],
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Поток байтов выгрузки
+
+    Args:
+        dataset: Набор данных из DATASETS
+        owner_id: Владелец ссылок
+        output_format: csv, ndjson или parquet
+        compress: Сжимать gzip (для parquet не применяется)
+        sessions: Сессии источников
+
+    Returns:
+        Итератор частей ответа
+    """
+    columns = DATASETS[dataset]
+    rows = batches(dataset, owner_id, sessions, batch_size)
+    if output_format == "parquet":
+        return parquet_chunks(columns, rows)
+    chunks = csv_chunks(columns, rows) if output_format == "csv" else ndjson_chunks(columns, rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def file_name(dataset: str, output_format: str, compress: bool) -> str:
+    name = f"{dataset}.{output_format}"
+    return f"{name}.gz" if compress and output_format != "parquet" else name
+
+
+def media_type(output_format: str, compress: bool) -> str:
+    return "application/gzip" if compress and output_format != "parquet" else FORMATS[output_format]
@@ -0,0 +1,289 @@
+"""
+Групповая фиксация создания ссылок
+
+При GROUP_COMMIT_ENABLED запросы создания ссылок не фиксируют каждый свою
+транзакцию: вставка ставится в очередь источника (шарда) и ожидает
+результат через Future. Поток источника собирает очередь в пачку, пока
+первый запрос ждет не дольше GROUP_COMMIT_MAX_DELAY_MS или пока в пачке
+меньше GROUP_COMMIT_MAX_BATCH вставок, и записывает ее одним многострочным
+INSERT ... ON CONFLICT DO NOTHING RETURNING и одной фиксацией: на нагрузке
+запись журнала транзакций (WAL) на диск делится между запросами пачки.
+
+Каждый запрос получает свою строку или None, если код занят (в том числе
+другим запросом той же пачки). Размеры пачек - в метрике
+group_commit_batch_size.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import changes, database, models, sharding
+from .metrics import registry as metrics_registry
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_ENABLED = os.getenv("GROUP_COMMIT_ENABLED", "False").lower() in ("true", "1", "t")
+GROUP_COMMIT_MAX_DELAY_MS = float(os.getenv("GROUP_COMMIT_MAX_DELAY_MS", "2"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "100"))
+# Сколько запрос ждет результата пачки, прежде чем вернуть ошибку
+GROUP_COMMIT_TIMEOUT = float(os.getenv("GROUP_COMMIT_TIMEOUT", "5"))
+
+batch_sizes = metrics_registry.histogram(
+    "group_commit_batch_size", "Link inserts committed together by group commit",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+wait_seconds = metrics_registry.histogram(
+    "group_commit_wait_seconds", "Time a link insert waited for its group commit"
+)
+
+_COLUMNS = ("short_code", "original_url", "custom_alias", "expires_at", "owner_id")
+
+
+class GroupCommitTimeout(Exception):
+    """
+    Результат пачки не получен за GROUP_COMMIT_TIMEOUT
+
+    Args:
+        may_have_committed: Вставка уже попала в записываемую пачку и может
+            быть зафиксирована после ответа; иначе она снята с очереди
+    """
+
+    def __init__(self, may_have_committed: bool) -> None:
+        super().__init__("group commit timed out")
+        self.may_have_committed = may_have_committed
+
+
+class _Insert(NamedTuple):
+    values: Dict[str, Any]
+    future: Future
+    enqueued: float
+
+
+def insert_links(db: Session, rows: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Вставка пачки ссылок одним INSERT ... ON CONFLICT DO NOTHING RETURNING (фиксирует вызывающий)
+
+    Args:
+        db: Сессия источника
+        rows: Значения колонок _COLUMNS; коды в пачке не повторяются
+
+    Returns:
+        Вставленные строки (id, short_code, original_url, created_at) по коротким кодам
+    """
+    table = models.Link.__table__
+    values = [dict({column: row.get(column) for column in _COLUMNS}, clicks=0, is_active=True) for row in rows]
+    conflict_insert = database.conflict_insert(db)
+    if conflict_insert is None:
+        # Остальные СУБД: по строке в точке сохранения, конфликт - IntegrityError
+        inserted = {}
+        for row in values:
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert().values(**row))
+            except IntegrityError:
+                continue
+            inserted[row["short_code"]] = db.execute(
+                table.select().with_only_columns(table.c.id, table.c.short_code, table.c.original_url, table.c.created_at)
+                .where(table.c.short_code == row["short_code"])
+            ).one()
+    else:
+        inserted = {
+            row.short_code: row for row in db.execute(
+                conflict_insert(table).values(values).on_conflict_do_nothing(
+                    index_elements=[table.c.short_code]
+                ).returning(table.c.id, table.c.short_code, table.c.original_url, table.c.created_at)
+            )
+        }
+    owners = {row["short_code"]: row["owner_id"] for row in values}
+    for short_code in inserted:
+        changes.record(db, short_code, changes.CREATE, owners[short_code])
+    return inserted
+
+
+class CommitGroup:
+    """
+    Очередь вставок одного источника и поток, фиксирующий их пачками
+
+    Args:
+        session_factory: Фабрика сессий источника
+        max_delay: Сколько первая вставка пачки ждет остальные, в секундах
+        max_batch: Наибольший размер пачки
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_delay: float = GROUP_COMMIT_MAX_DELAY_MS / 1000,
+                 max_batch: int = GROUP_COMMIT_MAX_BATCH, name: str = "group-commit") -> None:
+        self.session_factory = session_factory
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.name = name
+        self._queue: List[_Insert] = []
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, values: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError("group commit is stopped")
+            self._queue.append(_Insert(values, future, time.monotonic()))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def _next_batch(self) -> List[_Insert]:
+        with self._cond:
+            while not self._queue and not self._stop:
+                self._cond.wait()
+            if self._queue:
+                deadline = self._queue[0].enqueued + self.max_delay
+                while len(self._queue) < self.max_batch and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch, self._queue = self._queue[:self.max_batch], self._queue[self.max_batch:]
+            return batch
+
+    def run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            try:
+                self.flush(batch)
+            except Exception as e:
+                # Поток не должен останавливаться: запросы пачки получают ошибку, следующие пачки пишутся
+                logger.error(f"Group commit flush failed: {str(e)}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+    def flush(self, batch: Sequence[_Insert]) -> None:
+        """Запись пачки одной транзакцией и передача результатов ожидающим запросам"""
+        requests: Dict[str, _Insert] = {}
+        for request in batch:
+            if not request.future.set_running_or_notify_cancel():
+                # Запрос не дождался пачки и снял вставку
+                continue
+            short_code = request.values["short_code"]
+            if short_code in requests:
+                # Код уже занят запросом той же пачки
+                request.future.set_result(None)
+            else:
+                requests[short_code] = request
+        if not requests:
+            return
+        batch_sizes.observe(len(requests))
+
+        db: Optional[Session] = None
+        try:
+            db = self.session_factory()
+            inserted = insert_links(db, [request.values for request in requests.values()])
+            db.commit()
+        except Exception as e:
+            logger.error(f"Group commit of {len(requests)} links failed: {str(e)}")
+            for request in requests.values():
+                request.future.set_exception(e)
+            if db is not None:
+                try:
+                    db.rollback()
+                except Exception as rollback_error:
+                    logger.error(f"Group commit rollback failed: {str(rollback_error)}")
+            return
+        finally:
+            if db is not None:
+                try:
+                    db.close()
+                except Exception as close_error:
+                    logger.error(f"Closing group commit session failed: {str(close_error)}")
+
+        now = time.monotonic()
+        for short_code, request in requests.items():
+            wait_seconds.observe(now - request.enqueued)
+            request.future.set_result(inserted.get(short_code))
+
+    def stop(self, timeout: float = 10) -> None:
+        """Остановка потока после записи уже поставленных вставок"""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+
+class GroupCommitter:
+    """
+    Групповая фиксация по источникам: у каждого шарда своя очередь и свой поток
+
+    Args:
+        session_factories: Фабрики сессий шардов ссылок или основной БД
+        source_index: Номер источника для короткого кода
+    """
+
+    def __init__(
+        self,
+        session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+        source_index: Optional[Callable[[str], int]] = None,
+        max_delay: float = GROUP_COMMIT_MAX_DELAY_MS / 1000,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+    ) -> None:
+        self._session_factories = session_factories
+        self._source_index = source_index
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self._groups: Dict[int, CommitGroup] = {}
+        self._lock = threading.Lock()
+
+    def _group(self, short_code: str) -> CommitGroup:
+        if self._session_factories is None:
+            self._session_factories = sharding.session_factories()
+        if self._source_index is None:
+            from .clicks import _source_index
+            self._source_index = _source_index
+        index = self._source_index(short_code)
+        with self._lock:
+            if index not in self._groups:
+                self._groups[index] = CommitGroup(
+                    self._session_factories[index], self.max_delay, self.max_batch, name=f"group-commit-{index}"
+                )
+            return self._groups[index]
+
+    def create_link(self, timeout: Optional[float] = None, **values: Any) -> Optional[Any]:
+        """
+        Создание ссылки в ближайшей групповой фиксации
+
+        Returns:
+            Строка (id, short_code, original_url, created_at) или None, если код занят
+
+        Raises:
+            GroupCommitTimeout: результат не получен за timeout секунд
+                (по умолчанию GROUP_COMMIT_TIMEOUT); вставка, еще ждущая
+                в очереди, снимается, а уже записываемая может быть
+                зафиксирована позже
+        """
+        future = self._group(values["short_code"]).submit(values)
+        try:
+            return future.result(GROUP_COMMIT_TIMEOUT if timeout is None else timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise GroupCommitTimeout(may_have_committed=False)
+            if future.done():
+                return future.result()
+            raise GroupCommitTimeout(may_have_committed=True)
+
+    def stop(self) -> None:
+        with self._lock:
+            groups = list(self._groups.values())
+            self._groups.clear()
+        for group in groups:
+            group.stop()
+
+
+committer = GroupCommitter()
@@ -0,0 +1,285 @@
+from bisect import bisect
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+from .circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Служебные префиксы ключа: блокировка, устаревшая копия и время загрузки
+# хранятся на том же узле, что и сам ключ
+ROUTING_PREFIXES = ("lock:", "stale:", "delta:")
+
+# Ключи кэша, которые узел удаляет, вернувшись после недоступности: в это
+# время их изменения и удаления уходили на следующий узел кольца.
+# Блокировки и ответы идемпотентности не трогаются
+PURGE_PATTERNS = ("link:*", "stats:*", "owner_stats:*", "stale:*", "delta:*")
+PURGE_BATCH = 500
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+def routing_key(key: str) -> str:
+    """Ключ, по которому выбирается узел (без служебных префиксов)"""
+    stripped = True
+    while stripped:
+        stripped = False
+        for prefix in ROUTING_PREFIXES:
+            if key.startswith(prefix):
+                key = key[len(prefix):]
+                stripped = True
+    return key
+
+
+def purge_node(node_client: Any, patterns: Sequence[str] = PURGE_PATTERNS, batch_size: int = PURGE_BATCH) -> int:
+    """
+    Удаление ключей кэша с узла (SCAN и DEL пачками)
+
+    Returns:
+        Количество удаленных ключей
+    """
+    deleted = 0
+    batch: List[Any] = []
+    for pattern in patterns:
+        for key in node_client.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += node_client.delete(*batch)
+                batch = []
+    if batch:
+        deleted += node_client.delete(*batch)
+    return deleted
+
+
+class HashRing:
+    """
+    Кольцо согласованного хеширования с виртуальными узлами
+
+    Каждый узел занимает vnodes точек на кольце. Ключ принадлежит первому
+    узлу по часовой стрелке, поэтому добавление или отказ узла
+    перераспределяет только его долю ключей.
+    """
+
+    def __init__(self, nodes: Sequence[str], vnodes: int = 160) -> None:
+        self.nodes = list(nodes)
+        self.vnodes = vnodes
+        points = sorted(
+            (_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def preference_list(self, key: str) -> Iterator[str]:
+        """Узлы в порядке обхода кольца от позиции ключа, без повторов"""
+        if not self._hashes:
+            return
+        start = bisect(self._hashes, _hash(routing_key(key))) % len(self._hashes)
+        seen = set()
+        for i in range(len(self._hashes)):
+            node = self._owners[(start + i) % len(self._hashes)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def node_for(self, key: str) -> str:
+        return next(self.preference_list(key))
+
+
+class _RingPipeline:
+    """Конвейер, который группирует команды по узлам кольца"""
+
+    def __init__(self, client: "RingRedis") -> None:
+        self.client = client
+        self._commands: List[Tuple[str, str, tuple, dict]] = []
+
+    def __getattr__(self, name: str) -> Callable[..., "_RingPipeline"]:
+        def queue(key: str, *args: Any, **kwargs: Any) -> "_RingPipeline":
+            self._commands.append((name, key, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> List[Any]:
+        """
+        Выполнение по одному конвейеру на узел
+
+        Команды узла, на котором произошла ошибка, повторяются
+        на следующих узлах кольца.
+        """
+        results: List[Any] = [None] * len(self._commands)
+        pending = list(range(len(self._commands)))
+        excluded: Set[str] = set()
+        error: Optional[Exception] = None
+        while pending:
+            groups: Dict[str, List[int]] = {}
+            for index in pending:
+                node = self.client._first_available(self._commands[index][1], excluded)
+                if node is None:
+                    raise error or ConnectionError("No Redis nodes available")
+                groups.setdefault(node, []).append(index)
+
+            pending = []
+            for node, indexes in groups.items():
+                try:
+                    values = self.client.breakers[node].call(self._run, self.client.clients[node], indexes)
+                except Exception as e:
+                    if not isinstance(e, CircuitOpenError):
+                        logger.warning(f"Redis node {node} failed, trying next node: {e}")
+                    self.client._missed.add(node)
+                    excluded.add(node)
+                    pending.extend(indexes)
+                    error = e
+                    continue
+                for index, value in zip(indexes, values):
+                    results[index] = value
+        self._commands = []
+        return results
+
+    def _run(self, node_client: Any, indexes: List[int]) -> List[Any]:
+        pipe = node_client.pipeline(transaction=False)
+        for index in indexes:
+            name, key, args, kwargs = self._commands[index]
+            getattr(pipe, name)(key, *args, **kwargs)
+        return pipe.execute()
+
+
+class RingRedis:
+    """
+    Клиент для нескольких узлов Redis с согласованным хешированием
+
+    Поддерживает команды, которые использует кэш: get, set, pttl, delete,
+    eval, pipeline, ping и info. У каждого узла свой предохранитель;
+    пока он разомкнут, ключи узла обслуживает следующий узел кольца.
+    Вернувшийся узел до первого обращения очищается от ключей кэша
+    (purge_node), чтобы не отдавать значения, измененные или удаленные,
+    пока его ключи обслуживал другой узел.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, Any],
+        vnodes: int = 160,
+        breaker_factory: Optional[Callable[[str], CircuitBreaker]] = None,
+    ) -> None:
+        self.clients = clients
+        self.ring = HashRing(list(clients), vnodes)
+        breaker_factory = breaker_factory or (
+            lambda node: CircuitBreaker(f"redis:{node}", consecutive_failures=3, open_seconds=5)
+        )
+        self.breakers = {node: breaker_factory(node) for node in clients}
+        # Узлы, ключи которых обслуживал другой узел: перед обращением их нужно очистить
+        self._missed: Set[str] = set()
+        self._purge_lock = threading.Lock()
+
+    def _ready(self, node: str) -> bool:
+        """Доступен ли узел; вернувшийся после отказа узел сначала очищается"""
+        if self.breakers[node].state == OPEN:
+            self._missed.add(node)
+            return False
+        if node not in self._missed:
+            return True
+        # Очищает один поток, остальные пока обращаются к следующему узлу
+        if not self._purge_lock.acquire(blocking=False):
+            return False
+        try:
+            if node not in self._missed:
+                return True
+            deleted = self.breakers[node].call(purge_node, self.clients[node])
+            self._missed.discard(node)
+        except Exception as e:
+            if not isinstance(e, CircuitOpenError):
+                logger.warning(f"Redis node {node} failed while purging stale keys: {e}")
+            return False
+        finally:
+            self._purge_lock.release()
+        logger.info(f"Redis node {node} is back, purged {deleted} cache keys")
+        return True
+
+    def _first_available(self, key: str, excluded: Set[str]) -> Optional[str]:
+        for node in self.ring.preference_list(key):
+            if node not in excluded and self._ready(node):
+                return node
+        return None
+
+    def _call_preferred(self, preference: Sequence[str], fn: Callable[[Any], T]) -> T:
+        """Вызов на первом доступном узле из списка предпочтения"""
+        error: Optional[Exception] = None
+        for node in preference:
+            if not self._ready(node):
+                error = error or CircuitOpenError(f"Redis node {node} is unavailable")
+                continue
+            try:
+                return self.breakers[node].call(fn, self.clients[node])
+            except CircuitOpenError as e:
+                self._missed.add(node)
+                error = error or e
+            except Exception as e:
+                logger.warning(f"Redis node {node} failed, trying next node: {e}")
+                self._missed.add(node)
+                error = e
+        raise error or ConnectionError("No Redis nodes configured")
+
+    def _call(self, key: str, fn: Callable[[Any], T]) -> T:
+        return self._call_preferred(list(self.ring.preference_list(key)), fn)
+
+    def get(self, key: str) -> Any:
+        return self._call(key, lambda client: client.get(key))
+
+    def set(self, key: str, value: Any, **kwargs: Any) -> Any:
+        return self._call(key, lambda client: client.set(key, value, **kwargs))
+
+    def pttl(self, key: str) -> Any:
+        return self._call(key, lambda client: client.pttl(key))
+
+    def delete(self, *keys: str) -> int:
+        pipe = self.pipeline()
+        for key in keys:
+            pipe.delete(key)
+        return sum(pipe.execute())
+
+    def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> Any:
+        return self._call(keys_and_args[0], lambda client: client.eval(script, numkeys, *keys_and_args))
+
+    def pipeline(self, transaction: bool = False) -> _RingPipeline:
+        return _RingPipeline(self)
+
+    def _each_node(self, fn: Callable[[Any], T]) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        for node, client in self.clients.items():
+            try:
+                results[node] = self.breakers[node].call(fn, client)
+            except Exception as e:
+                results[node] = e
+        if all(isinstance(result, Exception) for result in results.values()):
+            raise next(iter(results.values()))
+        return results
+
+    def ping(self) -> bool:
+        """Успешен, если отвечает хотя бы один узел"""
+        self._each_node(lambda client: client.ping())
+        return True
+
+    def info(self, section: str = "server") -> Dict[str, Any]:
+        """
+        Сводная информация узлов
+
+        run_id составлен из run_id всех узлов: перезапуск, отказ или
+        возвращение любого узла меняет его.
+        """
+        results = self._each_node(lambda client: client.info(section))
+        return {
+            "run_id": ",".join(
+                "down" if isinstance(result, Exception) else str(result.get("run_id"))
+                for _, result in sorted(results.items())
+            )
+        }
+
+    def nodes_state(self) -> List[Dict[str, Any]]:
+        """Состояние предохранителей узлов для /healthz"""
+        return [{"node": node, **breaker.snapshot()} for node, breaker in self.breakers.items()]
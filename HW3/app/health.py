@@ -0,0 +1,164 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from . import cache
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+
+
+def _default_session_factory() -> Session:
+    from .database import SessionLocal
+    return SessionLocal()
+
+
+def _default_engine() -> Any:
+    from .database import engine
+    return engine
+
+
+def _probe_replicas() -> List[Dict[str, Any]]:
+    from .database import read_router
+    return read_router.probe()
+
+
+class HealthProber:
+    """
+    Фоновая проверка состояния БД и Redis
+
+    Проверки выполняются в отдельном потоке раз в interval секунд,
+    эндпоинты отдают последний снимок без обращения к БД и Redis.
+    Если снимок старше max_age (поток остановлен или завис), запрос
+    получает его с возрастом age_seconds, а остановленный поток
+    перезапускается. Проверку в потоке запроса выполняет только первый
+    запрос до появления снимка, одновременные запросы ждут ее результата.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], Session]] = None,
+        engine_getter: Optional[Callable[[], Any]] = None,
+        interval: float = HEALTH_PROBE_INTERVAL,
+    ) -> None:
+        self.session_factory = session_factory or _default_session_factory
+        self.engine_getter = engine_getter or _default_engine
+        self.interval = interval
+        self.max_age = interval * 3
+        self._snapshot: Dict[str, Any] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._first_probe_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _probe_database(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            db = self.session_factory()
+            try:
+                db.execute(text("SELECT 1")).fetchone()
+            finally:
+                db.close()
+            return {"status": "healthy", "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        except Exception as e:
+            logger.error(f"Database health check failed: {str(e)}")
+            return {"status": "unhealthy", "error": str(e)}
+
+    def _probe_redis(self) -> Dict[str, Any]:
+        if not cache.redis_client:
+            return {"status": "unhealthy", "error": "Redis client is not initialized"}
+        started = time.perf_counter()
+        try:
+            cache.redis_breaker.call(cache.redis_client.ping)
+            return {"status": "healthy", "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+        except cache.CircuitOpenError:
+            return {"status": "unhealthy", "error": "circuit open"}
+        except Exception as e:
+            logger.error(f"Redis health check failed: {str(e)}")
+            return {"status": "unhealthy", "error": str(e)}
+
+    def _pool_stats(self) -> Dict[str, Any]:
+        from .database import pool_telemetry
+        pool = self.engine_getter().pool
+        stats: Dict[str, Any] = {"class": type(pool).__name__}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[name] = method()
+        stats["telemetry"] = {name: telemetry.snapshot() for name, telemetry in pool_telemetry.items()}
+        return stats
+
+    def refresh(self) -> Dict[str, Any]:
+        """Выполнение проверок и сохранение снимка"""
+        database = self._probe_database()
+        redis_state = self._probe_redis()
+        snapshot = {
+            "status": database["status"],
+            "database": database["status"],
+            "redis": redis_state["status"],
+            "details": {"database": database, "redis": redis_state},
+            "pool": self._pool_stats(),
+            "replicas": _probe_replicas(),
+            "checked_at": datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        return snapshot
+
+    def is_stale(self) -> bool:
+        return not self._snapshot or time.monotonic() - self._checked_at > self.max_age
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Последний снимок состояния с возрастом в секундах"""
+        with self._lock:
+            snapshot = dict(self._snapshot)
+            snapshot["age_seconds"] = round(time.monotonic() - self._checked_at, 3)
+        snapshot["redis_circuit"] = cache.circuit_state()
+        return snapshot
+
+    def has_snapshot(self) -> bool:
+        return bool(self._snapshot)
+
+    def ensure_snapshot(self) -> None:
+        """Первая проверка, если снимка еще нет (одна на все одновременные запросы)"""
+        if self._snapshot:
+            return
+        with self._first_probe_lock:
+            if not self._snapshot:
+                self.refresh()
+
+    def current(self) -> Dict[str, Any]:
+        """Последний снимок для эндпоинтов; устаревший снимок перезапускает фоновый поток"""
+        if self.is_stale():
+            self.start()
+        return self.snapshot()
+
+    def _run(self) -> None:
+        # Первая проверка выполняется сразу, не задерживая запуск воркера
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Health probe failed: {str(e)}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+prober = HealthProber()
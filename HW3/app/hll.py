@@ -0,0 +1,97 @@
+"""
+HyperLogLog: оценка числа различных элементов в памяти фиксированного размера
+
+Элемент задается 64-битным хешем: старшие precision бит выбирают регистр,
+в регистре хранится максимальная позиция первой единицы в остальных битах.
+При precision=12 (4096 регистров по байту) относительная стандартная ошибка
+оценки 1.04 / sqrt(4096) ~ 1.6%; примерно в 95% случаев ошибка не больше 3.3%.
+Скетчи объединяются поэлементным максимумом регистров: оценка объединения
+равна оценке по всем элементам сразу, повторы не учитываются дважды.
+"""
+from typing import Iterable, Optional
+import hashlib
+import math
+import zlib
+
+DEFAULT_PRECISION = 12
+
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(65)]
+
+
+def hash64(value: str) -> int:
+    """64-битный хеш строки, одинаковый во всех процессах"""
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def relative_error(precision: int = DEFAULT_PRECISION) -> float:
+    """Относительная стандартная ошибка оценки для 2**precision регистров"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _alpha(registers: int) -> float:
+    if registers == 16:
+        return 0.673
+    if registers == 32:
+        return 0.697
+    if registers == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / registers)
+
+
+class HyperLogLog:
+    """
+    Скетч для оценки числа уникальных элементов
+
+    Args:
+        precision: Число бит хеша для выбора регистра (4..16)
+        registers: Регистры существующего скетча
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: Optional[bytes] = None) -> None:
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        size = 1 << precision
+        if registers is not None and len(registers) != size:
+            raise ValueError(f"expected {size} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(size)
+
+    def add_hash(self, value: int) -> None:
+        """Добавление элемента по его 64-битному хешу"""
+        bits = 64 - self.precision
+        index = value >> bits
+        rank = bits - (value & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def add(self, value: str) -> None:
+        self.add_hash(hash64(value))
+
+    def update(self, hashes: Iterable[int]) -> None:
+        for value in hashes:
+            self.add_hash(value)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        """Объединение с другим скетчем той же точности"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge sketches with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        """Оценка числа уникальных элементов"""
+        size = len(self.registers)
+        estimate = _alpha(size) * size * size / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+        if estimate <= 2.5 * size:
+            # Для малых значений точнее линейный подсчет по пустым регистрам
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        """Сжатое представление: байт точности и регистры (пустые регистры сжимаются почти в ноль)"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        return cls(data[0], zlib.decompress(data[1:]))
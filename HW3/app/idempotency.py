@@ -0,0 +1,178 @@
+"""
+Ключи идемпотентности для запросов, создающих данные (заголовок Idempotency-Key)
+
+Первый ответ на запрос с ключом (успешный или с ошибкой клиента 4xx)
+сохраняется в Redis на IDEMPOTENCY_TTL секунд и в памяти процесса, которая
+отвечает, пока Redis недоступен. Повторный запрос с тем же ключом получает
+сохраненный ответ без повторной записи. Ключ действует в пределах
+пользователя и эндпоинта, а ответ привязан к отпечатку тела запроса:
+тот же ключ с другим телом дает 422. Ответы 5xx не сохраняются, такой
+запрос можно повторить.
+
+Одновременные повторы ждут первый запрос: в процессе - через
+cache.single_flight, между воркерами - по блокировке SET NX в Redis
+и опросу сохраненного ответа (не дольше IDEMPOTENCY_WAIT секунд, затем 409).
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from . import cache
+from .circuit_breaker import LRUCache
+from .metrics import registry as metrics_registry
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+IDEMPOTENCY_PREFIX = "idem:"
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_LOCK_TTL_MS = int(os.getenv("IDEMPOTENCY_LOCK_TTL_MS", "30000"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "10"))
+IDEMPOTENCY_FALLBACK_SIZE = int(os.getenv("IDEMPOTENCY_FALLBACK_SIZE", "10000"))
+
+_responses = LRUCache(maxsize=IDEMPOTENCY_FALLBACK_SIZE, ttl=IDEMPOTENCY_TTL)
+
+replays = metrics_registry.counter("idempotency_replays_total", "Responses replayed for a repeated Idempotency-Key")
+
+
+def fingerprint(payload: Any) -> str:
+    """Отпечаток тела запроса"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _storage_key(scope: str, key: str) -> str:
+    return f"{IDEMPOTENCY_PREFIX}{scope}:{key}"
+
+
+def _load(storage_key: str) -> Optional[Dict[str, Any]]:
+    if cache.redis_client:
+        try:
+            raw = cache._redis_call(cache.redis_client.get, storage_key)
+            if raw is not None:
+                return json.loads(raw)
+        except Exception as e:
+            cache._log_redis_error("Error reading idempotent response", e)
+    return _responses.get(storage_key)
+
+
+def _store(storage_key: str, record: Dict[str, Any]) -> None:
+    _responses.set(storage_key, record)
+    if cache.redis_client:
+        try:
+            cache._redis_call(cache.redis_client.set, storage_key, json.dumps(record), ex=IDEMPOTENCY_TTL)
+        except Exception as e:
+            cache._log_redis_error("Error storing idempotent response", e)
+
+
+def _acquire(storage_key: str) -> Tuple[bool, Optional[str]]:
+    """
+    Блокировка ключа между воркерами
+
+    Returns:
+        (получена ли блокировка, токен для снятия); без Redis блокировка
+        считается полученной, повторы внутри процесса ждут в single_flight
+    """
+    if not cache.redis_client:
+        return True, None
+    token = uuid.uuid4().hex
+    try:
+        acquired = cache._redis_call(
+            cache.redis_client.set, f"{cache.LOCK_PREFIX}{storage_key}", token, nx=True, px=IDEMPOTENCY_LOCK_TTL_MS
+        )
+    except Exception as e:
+        cache._log_redis_error("Error acquiring idempotency lock", e)
+        return True, None
+    return bool(acquired), token if acquired else None
+
+
+def _release(storage_key: str, token: Optional[str]) -> None:
+    if token is None or not cache.redis_client:
+        return
+    try:
+        cache._redis_call(cache.redis_client.eval, cache._RELEASE_LOCK_SCRIPT, 1, f"{cache.LOCK_PREFIX}{storage_key}", token)
+    except Exception as e:
+        cache._log_redis_error("Error releasing idempotency lock", e)
+
+
+def _wait(storage_key: str) -> Optional[Dict[str, Any]]:
+    """Ожидание ответа запроса, который выполняет другой воркер"""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(cache.CACHE_LOCK_POLL)
+        record = _load(storage_key)
+        if record is not None:
+            return record
+    return None
+
+
+def _execute(storage_key: str, request_fingerprint: str, fn: Callable[[], Any]) -> Tuple[Dict[str, Any], bool]:
+    """Выполнение запроса под блокировкой ключа; возвращает ответ и признак, что он получен сейчас"""
+    acquired, token = _acquire(storage_key)
+    if not acquired:
+        record = _wait(storage_key)
+        if record is None:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        return record, False
+    try:
+        # Ответ мог сохранить воркер, который держал блокировку до нас
+        record = _load(storage_key)
+        if record is not None:
+            return record, False
+        try:
+            body = fn()
+        except HTTPException as e:
+            if e.status_code >= 500:
+                raise
+            record = {"fingerprint": request_fingerprint, "status": e.status_code, "body": {"detail": e.detail}}
+        else:
+            record = {"fingerprint": request_fingerprint, "status": 200, "body": jsonable_encoder(body)}
+        _store(storage_key, record)
+        return record, True
+    finally:
+        _release(storage_key, token)
+
+
+def run(scope: str, key: str, request_fingerprint: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """
+    Выполнение запроса не более одного раза на ключ идемпотентности
+
+    Args:
+        scope: Область ключа (эндпоинт и пользователь)
+        key: Значение заголовка Idempotency-Key
+        request_fingerprint: Отпечаток тела запроса (fingerprint)
+        fn: Выполнение запроса; HTTPException 4xx сохраняется как ответ
+
+    Returns:
+        Тело ответа и признак, что ответ повторен из хранилища
+    """
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} must be 1-{IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+    storage_key = _storage_key(scope, key)
+    record = _load(storage_key)
+    executed = False
+    if record is None:
+        leader: List[bool] = []
+
+        def execute() -> Tuple[Dict[str, Any], bool]:
+            leader.append(True)
+            return _execute(storage_key, request_fingerprint, fn)
+
+        record, fresh = cache.single_flight(storage_key, execute)
+        executed = fresh and bool(leader)
+
+    if not executed:
+        if record["fingerprint"] != request_fingerprint:
+            raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used with a different request")
+        replays.inc()
+        logger.debug(f"Replaying response for {storage_key}")
+    if record["status"] >= 400:
+        raise HTTPException(status_code=record["status"], detail=record["body"]["detail"])
+    return record["body"], not executed
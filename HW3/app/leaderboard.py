@@ -0,0 +1,145 @@
+"""
+Рейтинг самых популярных ссылок за последний час и день в Redis
+
+Переходы из буфера событий (app.clicks) при каждой записи пачки
+добавляются одним конвейером в два сортированных множества каждого окна:
+множество текущего интервала (top:1h:<номер интервала>) и сумму окна
+(top:1h). Когда интервал целиком выходит за пределы окна, его счетчики
+вычитаются из суммы; вычитание выполняет один воркер (маркер SET NX).
+Поэтому рейтинг окна читается одной командой ZREVRANGE, без объединения
+множеств, а все команды затрагивают один ключ и работают и с кольцом
+узлов (hash_ring.RingRedis). Окно "1h" покрывает от 60 до 65 минут,
+"1d" - от 24 до 25 часов.
+
+Без Redis рейтинг недоступен (top возвращает None): /links/top тогда
+считает его по агрегатам click_rollups.
+"""
+from typing import Dict, List, Mapping, Optional, Tuple
+from . import cache
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_PREFIX = "top:"
+LEADERBOARD_MAX_MEMBERS = int(os.getenv("LEADERBOARD_MAX_MEMBERS", "10000"))
+
+# Окно -> (длительность окна, длительность интервала) в секундах
+WINDOWS: Dict[str, Tuple[int, int]] = {"1h": (3600, 300), "1d": (86400, 3600)}
+
+# Последний интервал каждого окна, проверенный этим процессом
+_rotated: Dict[str, int] = {}
+
+
+def _total_key(window: str) -> str:
+    return f"{LEADERBOARD_PREFIX}{window}"
+
+
+def _bucket_key(window: str, bucket: int) -> str:
+    return f"{LEADERBOARD_PREFIX}{window}:{bucket}"
+
+
+def add_clicks(counts: Mapping[str, int], now: Optional[float] = None) -> None:
+    """
+    Добавление переходов в текущие интервалы и суммы всех окон одним конвейером
+
+    Args:
+        counts: Число переходов по коротким кодам
+        now: Текущее время (для тестов)
+    """
+    if not counts or not cache.redis_client:
+        return
+    now = time.time() if now is None else now
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        for window, (span, bucket_seconds) in WINDOWS.items():
+            bucket_key = _bucket_key(window, int(now // bucket_seconds))
+            total_key = _total_key(window)
+            for short_code, clicks in counts.items():
+                pipe.zincrby(bucket_key, clicks, short_code)
+                pipe.zincrby(total_key, clicks, short_code)
+            pipe.expire(bucket_key, span * 2)
+            pipe.expire(total_key, span * 2)
+        cache._redis_call(pipe.execute)
+    except Exception as e:
+        cache._log_redis_error("Error updating leaderboard", e)
+
+
+def _expire_bucket(window: str, bucket: int, span: int) -> bool:
+    """Вычитание непустого интервала из суммы окна, если этого еще не сделал другой воркер"""
+    client = cache.redis_client
+    marker = f"{cache.LOCK_PREFIX}{_bucket_key(window, bucket)}"
+    if not cache._redis_call(client.set, marker, "1", nx=True, ex=span * 2):
+        return False
+    try:
+        pipe = client.pipeline(transaction=False)
+        pipe.zrange(_bucket_key(window, bucket), 0, -1, withscores=True)
+        [members] = cache._redis_call(pipe.execute)
+        if not members:
+            return False
+
+        total_key = _total_key(window)
+        pipe = client.pipeline(transaction=False)
+        for short_code, clicks in members:
+            pipe.zincrby(total_key, -clicks, short_code)
+        pipe.zremrangebyscore(total_key, "-inf", 0)
+        pipe.zremrangebyrank(total_key, 0, -(LEADERBOARD_MAX_MEMBERS + 1))
+        pipe.delete(_bucket_key(window, bucket))
+        cache._redis_call(pipe.execute)
+    except Exception:
+        # Без маркера интервал вычтет следующий проход
+        cache._redis_call(client.delete, marker)
+        raise
+    return True
+
+
+def rotate(now: Optional[float] = None) -> int:
+    """
+    Вычитание интервалов, вышедших за пределы окон
+
+    Вызывается периодически (ClickPipeline); без новых интервалов
+    не обращается к Redis. После запуска процесса проверяются интервалы
+    за предыдущее окно: их мог пропустить остановленный воркер.
+
+    Returns:
+        Количество вычтенных непустых интервалов
+    """
+    if not cache.redis_client:
+        return 0
+    now = time.time() if now is None else now
+    expired = 0
+    for window, (span, bucket_seconds) in WINDOWS.items():
+        last = int((now - span) // bucket_seconds) - 1
+        first = _rotated.get(window, last - span // bucket_seconds) + 1
+        try:
+            for bucket in range(first, last + 1):
+                expired += _expire_bucket(window, bucket, span)
+            _rotated[window] = max(last, _rotated.get(window, last))
+        except Exception as e:
+            cache._log_redis_error("Error rotating leaderboard", e)
+    return expired
+
+
+def top(window: str, n: int) -> Optional[List[Tuple[str, int]]]:
+    """
+    Самые популярные ссылки окна
+
+    Returns:
+        Список (короткий код, число переходов) по убыванию или None, если Redis недоступен
+    """
+    if not cache.redis_client:
+        return None
+    try:
+        pipe = cache.redis_client.pipeline(transaction=False)
+        pipe.zrevrange(_total_key(window), 0, n - 1, withscores=True)
+        [members] = cache._redis_call(pipe.execute)
+    except Exception as e:
+        cache._log_redis_error("Error reading leaderboard", e)
+        return None
+    return [(short_code, int(clicks)) for short_code, clicks in members]
+
+
+def hot_codes(limit: int, window: str = "1d") -> List[str]:
+    """Короткие коды по убыванию популярности за окно для прогрева кэша; пустой список без Redis"""
+    return [short_code for short_code, _ in top(window, limit) or []]
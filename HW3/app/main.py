@@ -1,22 +1,34 @@
+import time
+
+_import_started = time.perf_counter()
+
+import hashlib
 import logging
 import os
 import shortuuid
 import traceback
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Union, Any
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union, Any
 
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Request
-from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Request, Response, UploadFile, File, Header
+from fastapi.responses import RedirectResponse, JSONResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.docs import get_redoc_html, get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
-from . import models, schemas, database, auth, cache, background_tasks as bg_tasks
-from .database import engine, get_db
+from . import models, schemas, database, auth, bulk_import, cache, changes, clicks, export, group_commit, health, hll, idempotency, leaderboard, owner_stats, warmup, migrate, background_tasks as bg_tasks
+from .config import DB_CREATE_SCHEMA
+from .metrics import registry as metrics_registry
+from .database import get_db
+from .sharding import ShardSessions, get_shards
 from .simple_docs import add_custom_docs
 
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
@@ -32,21 +44,88 @@ logger = logging.getLogger(__name__)
 
 logger.info("Starting URL Shortener API")
 
-models.Base.metadata.create_all(bind=engine)
-
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 
+startup_seconds = metrics_registry.gauge("app_startup_seconds", "Duration of worker startup phases")
+
+
+@contextmanager
+def _startup_phase(timings: Dict[str, float], phase: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = round(time.perf_counter() - started, 4)
+        startup_seconds.set(timings[phase], {"phase": phase})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Запуск и остановка воркера
+
+    Схема БД создается только при DB_CREATE_SCHEMA (иначе командой
+    python -m app.migrate), клиент Redis создается здесь, а проверки
+    состояния и прогрев кэша идут в фоновых потоках и не задерживают
+    прием запросов. Длительность этапов - в app.state.startup_timings.
+    """
+    logger.info("Application startup")
+    timings: Dict[str, float] = {"import": round(time.perf_counter() - _import_started, 4)}
+    startup_seconds.set(timings["import"], {"phase": "import"})
+
+    with _startup_phase(timings, "schema"):
+        if DB_CREATE_SCHEMA:
+            await run_in_threadpool(migrate.create_schema)
+
+    with _startup_phase(timings, "redis"):
+        cache.init_redis()
+
+    watcher = None
+    change_feed = None
+    click_pipeline = None
+    with _startup_phase(timings, "background"):
+        health.prober.start()
+        if changes.CHANGE_FEED_ENABLED:
+            change_feed = changes.ChangeFeed()
+            change_feed.start()
+        if clicks.CLICK_EVENTS_ENABLED:
+            click_pipeline = clicks.ClickPipeline()
+            click_pipeline.start()
+        if cache.redis_client:
+            watcher = warmup.RedisRestartWatcher(on_restart=warmup.start_background_warmup)
+            watcher.start()
+        if warmup.WARMUP_ON_STARTUP:
+            warmup.start_background_warmup("startup", gate_readiness=True)
+
+    app.state.startup_timings = timings
+    logger.info(f"Startup finished in {sum(timings.values()):.3f}s: {timings}")
+
+    yield
+
+    logger.info("Application shutdown")
+    health.prober.stop()
+    if watcher:
+        watcher.stop()
+    if change_feed:
+        change_feed.stop()
+    if click_pipeline:
+        click_pipeline.stop()
+    group_commit.committer.stop()
+
+
 app = FastAPI(
     title="URL Shortener API",
     description="API for shortening URLs with statistics and user management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "If-Match", idempotency.IDEMPOTENCY_HEADER],
+    expose_headers=["ETag", idempotency.REPLAYED_HEADER],
 )
 
 
@@ -73,36 +152,6 @@ async def log_exceptions(request: Request, call_next) -> JSONResponse:
             content={"detail": "Internal Server Error", "error": error_detail}
         )
 
-@app.on_event("startup")
-async def startup_event() -> None:
-    """
-    Выполняется при запуске приложения
-    """
-    logger.info("Application startup")
-    
-    try:
-        db = next(get_db())
-        try:
-            result = db.execute(text("SELECT 1")).fetchone()
-            logger.info(f"Database connection successful: {result}")
-        except Exception as e:
-            logger.error(f"Database connection failed: {str(e)}")
-            logger.error(traceback.format_exc())
-    except Exception as e:
-        logger.error(f"Error getting database session: {str(e)}")
-        logger.error(traceback.format_exc())
-    
-    try:
-        if cache.redis_client:
-            redis_result = cache.redis_client.ping()
-            logger.info(f"Redis connection successful: {redis_result}")
-        else:
-            logger.warning("Redis client is not initialized. Cache functionality will be limited.")
-    except Exception as e:
-        logger.error(f"Redis connection failed: {str(e)}")
-        logger.warning("Application will continue without Redis caching")
-
-
 @app.post("/users/", response_model=schemas.UserResponse)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)) -> models.User:
     """
@@ -133,6 +182,66 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)) -> mode
         logger.error(f"Error creating user: {str(e)}")
         raise HTTPException(status_code=500, detail="Error creating user")
 
+@app.get("/users/me/stats", response_model=schemas.OwnerStats)
+def get_my_stats(
+    shards: ShardSessions = Depends(get_shards),
+    current_user: models.User = Depends(auth.get_current_active_user)
+) -> schemas.OwnerStats:
+    """
+    Сводная статистика ссылок текущего пользователя
+    
+    Считается одним запросом с группировкой на каждом шарде (или берется
+    из сводки для владельцев с большим числом ссылок) и кэшируется
+    на OWNER_STATS_TTL секунд.
+    
+    Args:
+        shards: Сессии шардов ссылок
+        current_user: Текущий пользователь
+        
+    Returns:
+        Количество ссылок по состояниям, переходы и самые популярные ссылки
+    """
+    stats = cache.load_owner_stats(current_user.id, lambda: owner_stats.owner_stats(shards.fan_out, current_user.id))
+    return schemas.OwnerStats(**stats)
+
+@app.get("/users/me/export")
+def export_my_data(
+    dataset: str = "links",
+    format: str = "csv",
+    compression: str = "gzip",
+    shards: ShardSessions = Depends(get_shards),
+    current_user: models.User = Depends(auth.get_current_active_user)
+) -> StreamingResponse:
+    """
+    Потоковая выгрузка данных текущего пользователя
+    
+    Args:
+        dataset: links, expired_links, click_rollups или click_events
+        format: csv, ndjson или parquet
+        compression: gzip или none (parquet сжимается внутри файла)
+        shards: Сессии шардов ссылок
+        current_user: Текущий пользователь
+        
+    Returns:
+        Файл, который формируется и отдается частями
+    """
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=400, detail=f"Dataset must be one of: {', '.join(export.DATASETS)}")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(export.FORMATS)}")
+    if compression not in ("gzip", "none"):
+        raise HTTPException(status_code=400, detail="Compression must be one of: gzip, none")
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=400, detail="Parquet export requires pyarrow")
+
+    compress = compression == "gzip"
+    logger.info(f"Exporting {dataset} as {format} for user {current_user.username}")
+    return StreamingResponse(
+        export.stream(dataset, current_user.id, format, compress, shards.each_source()),
+        media_type=export.media_type(format, compress),
+        headers={"Content-Disposition": f'attachment; filename="{export.file_name(dataset, format, compress)}"'}
+    )
+
 @app.post("/token", response_model=schemas.Token)
 def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
@@ -161,23 +270,196 @@ def login_for_access_token(
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-def generate_unique_short_code(db: Session, length: int = 6) -> str:
+def generate_unique_short_code(db: Session, length: int = 6, shards: Optional[ShardSessions] = None) -> str:
     """
     Генерирует уникальный короткий код для ссылки
     
     Args:
         db: Сессия базы данных
         length: Длина короткого кода
+        shards: Сессии шардов (уникальность проверяется на шарде кода)
         
     Returns:
         Уникальный короткий код
     """
     while True:
         short_code = shortuuid.uuid()[:length]
-        db_link = db.query(models.Link).filter(models.Link.short_code == short_code).first()
+        session = shards.session_for(short_code) if shards else db
+        db_link = session.query(models.Link).filter(models.Link.short_code == short_code).first()
         if not db_link:
             return short_code
 
+SHORT_CODE_ATTEMPTS = 10
+
+def insert_link(db: Session, **values: Any) -> Optional[models.Link]:
+    """
+    Вставка ссылки одним запросом INSERT ... ON CONFLICT DO NOTHING RETURNING
+    
+    Занятость short_code проверяет уникальный индекс, поэтому одновременные
+    запросы с одним кодом не создают дублей. Серверные значения (id, created_at)
+    возвращаются тем же запросом, без refresh. Запись журнала изменений
+    добавляется в транзакцию сессии.
+    
+    Args:
+        db: Сессия шарда short_code
+        values: Значения колонок ссылки
+        
+    Returns:
+        Созданная ссылка или None, если short_code уже занят
+    """
+    conflict_insert = database.conflict_insert(db)
+    if conflict_insert is None:
+        # Остальные СУБД: вставка в точке сохранения, конфликт - IntegrityError
+        db_link = models.Link(**values)
+        try:
+            with db.begin_nested():
+                db.add(db_link)
+        except IntegrityError:
+            return None
+        return db_link
+
+    db_link = db.scalars(
+        conflict_insert(models.Link).values(**values).on_conflict_do_nothing(
+            index_elements=[models.Link.short_code]
+        ).returning(models.Link)
+    ).first()
+    if db_link is not None:
+        changes.record(db, db_link.short_code, changes.CREATE, db_link.owner_id)
+    return db_link
+
+def link_etag(version: int) -> str:
+    """Значение ETag для версии ссылки"""
+    return f'"{version}"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[List[int]]:
+    """
+    Версии ссылки из заголовка If-Match
+    
+    Слабые метки (W/"...") не совпадают: If-Match сравнивает метки строго.
+    
+    Args:
+        if_match: Значение заголовка If-Match
+        
+    Returns:
+        Допустимые версии или None, если условия нет (заголовок не задан или "*")
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    versions = []
+    for tag in if_match.split(","):
+        tag = tag.strip()
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.append(int(tag[1:-1]))
+    return versions
+
+def _owned_link_conditions(short_code: str, owner_id: int, versions: Optional[List[int]]) -> List[Any]:
+    link = models.Link.__table__
+    conditions = [link.c.short_code == short_code, link.c.owner_id == owner_id, link.c.is_active == True]
+    if versions is not None:
+        conditions.append(link.c.version.in_(versions))
+    return conditions
+
+def update_owned_link(
+    db: Session,
+    short_code: str,
+    owner_id: int,
+    values: Dict[str, Any],
+    versions: Optional[List[int]] = None
+) -> Optional[Any]:
+    """
+    Изменение ссылки владельца одним запросом UPDATE ... WHERE ... RETURNING
+    
+    Владелец, версия из If-Match и свободность нового кода проверяются в WHERE
+    того же запроса, поэтому между проверкой и записью ссылку не изменит другой
+    запрос. Номер версии увеличивается. Журнал изменений пишется без сброса
+    кэша после фиксации: новые значения в кэш записывает вызывающий.
+    
+    Args:
+        db: Сессия шарда ссылки (и нового кода)
+        short_code: Короткий код ссылки
+        owner_id: ID владельца
+        values: Новые значения колонок
+        versions: Допустимые версии ссылки (None - без проверки)
+        
+    Returns:
+        Обновленная строка или None, если условия не выполнены
+    """
+    link = models.Link.__table__
+    conditions = _owned_link_conditions(short_code, owner_id, versions)
+    new_short_code = values.get("short_code", short_code)
+    if new_short_code != short_code:
+        other = link.alias()
+        conditions.append(~select(other.c.id).where(other.c.short_code == new_short_code).exists())
+    statement = update(link).where(*conditions).values(**values, version=link.c.version + 1)
+    if db.get_bind().dialect.update_returning:
+        row = db.execute(statement.returning(*link.c)).first()
+    else:
+        row = None
+        if db.execute(statement).rowcount:
+            row = db.execute(select(link).where(link.c.short_code == new_short_code)).first()
+    if row is None:
+        return None
+
+    if new_short_code != short_code:
+        changes.record(db, short_code, changes.DEACTIVATE, owner_id, invalidate=False)
+    changes.record(db, new_short_code, changes.UPDATE, owner_id, invalidate=False)
+    return row
+
+def move_owned_link(
+    source_db: Session,
+    target_db: Session,
+    short_code: str,
+    owner_id: int,
+    values: Dict[str, Any],
+    versions: Optional[List[int]] = None
+) -> Optional[models.Link]:
+    """
+    Перенос ссылки владельца на шард нового кода (фиксирует вызывающий)
+    
+    Args:
+        source_db: Сессия шарда ссылки
+        target_db: Сессия шарда нового кода
+        short_code: Короткий код ссылки
+        owner_id: ID владельца
+        values: Новые значения колонок, включая short_code
+        versions: Допустимые версии ссылки (None - без проверки)
+        
+    Returns:
+        Ссылка на новом шарде или None, если условия не выполнены или код занят
+    """
+    link = models.Link.__table__
+    row = source_db.execute(select(link).where(*_owned_link_conditions(short_code, owner_id, versions))).first()
+    if row is None:
+        return None
+    # Удаление только той версии, что прочитана: иначе ссылку успел изменить другой запрос
+    if not source_db.execute(delete(link).where(link.c.id == row.id, link.c.version == row.version)).rowcount:
+        return None
+    changes.record(source_db, short_code, changes.DEACTIVATE, owner_id, invalidate=False)
+
+    columns = {name: value for name, value in row._mapping.items() if name != "id"}
+    columns.update(values, version=row.version + 1)
+    return insert_link(target_db, **columns)
+
+def _update_failure(db: Session, short_code: str, owner_id: int, versions: Optional[List[int]]) -> HTTPException:
+    """Причина, по которой условное изменение ссылки не затронуло ни одной строки"""
+    current = db.execute(
+        select(models.Link.owner_id, models.Link.version).where(
+            models.Link.short_code == short_code,
+            models.Link.is_active == True
+        )
+    ).first()
+    if current is None:
+        logger.warning(f"Link not found: {short_code}")
+        return HTTPException(status_code=404, detail="Link not found")
+    if current.owner_id != owner_id:
+        logger.warning(f"Unauthorized update attempt for link {short_code} by user {owner_id}")
+        return HTTPException(status_code=403, detail="Not authorized to update this link")
+    if versions is not None and current.version not in versions:
+        logger.warning(f"Stale update of link {short_code}: version {current.version}, If-Match {versions}")
+        return HTTPException(status_code=412, detail="Link was modified by another request")
+    logger.warning(f"Custom alias already in use for link {short_code}")
+    return HTTPException(status_code=400, detail="Custom alias already in use")
+
 def parse_expiry_date(expires_at: Union[str, datetime, None]) -> Optional[datetime]:
     """
     Преобразует строку даты истечения срока в объект datetime
@@ -218,62 +500,136 @@ def check_link_expiry(link: models.Link, db: Session) -> bool:
         return True
     return False
 
+def find_active_link(short_code: str, read_db: Session, db: Session) -> Optional[models.Link]:
+    """
+    Поиск активной ссылки для чтения
+    
+    Если ссылка прочитана с реплики и не найдена (реплика отстает) или уже истекла
+    (статус нужно обновить на основной БД), запрос повторяется на основной БД.
+    
+    Args:
+        short_code: Короткий код ссылки
+        read_db: Сессия для чтения (реплика или основная БД)
+        db: Сессия основной базы данных
+        
+    Returns:
+        Объект ссылки или None
+    """
+    query = lambda session: session.query(models.Link).filter(
+        models.Link.short_code == short_code,
+        models.Link.is_active == True
+    ).first()
+    link = query(read_db)
+    if database.is_replica(read_db) and (
+        link is None or (link.expires_at and link.expires_at < datetime.now())
+    ):
+        link = query(db)
+    return link
+
 @app.post("/links/shorten", response_model=schemas.LinkResponse)
 def create_short_link(
     link: schemas.LinkCreate,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    current_user: Optional[models.User] = Depends(auth.get_optional_user)
-) -> models.Link:
+    response: Response,
+    shards: ShardSessions = Depends(get_shards),
+    current_user: Optional[models.User] = Depends(auth.get_optional_user),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER)
+) -> Any:
     """
     Создание короткой ссылки
     
+    Повтор запроса с тем же заголовком Idempotency-Key возвращает
+    первый ответ и не создает вторую ссылку.
+    
     Args:
         link: Данные для создания ссылки
         background_tasks: Менеджер фоновых задач
-        db: Сессия базы данных
+        response: Ответ (для cookie чтения с основной БД)
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь (опционально)
+        idempotency_key: Ключ идемпотентности (опционально)
         
     Returns:
         Созданная ссылка
     """
+    if not idempotency_key:
+        return _create_short_link(link, background_tasks, response, shards, current_user)
+
+    scope = f"shorten:{current_user.id if current_user else 'anonymous'}"
+    body, replayed = idempotency.run(
+        scope, idempotency_key, idempotency.fingerprint(link.model_dump(mode="json")),
+        lambda: _create_short_link(link, background_tasks, response, shards, current_user)
+    )
+    if replayed:
+        response.headers[idempotency.REPLAYED_HEADER] = "true"
+    return body
+
+def _create_short_link(
+    link: schemas.LinkCreate,
+    background_tasks: BackgroundTasks,
+    response: Response,
+    shards: ShardSessions,
+    current_user: Optional[models.User]
+) -> schemas.LinkResponse:
     logger.debug(f"Received request to create short link: {link.original_url}")
     
     try:
-        if link.custom_alias:
-            logger.debug(f"Custom alias provided: {link.custom_alias}")
-            db_link = db.query(models.Link).filter(models.Link.short_code == link.custom_alias).first()
-            if db_link:
-                logger.warning(f"Custom alias already in use: {link.custom_alias}")
-                raise HTTPException(status_code=400, detail="Custom alias already in use")
-            short_code = link.custom_alias
-        else:
-            short_code = generate_unique_short_code(db)
-            logger.debug(f"Generated short code: {short_code}")
-
         expires_at = parse_expiry_date(link.expires_at)
-        
-        db_link = models.Link(
-            short_code=short_code,
+        values = dict(
             original_url=str(link.original_url),
             custom_alias=link.custom_alias,
             expires_at=expires_at,
             owner_id=current_user.id if current_user else None
         )
         
+        if link.custom_alias:
+            logger.debug(f"Custom alias provided: {link.custom_alias}")
+            candidates = [link.custom_alias]
+        else:
+            # Занятый код отклоняет сама вставка; при коллизии берется следующий
+            candidates = (shortuuid.uuid()[:6] for _ in range(SHORT_CODE_ATTEMPTS))
+        
+        db = db_link = None
         try:
-            db.add(db_link)
-            db.commit()
-            db.refresh(db_link)
+            for short_code in candidates:
+                if group_commit.GROUP_COMMIT_ENABLED:
+                    # Вставка фиксируется одной транзакцией вместе с одновременными запросами
+                    try:
+                        db_link = group_commit.committer.create_link(short_code=short_code, **values)
+                    except group_commit.GroupCommitTimeout as e:
+                        logger.warning(f"Group commit timed out for {short_code}")
+                        detail = "Link creation timed out, retry the request"
+                        if e.may_have_committed:
+                            detail = f"Link creation timed out, the link {short_code} may still have been created"
+                        raise HTTPException(status_code=503, detail=detail)
+                else:
+                    db = shards.session_for(short_code)
+                    db_link = insert_link(db, short_code=short_code, **values)
+                if db_link is not None:
+                    break
+            if db_link is None:
+                if link.custom_alias:
+                    logger.warning(f"Custom alias already in use: {link.custom_alias}")
+                    raise HTTPException(status_code=400, detail="Custom alias already in use")
+                raise RuntimeError("Could not generate a unique short code")
+            
+            # Ответ собирается до фиксации: после нее атрибуты ссылки пришлось бы перечитывать
+            result = schemas.LinkResponse.model_validate(db_link)
+            if db is not None:
+                db.commit()
             logger.info(f"Link created successfully: {short_code}")
             
             cache.set_link_cache(short_code, str(link.original_url))
+            database.mark_primary_reads(response)
             
-            background_tasks.add_task(bg_tasks.cleanup_expired_links, db)
+            background_tasks.add_task(shards.fan_out, bg_tasks.cleanup_expired_links, write=True)
             
-            return db_link
+            return result
+        except HTTPException:
+            raise
         except Exception as e:
-            db.rollback()
+            if db is not None:
+                db.rollback()
             logger.error(f"Error creating link: {str(e)}")
             logger.error(traceback.format_exc())
             raise HTTPException(status_code=500, detail="Error creating link")
@@ -287,49 +643,60 @@ def create_short_link(
 
 
 @app.get("/healthz")
-async def health_check() -> Dict[str, str]:
+async def health_check() -> JSONResponse:
     """
     Эндпоинт для проверки работоспособности сервиса
+
+    Возвращает последний снимок фоновой проверки (с возрастом age_seconds),
+    не обращаясь к БД и Redis; проверка в запросе выполняется, только пока
+    снимка еще нет
     """
-    try:
-        db = next(get_db())
-        db.execute(text("SELECT 1")).fetchone()
-        db_status = "healthy"
-    except Exception as e:
-        logger.error(f"Database health check failed: {str(e)}")
-        db_status = "unhealthy"
-    try:
-        if cache.redis_client and cache.redis_client.ping():
-            redis_status = "healthy"
-        else:
-            redis_status = "unhealthy"
-    except Exception as e:
-        logger.error(f"Redis health check failed: {str(e)}")
-        redis_status = "unhealthy"
-    
-    is_healthy = db_status == "healthy"
-    status_code = 200 if is_healthy else 503
-    
+    if not health.prober.has_snapshot():
+        await run_in_threadpool(health.prober.ensure_snapshot)
+    snapshot = health.prober.current()
+    status_code = 200 if snapshot["status"] == "healthy" else 503
+    return JSONResponse(content=snapshot, status_code=status_code)
+
+@app.get("/readyz")
+async def readiness_check() -> JSONResponse:
+    """
+    Эндпоинт готовности к приему трафика
+
+    Сервис не готов, пока недоступна БД или идет прогрев кэша при запуске
+    """
+    if not health.prober.has_snapshot():
+        await run_in_threadpool(health.prober.ensure_snapshot)
+    snapshot = health.prober.current()
+    warming_up = not warmup.startup_complete.is_set()
+    is_ready = snapshot["database"] == "healthy" and not warming_up
     response = {
-        "status": "healthy" if is_healthy else "unhealthy", 
-        "database": db_status,
-        "redis": redis_status
+        "status": "ready" if is_ready else "not ready",
+        "database": snapshot["database"],
+        "warming_up": warming_up
     }
-    
-    return JSONResponse(content=response, status_code=status_code)
+    return JSONResponse(content=response, status_code=200 if is_ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Метрики процесса в текстовом формате Prometheus
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/links/search")
 def search_by_original_url(
     original_url: str, 
-    db: Session = Depends(get_db), 
+    shards: ShardSessions = Depends(get_shards), 
     current_user: models.User = Depends(auth.get_current_active_user)
 ) -> Dict[str, Any]:
     """
     Поиск ссылки по оригинальному URL
     
+    Поиск выполняется на всех шардах параллельно
+    
     Args:
         original_url: Оригинальный URL для поиска
-        db: Сессия базы данных
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь
         
     Returns:
@@ -337,11 +704,14 @@ def search_by_original_url(
     """
     logger.debug(f"Searching for link with original URL: {original_url}")
 
-    link = db.query(models.Link).filter(
-        models.Link.owner_id == current_user.id,
-        models.Link.original_url == original_url,
-        models.Link.is_active == True
-    ).first()
+    def find(db: Session) -> Optional[models.Link]:
+        return db.query(models.Link).filter(
+            models.Link.owner_id == current_user.id,
+            models.Link.original_url == original_url,
+            models.Link.is_active == True
+        ).first()
+
+    link = next((found for found in shards.fan_out(find) if found), None)
     
     if link:
         logger.debug(f"Found matching link: {link.short_code}")
@@ -354,46 +724,222 @@ def search_by_original_url(
     logger.warning(f"No link found for URL: {original_url}")
     raise HTTPException(status_code=404, detail="Link not found")
 
+@app.get("/links/top", response_model=schemas.TopLinks)
+def get_top_links(window: str = "1h", n: int = 100, shards: ShardSessions = Depends(get_shards)) -> schemas.TopLinks:
+    """
+    Самые популярные ссылки за последний час или день
+    
+    Рейтинг читается из Redis (app.leaderboard); если Redis недоступен,
+    он считается по минутным агрегатам переходов на всех шардах.
+    
+    Args:
+        window: Окно: 1h или 1d
+        n: Количество ссылок (от 1 до 1000)
+        shards: Сессии шардов ссылок
+        
+    Returns:
+        Короткие коды и число переходов по убыванию
+    """
+    if window not in leaderboard.WINDOWS:
+        raise HTTPException(status_code=400, detail=f"Window must be one of: {', '.join(leaderboard.WINDOWS)}")
+    if not 1 <= n <= 1000:
+        raise HTTPException(status_code=400, detail="n must be between 1 and 1000")
+
+    ranking = leaderboard.top(window, n)
+    source = "redis"
+    if ranking is None:
+        source = "database"
+        since = datetime.now() - timedelta(seconds=leaderboard.WINDOWS[window][0])
+        ranking = sorted(
+            (row for rows in shards.fan_out(lambda db: clicks.top_links(db, since, n)) for row in rows),
+            key=lambda row: row[1], reverse=True
+        )[:n]
+    return schemas.TopLinks(
+        window=window,
+        source=source,
+        links=[schemas.TopLink(short_code=short_code, clicks=count) for short_code, count in ranking]
+    )
+
+@app.post("/links/import", response_model=schemas.ImportJobStatus, status_code=202)
+def import_links(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user),
+    idempotency_key: Optional[str] = Header(None, alias=idempotency.IDEMPOTENCY_HEADER)
+) -> Dict[str, Any]:
+    """
+    Массовый импорт ссылок текущего пользователя из CSV или NDJSON
+    
+    Файл не больше IMPORT_MAX_BYTES сохраняется в IMPORT_DIR и импортируется в фоне пачками;
+    прогресс доступен по GET /links/import/{job_id}. Повтор загрузки
+    с тем же заголовком Idempotency-Key возвращает ту же задачу.
+    
+    Args:
+        background_tasks: Менеджер фоновых задач
+        response: Ответ (для заголовка повтора)
+        file: Файл с колонками original_url (url), custom_alias (alias), expires_at
+        format: csv или ndjson, если его нельзя определить по имени файла
+        db: Сессия базы данных
+        current_user: Текущий пользователь
+        idempotency_key: Ключ идемпотентности (опционально)
+        
+    Returns:
+        Созданная задача импорта
+    """
+    input_format = format or bulk_import.detect_format(file.filename or "")
+    if input_format not in bulk_import.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(bulk_import.FORMATS)}")
+
+    job_id = uuid.uuid4().hex
+    suffix = ".gz" if (file.filename or "").lower().endswith(".gz") else ""
+    os.makedirs(bulk_import.IMPORT_DIR, exist_ok=True)
+    path = os.path.abspath(os.path.join(bulk_import.IMPORT_DIR, f"{job_id}.{input_format}{suffix}"))
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as target:
+        for chunk in iter(lambda: file.file.read(1024 * 1024), b""):
+            size += len(chunk)
+            if size > bulk_import.IMPORT_MAX_BYTES:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+    if size > bulk_import.IMPORT_MAX_BYTES:
+        _remove_upload(path)
+        raise HTTPException(status_code=413, detail=f"Import file must not exceed {bulk_import.IMPORT_MAX_BYTES} bytes")
+
+    def create_job() -> Dict[str, Any]:
+        job = bulk_import.create_job(db, path, input_format, current_user.id, job_id=job_id)
+        logger.info(f"Import job {job_id} created for user {current_user.username}")
+        background_tasks.add_task(bulk_import.run_job, job_id)
+        return bulk_import.job_summary(job)
+
+    try:
+        if not idempotency_key:
+            return create_job()
+        body, replayed = idempotency.run(
+            f"import:{current_user.id}", idempotency_key,
+            idempotency.fingerprint({"format": input_format, "sha256": digest.hexdigest()}), create_job
+        )
+    except Exception:
+        # Задача по этому файлу не создана (409, 422, повтор ошибки или сбой create_job)
+        _remove_upload(path)
+        raise
+    if replayed:
+        # Файл повтора не нужен: задача уже создана по первой загрузке
+        _remove_upload(path)
+        response.headers[idempotency.REPLAYED_HEADER] = "true"
+    return body
+
+def _remove_upload(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError as e:
+        logger.warning(f"Failed to remove import upload {path}: {e}")
+
+def _get_import_job(db: Session, job_id: str, current_user: models.User) -> models.ImportJob:
+    job = db.get(models.ImportJob, job_id)
+    if job is None or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@app.get("/links/import/{job_id}", response_model=schemas.ImportJobStatus)
+def get_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+) -> Dict[str, Any]:
+    """
+    Прогресс задачи импорта
+    
+    Args:
+        job_id: Идентификатор задачи
+        db: Сессия базы данных
+        current_user: Текущий пользователь
+        
+    Returns:
+        Статус, счетчики строк и первые ошибки
+    """
+    return bulk_import.job_summary(_get_import_job(db, job_id, current_user))
+
+@app.post("/links/import/{job_id}/resume", response_model=schemas.ImportJobStatus, status_code=202)
+def resume_import_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+) -> Dict[str, Any]:
+    """
+    Возобновление прерванной задачи импорта с последней зафиксированной пачки
+    
+    Args:
+        job_id: Идентификатор задачи
+        background_tasks: Менеджер фоновых задач
+        db: Сессия базы данных
+        current_user: Текущий пользователь
+        
+    Returns:
+        Задача импорта
+    """
+    job = _get_import_job(db, job_id, current_user)
+    if job.status == "completed":
+        raise HTTPException(status_code=409, detail="Import job is already completed")
+    background_tasks.add_task(bulk_import.run_job, job_id)
+    return bulk_import.job_summary(job)
+
 @app.get("/expired-links")
 def get_expired_links(
-    db: Session = Depends(get_db), 
+    shards: ShardSessions = Depends(get_shards), 
     current_user: models.User = Depends(auth.get_current_active_user)
 ) -> List[Dict[str, Any]]:
     """
     Получение списка истекших ссылок пользователя
     
+    Ссылки читаются со всех шардов параллельно, статус истекших
+    обновляется на шарде каждой ссылки
+    
     Args:
-        db: Сессия базы данных
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь
         
     Returns:
         Список истекших ссылок
     """
     logger.debug(f"Getting expired links for user: {current_user.username}")
-    
-    inactive_links = db.query(models.Link).filter(
-        models.Link.owner_id == current_user.id,
-        models.Link.is_active == False
-    ).all()
+
+    def collect(db: Session) -> Tuple[List[models.Link], List[models.Link]]:
+        inactive = db.query(models.Link).filter(
+            models.Link.owner_id == current_user.id,
+            models.Link.is_active == False
+        ).all()
+        active_expired = db.query(models.Link).filter(
+            models.Link.owner_id == current_user.id,
+            models.Link.is_active == True,
+            models.Link.expires_at.isnot(None),
+            models.Link.expires_at < datetime.now()
+        ).all()
+        return inactive, active_expired
+
+    inactive_links: List[models.Link] = []
+    active_expired_links: List[models.Link] = []
+    for inactive, active_expired in shards.fan_out(collect):
+        inactive_links.extend(inactive)
+        active_expired_links.extend(active_expired)
     
     logger.debug(f"Found {len(inactive_links)} inactive links")
-    
-    active_expired_links = db.query(models.Link).filter(
-        models.Link.owner_id == current_user.id,
-        models.Link.is_active == True,
-        models.Link.expires_at.isnot(None),
-        models.Link.expires_at < datetime.now()
-    ).all()
-    
     logger.debug(f"Found {len(active_expired_links)} active links with expired dates")
     
     if active_expired_links:
         for link in active_expired_links:
-            link.is_active = False
-            
-            cache.delete_link_cache(link.short_code)
+            session = shards.session_for(link.short_code)
+            session.query(models.Link).filter(
+                models.Link.id == link.id
+            ).update({models.Link.is_active: False}, synchronize_session=False)
+            changes.record(session, link.short_code, changes.DEACTIVATE, link.owner_id)
         
-        db.commit()
+        shards.commit()
         logger.debug("Updated status of expired links")
     
     all_expired = inactive_links + active_expired_links
@@ -420,6 +966,7 @@ def cleanup_unused_links(
     days: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
+    shards: ShardSessions = Depends(get_shards),
     current_user: models.User = Depends(auth.get_current_active_user)
 ) -> Dict[str, str]:
     """
@@ -429,6 +976,7 @@ def cleanup_unused_links(
         days: Количество дней неактивности
         background_tasks: Менеджер фоновых задач
         db: Сессия базы данных
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь
         
     Returns:
@@ -440,9 +988,9 @@ def cleanup_unused_links(
         raise HTTPException(status_code=400, detail="Days must be a positive integer")
 
     cutoff_date = datetime.now() - timedelta(days=days)
-    
-    try:
-        unused_links = db.query(models.Link).filter(
+
+    def deactivate(session: Session) -> int:
+        unused_links = session.query(models.Link).filter(
             models.Link.owner_id == current_user.id,
             models.Link.is_active == True,
             (models.Link.last_used.is_(None) & (models.Link.created_at < cutoff_date)) |
@@ -451,12 +999,16 @@ def cleanup_unused_links(
 
         for link in unused_links:
             link.is_active = False
-            cache.delete_link_cache(link.short_code)
         
-        db.commit()
+        session.commit()
+        owner_stats.refresh_summaries(session, [current_user.id])
+        return len(unused_links)
+    
+    try:
+        deactivated = sum(shards.fan_out(deactivate, write=True))
         
-        logger.info(f"Deactivated {len(unused_links)} unused links")
-        return {"message": f"Deactivated {len(unused_links)} links unused for {days} days"}
+        logger.info(f"Deactivated {deactivated} unused links")
+        return {"message": f"Deactivated {deactivated} links unused for {days} days"}
     
     except Exception as e:
         logger.error(f"Error cleaning up unused links: {str(e)}")
@@ -464,145 +1016,243 @@ def cleanup_unused_links(
         db.rollback()
         raise HTTPException(status_code=500, detail="Error cleaning up links")
 
+@app.post("/admin/cache/warmup", status_code=202)
+def warm_up_cache(
+    background_tasks: BackgroundTasks,
+    top_n: int = warmup.WARMUP_TOP_N,
+    current_user: models.User = Depends(auth.get_current_admin_user)
+) -> Dict[str, Any]:
+    """
+    Прогрев кэша самыми популярными ссылками
+    
+    Args:
+        background_tasks: Менеджер фоновых задач
+        top_n: Количество ссылок
+        current_user: Текущий пользователь (администратор)
+        
+    Returns:
+        Сообщение о запуске и результат предыдущего прогрева
+    """
+    if top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be a positive integer")
+
+    logger.info(f"Cache warm-up requested by {current_user.username} for top {top_n} links")
+    background_tasks.add_task(warmup.warm_cache, top_n=top_n, reason="admin")
+    return {"message": f"Cache warm-up started for top {top_n} links", "last_warmup": dict(warmup.last_warmup)}
+
 @app.get("/links/{short_code}", response_model=schemas.LinkStats)
-def get_link_info(short_code: str, db: Session = Depends(get_db)) -> schemas.LinkStats:
+def get_link_info(
+    short_code: str,
+    response: Response,
+    shards: ShardSessions = Depends(get_shards)
+) -> schemas.LinkStats:
     """
     Получение информации о ссылке
     
+    Версия ссылки возвращается в заголовке ETag (для If-Match в PUT)
+    
     Args:
         short_code: Короткий код ссылки
-        db: Сессия базы данных
+        response: Ответ (для ETag)
+        shards: Сессии шардов ссылок
         
     Returns:
         Статистика по ссылке
     """
     logger.debug(f"Getting info for link: {short_code}")
-    
-    stats = cache.get_stats_cache(short_code)
-    
-    if not stats:
+
+    def load_stats() -> Optional[Dict[str, Any]]:
         logger.debug("Cache miss, querying database")
-        db_link = db.query(models.Link).filter(
-            models.Link.short_code == short_code,
-            models.Link.is_active == True
-        ).first()
-        
+        db_link = find_active_link(
+            short_code, shards.read_session_for(short_code), shards.session_for(short_code)
+        )
         if not db_link:
-            logger.warning(f"Link not found: {short_code}")
-            raise HTTPException(status_code=404, detail="Link not found")
-
-        stats = {
-            "original_url": db_link.original_url,
-            "short_code": db_link.short_code,
-            "created_at": db_link.created_at.isoformat(),
-            "clicks": db_link.clicks,
-            "last_used": db_link.last_used.isoformat() if db_link.last_used else None,
-            "expires_at": db_link.expires_at.isoformat() if db_link.expires_at else None,
-            "owner_id": db_link.owner_id
-        }
-        cache.set_stats_cache(short_code, stats)
+            return None
+        return cache.stats_from_link(db_link)
+
+    stats = cache.load_stats(short_code, load_stats)
+
+    if not stats:
+        logger.warning(f"Link not found: {short_code}")
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    # Записи кэша, сделанные до появления версий, ее не содержат
+    if stats.get("version") is not None:
+        response.headers["ETag"] = link_etag(stats["version"])
+    return schemas.LinkStats(
+        original_url=stats["original_url"],
+        short_code=stats["short_code"],
+        created_at=datetime.fromisoformat(stats["created_at"]),
+        clicks=stats["clicks"],
+        last_used=datetime.fromisoformat(stats["last_used"]) if stats["last_used"] else None,
+        expires_at=datetime.fromisoformat(stats["expires_at"]) if stats["expires_at"] else None,
+        owner_id=stats["owner_id"]
+    )
+
+@app.get("/links/{short_code}/timeseries", response_model=schemas.LinkTimeseries)
+def get_link_timeseries(
+    short_code: str,
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    shards: ShardSessions = Depends(get_shards)
+) -> schemas.LinkTimeseries:
+    """
+    Число переходов по ссылке по минутам, часам или дням
+
+    Данные берутся из агрегатов и отстают от переходов на время
+    записи и свертки событий (CLICK_FLUSH_SECONDS + CLICK_ROLLUP_SECONDS)
+    
+    Args:
+        short_code: Короткий код ссылки
+        granularity: minute, hour или day
+        start: Начало периода (по умолчанию час, неделя или 90 дней до end)
+        end: Конец периода (по умолчанию текущий момент)
+        shards: Сессии шардов ссылок
         
-        return db_link
-    else:
-        logger.debug("Cache hit, using cached data")
-        return schemas.LinkStats(
-            original_url=stats["original_url"],
-            short_code=stats["short_code"],
-            created_at=datetime.fromisoformat(stats["created_at"]),
-            clicks=stats["clicks"],
-            last_used=datetime.fromisoformat(stats["last_used"]) if stats["last_used"] else None,
-            expires_at=datetime.fromisoformat(stats["expires_at"]) if stats["expires_at"] else None,
-            owner_id=stats["owner_id"]
-        )
+    Returns:
+        Число переходов по интервалам, пустые интервалы с нулем
+    """
+    if granularity not in clicks.GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Granularity must be one of: {', '.join(clicks.GRANULARITIES)}")
+    end = end or datetime.now()
+    start = start or end - clicks.DEFAULT_RANGES[granularity]
+    if start > end:
+        raise HTTPException(status_code=400, detail="Start must be before end")
+    if (end - start).total_seconds() / clicks.BUCKET_SECONDS[granularity] > 10000:
+        raise HTTPException(status_code=400, detail="Too many buckets, use a coarser granularity")
+
+    read_db = shards.read_session_for(short_code)
+    if not read_db.query(models.Link.id).filter(models.Link.short_code == short_code).first():
+        logger.warning(f"Link not found: {short_code}")
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    points = clicks.timeseries(read_db, short_code, granularity, start, end)
+    return schemas.LinkTimeseries(
+        short_code=short_code,
+        granularity=granularity,
+        start=start,
+        end=end,
+        total=sum(point["clicks"] for point in points),
+        points=points
+    )
 
 @app.get("/links/{short_code}/stats", response_model=schemas.LinkStats)
-def get_link_stats(short_code: str, db: Session = Depends(get_db)) -> schemas.LinkStats:
+def get_link_stats(
+    short_code: str,
+    response: Response,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    shards: ShardSessions = Depends(get_shards)
+) -> schemas.LinkStats:
     """
     Получение статистики по ссылке
     
     Args:
         short_code: Короткий код ссылки
-        db: Сессия базы данных
+        response: Ответ (для ETag)
+        start: Первый день для оценки уникальных посетителей
+        end: Последний день для оценки уникальных посетителей
+        shards: Сессии шардов ссылок
         
     Returns:
-        Статистика по ссылке
+        Статистика по ссылке с оценкой уникальных посетителей
+        (за все время или за дни от start до end)
     """
-    return get_link_info(short_code, db)
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="Start must be before end")
+    stats = get_link_info(short_code, response, shards)
+    try:
+        stats.unique_visitors = clicks.unique_visitors(shards.read_session_for(short_code), short_code, start, end)
+        stats.unique_visitors_error = round(hll.relative_error(), 4)
+    except SQLAlchemyError as e:
+        # Оценка посетителей необязательна: статистика из кэша отдается и без нее
+        logger.warning(f"Unique visitors unavailable for {short_code}: {e}")
+    return stats
 
 
 @app.put("/links/{short_code}", response_model=schemas.LinkResponse)
 def update_link(
     short_code: str,
     link_update: schemas.LinkUpdate,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None, alias="If-Match"),
+    shards: ShardSessions = Depends(get_shards),
     current_user: models.User = Depends(auth.get_current_active_user)
-) -> models.Link:
+) -> schemas.LinkResponse:
     """
     Обновление ссылки
     
+    Изменение выполняется одним условным UPDATE ... RETURNING; с заголовком
+    If-Match (ETag из GET /links/{short_code} или прошлого PUT) ссылка
+    меняется, только если ее версия не изменилась, иначе 412. Новая версия
+    возвращается в заголовке ETag. Если новый псевдоним относится к другому
+    шарду, ссылка переносится на него
+    
     Args:
         short_code: Короткий код ссылки
         link_update: Данные для обновления
-        db: Сессия базы данных
+        response: Ответ (для ETag и cookie чтения с основной БД)
+        if_match: Ожидаемая версия ссылки (заголовок If-Match)
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь
         
     Returns:
         Обновленная ссылка
     """
     logger.debug(f"Updating link: {short_code}")
+    versions = parse_if_match(if_match)
+    db = source_db = shards.session_for(short_code)
     
-    db_link = db.query(models.Link).filter(
-        models.Link.short_code == short_code,
-        models.Link.is_active == True
-    ).first()
-    
-    if not db_link:
-        logger.warning(f"Link not found: {short_code}")
-        raise HTTPException(status_code=404, detail="Link not found")
-
-    if db_link.owner_id != current_user.id:
-        logger.warning(f"Unauthorized update attempt for link {short_code} by user {current_user.username}")
-        raise HTTPException(status_code=403, detail="Not authorized to update this link")
+    values: Dict[str, Any] = {}
+    if link_update.original_url:
+        logger.debug(f"Updating original URL: {link_update.original_url}")
+        values["original_url"] = str(link_update.original_url)
+    if link_update.expires_at:
+        logger.debug(f"Updating expiry date: {link_update.expires_at}")
+        values["expires_at"] = link_update.expires_at
+    if link_update.custom_alias:
+        logger.debug(f"Updating custom alias: {link_update.custom_alias}")
+        values.update(short_code=link_update.custom_alias, custom_alias=link_update.custom_alias)
 
+    owner_id = current_user.id
     try:
-        cache.delete_link_cache(short_code)
-        
-        if link_update.original_url:
-            logger.debug(f"Updating original URL: {link_update.original_url}")
-            db_link.original_url = str(link_update.original_url)
-        
-        if link_update.custom_alias:
-            logger.debug(f"Updating custom alias: {link_update.custom_alias}")
-            existing_link = db.query(models.Link).filter(
-                models.Link.short_code == link_update.custom_alias,
-                models.Link.id != db_link.id
-            ).first()
-            
-            if existing_link:
-                logger.warning(f"Custom alias already in use: {link_update.custom_alias}")
-                raise HTTPException(status_code=400, detail="Custom alias already in use")
-
-            old_short_code = db_link.short_code
-            db_link.short_code = link_update.custom_alias
-            db_link.custom_alias = link_update.custom_alias
-
-            cache.delete_link_cache(old_short_code)
-        
-        if link_update.expires_at:
-            logger.debug(f"Updating expiry date: {link_update.expires_at}")
-            db_link.expires_at = link_update.expires_at
+        target_db = shards.session_for(link_update.custom_alias) if link_update.custom_alias else db
+        try:
+            if target_db is db:
+                updated = update_owned_link(db, short_code, owner_id, values, versions)
+            else:
+                logger.debug(f"Moving link {short_code} to the shard of {link_update.custom_alias}")
+                updated = move_owned_link(source_db, target_db, short_code, owner_id, values, versions)
+                db = target_db
+        except IntegrityError:
+            # Код одновременно заняла другая транзакция
+            shards.rollback()
+            updated = None
+        if updated is None:
+            if db is not source_db:
+                # Отмена удаления с исходного шарда
+                shards.rollback()
+            raise _update_failure(source_db, short_code, owner_id, versions)
         
+        # Ответ и значения кэша собираются до фиксации: после нее атрибуты ссылки пришлось бы перечитывать
+        result = schemas.LinkResponse.model_validate(updated)
+        stats = cache.stats_from_link(updated)
+        # При переносе сначала фиксируется запись на новом шарде, чтобы сбой не потерял ссылку
         db.commit()
-        db.refresh(db_link)
+        if source_db is not db:
+            source_db.commit()
         
-        cache.set_link_cache(db_link.short_code, db_link.original_url)
+        cache.refresh_link(stats, removed=[short_code] if result.short_code != short_code else ())
+        response.headers["ETag"] = link_etag(stats["version"])
+        database.mark_primary_reads(response)
         
-        logger.info(f"Link updated successfully: {db_link.short_code}")
-        return db_link
+        logger.info(f"Link updated successfully: {result.short_code}")
+        return result
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        shards.rollback()
         logger.error(f"Error updating link: {str(e)}")
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail="Error updating link")
@@ -610,7 +1260,8 @@ def update_link(
 @app.delete("/links/{short_code}", status_code=204)
 def delete_link(
     short_code: str,
-    db: Session = Depends(get_db),
+    response: Response,
+    shards: ShardSessions = Depends(get_shards),
     current_user: models.User = Depends(auth.get_current_active_user)
 ) -> None:
     """
@@ -618,10 +1269,12 @@ def delete_link(
     
     Args:
         short_code: Короткий код ссылки
-        db: Сессия базы данных
+        response: Ответ (для cookie чтения с основной БД)
+        shards: Сессии шардов ссылок
         current_user: Текущий пользователь
     """
     logger.debug(f"Deleting link: {short_code}")
+    db = shards.session_for(short_code)
     
     db_link = db.query(models.Link).filter(
         models.Link.short_code == short_code,
@@ -640,7 +1293,7 @@ def delete_link(
         db_link.is_active = False
         db.commit()
         
-        cache.delete_link_cache(short_code)
+        database.mark_primary_reads(response)
         
         logger.info(f"Link deleted successfully: {short_code}")
         return None
@@ -729,44 +1382,81 @@ async def custom_swagger_ui_html():
 
 
 @app.get("/{short_code}", response_class=RedirectResponse, status_code=307)
-def redirect_to_url(short_code: str, db: Session = Depends(get_db)) -> str:
+def redirect_to_url(short_code: str, request: Request, shards: ShardSessions = Depends(get_shards)) -> str:
     """
     Перенаправление по короткой ссылке
     
+    URL читается из кэша или с реплики, счетчик кликов обновляется на основной БД
+    (на шарде ссылки, если включено шардирование), событие перехода
+    добавляется в буфер и записывается в фоне
+    
     Args:
         short_code: Короткий код ссылки
-        db: Сессия базы данных
+        request: Запрос (referrer и user-agent для события перехода)
+        shards: Сессии шардов ссылок
         
     Returns:
         Оригинальный URL для перенаправления
     """
     logger.debug(f"Redirecting short code: {short_code}")
+    read_db = shards.read_session_for(short_code)
+    db = shards.session_for(short_code)
 
-    original_url = cache.get_link_cache(short_code)
-    
-    link = db.query(models.Link).filter(
-        models.Link.short_code == short_code,
-        models.Link.is_active == True
-    ).first()
-    
-    if not link:
+    def load_url() -> Optional[str]:
+        link = find_active_link(short_code, read_db, db)
+        if not link:
+            return None
+        if check_link_expiry(link, db):
+            logger.warning(f"Link expired: {short_code}")
+            raise HTTPException(status_code=404, detail="Link has expired")
+        return link.original_url
+
+    original_url = cache.load_link(short_code, load_url)
+
+    if not original_url:
         logger.warning(f"Link not found: {short_code}")
         raise HTTPException(status_code=404, detail="Link not found")
 
-    if check_link_expiry(link, db):
-        logger.warning(f"Link expired: {short_code}")
-        raise HTTPException(status_code=404, detail="Link has expired")
+    try:
+        now = datetime.now()
+        updated = db.query(models.Link).filter(
+            models.Link.short_code == short_code,
+            models.Link.is_active == True,
+            or_(models.Link.expires_at.is_(None), models.Link.expires_at >= now)
+        ).update(
+            {models.Link.clicks: models.Link.clicks + 1, models.Link.last_used: now},
+            synchronize_session=False
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error updating click stats: {str(e)}")
+        return original_url
+
+    if not updated:
+        # В кэше осталась ссылка, которая уже деактивирована или истекла
+        cache.delete_link_cache(short_code)
+        link = db.query(models.Link).filter(
+            models.Link.short_code == short_code,
+            models.Link.is_active == True
+        ).first()
+        if link and check_link_expiry(link, db):
+            logger.warning(f"Link expired: {short_code}")
+            raise HTTPException(status_code=404, detail="Link has expired")
+        logger.warning(f"Link not found: {short_code}")
+        raise HTTPException(status_code=404, detail="Link not found")
 
-    if not original_url:
-        original_url = link.original_url
-        cache.set_link_cache(short_code, original_url)
-    
     try:
-        link.clicks += 1
-        link.last_used = datetime.now()
         db.commit()
         
         cache.increment_link_clicks(short_code)
+        if clicks.CLICK_EVENTS_ENABLED:
+            # Без конвейера событий буфер никто не разбирает
+            clicks.buffer.record(
+                short_code,
+                request.headers.get("referer"),
+                request.headers.get("user-agent"),
+                request.client.host if request.client else None
+            )
         
         logger.debug(f"Redirecting to: {original_url}")
         return original_url
@@ -774,4 +1464,3 @@ def redirect_to_url(short_code: str, db: Session = Depends(get_db)) -> str:
         db.rollback()
         logger.error(f"Error updating click stats: {str(e)}")
         return original_url
-
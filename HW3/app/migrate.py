@@ -0,0 +1,79 @@
+from typing import List, Optional, Sequence
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from . import models
+from .database import engine
+from .sharding import _shard_metadata, shards
+import argparse
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def add_missing_columns(bind: Engine, metadata: MetaData) -> List[str]:
+    """
+    Добавление в существующие таблицы колонок, появившихся в моделях
+
+    create_all не меняет уже созданные таблицы. Колонка добавляется через
+    ALTER TABLE ... ADD COLUMN с типом, значением по умолчанию и NOT NULL
+    из модели; NOT NULL колонку без server_default добавить в непустую
+    таблицу нельзя, она пропускается с предупреждением.
+
+    Args:
+        bind: Движок БД
+        metadata: Схема таблиц этой БД
+
+    Returns:
+        Добавленные колонки в виде "таблица.колонка"
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(f"Cannot add NOT NULL column {table.name}.{column.name} without server default")
+                continue
+            ddl = CreateColumn(column).compile(dialect=bind.dialect)
+            with bind.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_schema() -> float:
+    """
+    Создание таблиц и недостающих колонок в основной БД и на шардах
+
+    Returns:
+        Затраченное время в секундах
+    """
+    started = time.perf_counter()
+    models.Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, models.Base.metadata)
+    shards.create_all()
+    shard_metadata = _shard_metadata()
+    for shard_engine in shards.engines:
+        add_missing_columns(shard_engine, shard_metadata)
+    return time.perf_counter() - started
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Создание схемы БД перед запуском воркеров")
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    seconds = create_schema()
+    logger.info(f"Database schema is up to date ({seconds:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Boolean, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -33,6 +33,8 @@ class Link(Base):
     expires_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Номер версии для условного обновления (ETag / If-Match); переходы его не меняют
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     owner = relationship("User", back_populates="links")
 
@@ -49,3 +51,101 @@ class ExpiredLink(Base):
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     
     owner = relationship("User")
+
+class LinkChange(Base):
+    """Журнал изменений ссылок (outbox): пишется в той же транзакции, что и само изменение"""
+    __tablename__ = "link_changes"
+    __allow_unmapped__ = True
+
+    id = Column(Integer, primary_key=True, index=True)
+    short_code = Column(String(20), index=True)
+    action = Column(String(20))
+    changed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class ClickEvent(Base):
+    """Переход по ссылке (журнал, только добавление)"""
+    __tablename__ = "click_events"
+    __allow_unmapped__ = True
+
+    id = Column(Integer, primary_key=True, index=True)
+    short_code = Column(String(20), index=True)
+    clicked_at = Column(DateTime(timezone=True), index=True)
+    referrer = Column(String(512), nullable=True)
+    user_agent_hash = Column(String(16), nullable=True)
+    visitor_hash = Column(String(16), nullable=True)
+
+class ClickRollup(Base):
+    """Число переходов по ссылке за минуту, час или день"""
+    __tablename__ = "click_rollups"
+    __allow_unmapped__ = True
+    __table_args__ = (UniqueConstraint("short_code", "granularity", "bucket_start"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    short_code = Column(String(20), index=True)
+    granularity = Column(String(10))
+    bucket_start = Column(DateTime(timezone=True))
+    clicks = Column(Integer, default=0)
+
+class ClickRollupCursor(Base):
+    """Последнее событие, учтенное в агрегатах (одна строка на источник)"""
+    __tablename__ = "click_rollup_cursors"
+    __allow_unmapped__ = True
+
+    name = Column(String(50), primary_key=True)
+    last_event_id = Column(Integer, default=0)
+
+class VisitorSketch(Base):
+    """HyperLogLog уникальных посетителей ссылки за день (period - дата) или за все время (period = "all")"""
+    __tablename__ = "visitor_sketches"
+    __allow_unmapped__ = True
+    __table_args__ = (UniqueConstraint("short_code", "period"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    short_code = Column(String(20), index=True)
+    period = Column(String(10))
+    registers = Column(LargeBinary)
+
+class OwnerSummary(Base):
+    """Сводная статистика ссылок владельца на источнике (только для владельцев с большим числом ссылок)"""
+    __tablename__ = "owner_summaries"
+    __allow_unmapped__ = True
+
+    owner_id = Column(Integer, primary_key=True)
+    active_links = Column(Integer, default=0)
+    expired_links = Column(Integer, default=0)
+    inactive_links = Column(Integer, default=0)
+    archived_links = Column(Integer, default=0)
+    total_clicks = Column(Integer, default=0)
+    clicks_today = Column(Integer, default=0)
+    top_links = Column(Text)
+    updated_at = Column(DateTime(timezone=True))
+
+class CodeSequence(Base):
+    """Счетчик для выделения блоков номеров коротких кодов (массовый импорт)"""
+    __tablename__ = "code_sequences"
+    __allow_unmapped__ = True
+
+    name = Column(String(50), primary_key=True)
+    next_value = Column(BigInteger)
+
+class ImportJob(Base):
+    """Задача массового импорта ссылок: прогресс по зафиксированным пачкам"""
+    __tablename__ = "import_jobs"
+    __allow_unmapped__ = True
+
+    id = Column(String(32), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    path = Column(String(1024))
+    format = Column(String(10))
+    batch_size = Column(Integer)
+    status = Column(String(20), default="pending")
+    rows_read = Column(Integer, default=0)
+    rows_imported = Column(Integer, default=0)
+    rows_rejected = Column(Integer, default=0)
+    batches_committed = Column(Integer, default=0)
+    # Блок кодов пачки, которая пишется сейчас: при возобновлении пачка получает те же коды
+    pending_block = Column(BigInteger, nullable=True)
+    errors = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), nullable=True)
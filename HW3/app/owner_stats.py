@@ -0,0 +1,208 @@
+"""
+Сводная статистика ссылок владельца
+
+Количество ссылок по состояниям, сумма переходов и переходы за сегодня
+считаются одним запросом с GROUP BY по объединению links, expired_links
+и дневных агрегатов click_rollups; самые популярные ссылки - вторым
+запросом. Результат кэшируется по владельцу на OWNER_STATS_TTL секунд
+и сбрасывается после фиксации изменений его ссылок (app.changes).
+
+Для владельцев, у которых на источнике не меньше OWNER_SUMMARY_MIN_LINKS
+ссылок, сводка хранится в owner_summaries. Ее пересчитывают свертка
+переходов (app.clicks) и задачи очистки, а расчет при промахе кэша
+берет сводку вместо запроса по всем ссылкам, пока она не старше
+OWNER_SUMMARY_MAX_AGE секунд.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import and_, case, func, literal, select, union_all
+from sqlalchemy.orm import Session
+from . import models
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+OWNER_STATS_TOP_N = int(os.getenv("OWNER_STATS_TOP_N", "10"))
+OWNER_SUMMARY_MIN_LINKS = int(os.getenv("OWNER_SUMMARY_MIN_LINKS", "10000"))
+OWNER_SUMMARY_MAX_AGE = float(os.getenv("OWNER_SUMMARY_MAX_AGE", "300"))
+# Свертка переходов пересчитывает сводку не чаще раза в OWNER_SUMMARY_REFRESH_SECONDS
+OWNER_SUMMARY_REFRESH_SECONDS = float(os.getenv("OWNER_SUMMARY_REFRESH_SECONDS", "60"))
+
+LINK_STATES = ("active", "expired", "inactive")
+COUNTERS = ("active_links", "expired_links", "inactive_links", "archived_links", "total_clicks", "clicks_today")
+
+
+def _today(now: datetime) -> datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def compute(db: Session, owner_id: int, now: Optional[datetime] = None, top_n: int = OWNER_STATS_TOP_N) -> Dict[str, Any]:
+    """
+    Статистика владельца на одном источнике по ссылкам
+
+    Returns:
+        Счетчики COUNTERS и top_links - список [короткий код, переходы]
+    """
+    from .clicks import rollup_of_link
+
+    now = now or datetime.now()
+    state = case(
+        (and_(models.Link.expires_at.isnot(None), models.Link.expires_at < now), literal("expired")),
+        (models.Link.is_active == True, literal("active")),
+        else_=literal("inactive"),
+    )
+    rows = union_all(
+        select(state.label("state"), models.Link.clicks.label("clicks")).where(
+            models.Link.owner_id == owner_id
+        ),
+        select(literal("archived").label("state"), models.ExpiredLink.total_clicks.label("clicks")).where(
+            models.ExpiredLink.owner_id == owner_id
+        ),
+        select(literal("today").label("state"), models.ClickRollup.clicks.label("clicks")).join(
+            models.Link, rollup_of_link(models.ClickRollup, models.Link)
+        ).where(
+            models.Link.owner_id == owner_id,
+            models.ClickRollup.granularity == "day",
+            models.ClickRollup.bucket_start == _today(now)
+        ),
+    ).subquery()
+    grouped = db.execute(
+        select(rows.c.state, func.count(), func.coalesce(func.sum(rows.c.clicks), 0)).group_by(rows.c.state)
+    ).all()
+
+    stats: Dict[str, Any] = dict.fromkeys(COUNTERS, 0)
+    for state_name, count, clicks in grouped:
+        if state_name == "today":
+            stats["clicks_today"] = int(clicks)
+            continue
+        stats[f"{state_name}_links"] = count
+        if state_name in LINK_STATES:
+            stats["total_clicks"] += int(clicks)
+
+    top = db.query(models.Link.short_code, models.Link.clicks).filter(
+        models.Link.owner_id == owner_id,
+        models.Link.is_active == True
+    ).order_by(models.Link.clicks.desc()).limit(top_n).all()
+    stats["top_links"] = [[row.short_code, row.clicks] for row in top]
+    return stats
+
+
+def _link_count(stats: Dict[str, Any]) -> int:
+    return sum(stats[f"{state}_links"] for state in LINK_STATES)
+
+
+def _from_summary(summary: models.OwnerSummary) -> Dict[str, Any]:
+    stats: Dict[str, Any] = {name: getattr(summary, name) for name in COUNTERS}
+    stats["top_links"] = json.loads(summary.top_links or "[]")
+    return stats
+
+
+def _is_fresh(summary: models.OwnerSummary, now: datetime, max_age: float) -> bool:
+    updated_at = summary.updated_at.replace(tzinfo=None)
+    # Переходы за сегодня в сводке, посчитанной вчера, не подходят
+    return updated_at >= now - timedelta(seconds=max_age) and updated_at >= _today(now)
+
+
+def source_stats(db: Session, owner_id: int, now: Optional[datetime] = None,
+                 max_age: float = OWNER_SUMMARY_MAX_AGE) -> Dict[str, Any]:
+    """Статистика владельца на источнике: из свежей сводки или расчетом по ссылкам"""
+    now = now or datetime.now()
+    summary = db.get(models.OwnerSummary, owner_id)
+    if summary is not None and _is_fresh(summary, now, max_age):
+        return _from_summary(summary)
+    return compute(db, owner_id, now)
+
+
+def merge(parts: Sequence[Dict[str, Any]], top_n: int = OWNER_STATS_TOP_N) -> Dict[str, Any]:
+    """Объединение статистики владельца с нескольких шардов"""
+    stats: Dict[str, Any] = {name: sum(part[name] for part in parts) for name in COUNTERS}
+    stats["total_links"] = _link_count(stats)
+    top = sorted((link for part in parts for link in part["top_links"]), key=lambda link: link[1], reverse=True)
+    stats["top_links"] = [{"short_code": code, "clicks": clicks} for code, clicks in top[:top_n]]
+    return stats
+
+
+def refresh_summaries(
+    db: Session,
+    owner_ids: Iterable[Optional[int]],
+    min_links: int = OWNER_SUMMARY_MIN_LINKS,
+    min_age: float = 0.0,
+) -> int:
+    """
+    Пересчет сводок владельцев с большим числом ссылок на источнике
+
+    Сводки владельцев, у которых ссылок стало меньше min_links, удаляются.
+
+    Args:
+        owner_ids: Владельцы, чьи ссылки изменились или получили переходы
+        min_age: Не пересчитывать сводки моложе min_age секунд
+
+    Returns:
+        Количество пересчитанных сводок
+    """
+    owners = sorted({owner_id for owner_id in owner_ids if owner_id is not None})
+    if not owners:
+        return 0
+    now = datetime.now()
+    large = {
+        row.owner_id for row in db.query(models.Link.owner_id).filter(
+            models.Link.owner_id.in_(owners)
+        ).group_by(models.Link.owner_id).having(func.count(models.Link.id) >= min_links)
+    }
+    summaries = {
+        summary.owner_id: summary for summary in db.query(models.OwnerSummary).filter(
+            models.OwnerSummary.owner_id.in_(owners)
+        )
+    }
+
+    refreshed = 0
+    for owner_id in owners:
+        summary = summaries.get(owner_id)
+        if owner_id not in large:
+            if summary is not None:
+                db.delete(summary)
+            continue
+        if summary is not None and _is_fresh(summary, now, min_age):
+            continue
+        stats = compute(db, owner_id, now)
+        if summary is None:
+            summary = models.OwnerSummary(owner_id=owner_id)
+            db.add(summary)
+        for name in COUNTERS:
+            setattr(summary, name, stats[name])
+        summary.top_links = json.dumps(stats["top_links"])
+        summary.updated_at = now
+        refreshed += 1
+    db.commit()
+    return refreshed
+
+
+def refresh_for_codes(db: Session, short_codes: Iterable[str], min_age: float = OWNER_SUMMARY_REFRESH_SECONDS) -> int:
+    """Пересчет сводок владельцев ссылок с новыми переходами (вызывается сверткой)"""
+    codes = sorted(set(short_codes))
+    owners = set()
+    for i in range(0, len(codes), 500):
+        owners.update(
+            row.owner_id for row in db.query(models.Link.owner_id).filter(
+                models.Link.short_code.in_(codes[i:i + 500]),
+                models.Link.owner_id.isnot(None)
+            ).distinct()
+        )
+    return refresh_summaries(db, owners, min_age=min_age)
+
+
+def owner_stats(fan_out: Callable[[Callable[[Session], Dict[str, Any]]], List[Dict[str, Any]]],
+                owner_id: int) -> Dict[str, Any]:
+    """
+    Сводная статистика владельца со всех источников
+
+    Args:
+        fan_out: Выполнение функции на каждом шарде (ShardSessions.fan_out)
+        owner_id: Идентификатор владельца
+    """
+    now = datetime.now()
+    stats = merge(fan_out(lambda db: source_stats(db, owner_id, now)))
+    stats["computed_at"] = now.isoformat()
+    return stats
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, HttpUrl, EmailStr, Field
-from typing import Optional, Union, Annotated
+from typing import List, Optional, Union, Annotated
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -39,6 +39,9 @@ class LinkStats(LinkResponse):
     last_used: Optional[datetime] = None
     expires_at: Optional[datetime] = None
     owner_id: Optional[int] = None
+    # Оценка HyperLogLog и ее относительная стандартная ошибка (только в /stats)
+    unique_visitors: Optional[int] = None
+    unique_visitors_error: Optional[float] = None
     
     model_config = {"from_attributes": True}
 
@@ -57,3 +60,47 @@ class ExpiredLinkResponse(BaseModel):
     total_clicks: int
     
     model_config = {"from_attributes": True}
+
+class TimeseriesPoint(BaseModel):
+    bucket: datetime
+    clicks: int
+
+class TopLink(BaseModel):
+    short_code: str
+    clicks: int
+
+class TopLinks(BaseModel):
+    window: str
+    source: str
+    links: List[TopLink]
+
+class OwnerStats(BaseModel):
+    total_links: int
+    active_links: int
+    expired_links: int
+    inactive_links: int
+    archived_links: int
+    total_clicks: int
+    clicks_today: int
+    top_links: List[TopLink]
+    computed_at: datetime
+
+class LinkTimeseries(BaseModel):
+    short_code: str
+    granularity: str
+    start: datetime
+    end: datetime
+    total: int
+    points: List[TimeseriesPoint]
+
+class ImportJobStatus(BaseModel):
+    id: str
+    status: str
+    format: str
+    rows_read: int
+    rows_imported: int
+    rows_rejected: int
+    batches_committed: int
+    errors: List[str]
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,239 @@
+"""
+Запуск сервера в продакшене
+
+Число воркеров подбирается по доступным процессорам с учетом cgroup,
+приложение загружается в мастер-процессе до fork (preload), после чего
+gc.freeze() переносит объекты в постоянное поколение: сборщик мусора
+воркеров не трогает их и страницы памяти остаются общими (copy-on-write).
+
+Пример запуска:
+    python -m app.server --bind 0.0.0.0:8000
+    WEB_CONCURRENCY=8 python -m app.server --max-requests 5000
+    python -m app.server --print-config
+"""
+from typing import Any, Callable, Dict, Optional, Sequence
+import argparse
+import gc
+import importlib.util
+import json
+import logging
+import math
+import os
+import subprocess
+import sys
+
+try:
+    from uvicorn.workers import UvicornWorker
+except ImportError:  # gunicorn недоступен (Windows)
+    UvicornWorker = None
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = "app.main:app"
+
+_refresher: Optional[subprocess.Popen] = None
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).lower() in ("true", "1", "t")
+
+
+def _cgroup_cpu_limit(root: str = "/sys/fs/cgroup") -> Optional[float]:
+    """Ограничение CPU из cgroup v2 (cpu.max) или v1 (cfs_quota_us / cfs_period_us)"""
+    try:
+        with open(os.path.join(root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, "cpu", "cpu.cfs_quota_us")) as f:
+            quota = int(f.read())
+        with open(os.path.join(root, "cpu", "cpu.cfs_period_us")) as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus(cgroup_root: str = "/sys/fs/cgroup") -> int:
+    """Число процессоров, доступных процессу: привязка к ядрам и квота cgroup"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit(cgroup_root)
+    if limit:
+        cpus = min(cpus, max(1, math.ceil(limit)))
+    return max(1, cpus)
+
+
+def default_workers(cpus: Optional[int] = None) -> int:
+    """
+    Число воркеров
+
+    WEB_CONCURRENCY задает его явно, иначе WORKERS_PER_CORE (по умолчанию 1)
+    воркеров на доступное ядро, но не меньше 2 и не больше MAX_WORKERS.
+    Воркеры асинхронные, поэтому больше одного на ядро обычно не нужно.
+    """
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    cpus = cpus or available_cpus()
+    workers = max(2, int(cpus * float(os.getenv("WORKERS_PER_CORE", "1"))))
+    max_workers = int(os.getenv("MAX_WORKERS", "0"))
+    return min(workers, max_workers) if max_workers > 0 else workers
+
+
+def event_loop_options() -> Dict[str, str]:
+    """uvloop и httptools, если установлены, иначе asyncio и h11"""
+    return {
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    }
+
+
+if UvicornWorker is not None:
+    class FastWorker(UvicornWorker):
+        """Воркер uvicorn с явным выбором uvloop/httptools"""
+
+        CONFIG_KWARGS = {**UvicornWorker.CONFIG_KWARGS, **event_loop_options()}
+
+
+def freeze_heap(server: Any = None) -> None:
+    """Сборка мусора и заморозка объектов мастера перед fork воркеров"""
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects before forking workers")
+
+
+def start_table_refresher(server: Any = None) -> None:
+    """Один процесс обновления общей таблицы ссылок на хост (см. app.shared_table)"""
+    global _refresher
+    if _refresher is None or _refresher.poll() is not None:
+        _refresher = subprocess.Popen([sys.executable, "-m", "app.shared_table"])
+        logger.info(f"Started shared link table refresher (pid {_refresher.pid})")
+
+
+def stop_table_refresher(server: Any = None) -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.terminate()
+        try:
+            _refresher.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            _refresher.kill()
+        _refresher = None
+
+
+def _chain(hooks: Sequence[Callable[[Any], None]]) -> Callable[[Any], None]:
+    if len(hooks) == 1:
+        return hooks[0]
+
+    def run(server: Any) -> None:
+        for hook in hooks:
+            hook(server)
+    return run
+
+
+def build_options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Настройки gunicorn"""
+    options: Dict[str, Any] = {
+        "bind": args.bind,
+        "workers": args.workers or default_workers(),
+        "worker_class": "app.server.FastWorker",
+        "preload_app": args.preload,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "timeout": args.timeout,
+        "graceful_timeout": args.timeout,
+        "keepalive": args.keepalive,
+        "loglevel": os.getenv("LOG_LEVEL", "info").lower(),
+    }
+    ready_hooks = []
+    if args.preload and args.gc_freeze:
+        ready_hooks.append(freeze_heap)
+    if args.shared_table:
+        ready_hooks.append(start_table_refresher)
+        options["on_exit"] = stop_table_refresher
+    if ready_hooks:
+        options["when_ready"] = _chain(ready_hooks)
+    return options
+
+
+def run_gunicorn(options: Dict[str, Any], app_path: str = APP_PATH) -> None:
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    class Application(BaseApplication):
+        def load_config(self) -> None:
+            for key, value in options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self) -> Callable:
+            return import_app(app_path)
+
+    Application().run()
+
+
+def run_single(options: Dict[str, Any], app_path: str = APP_PATH) -> None:
+    """
+    Один процесс uvicorn без gunicorn (Windows или WEB_CONCURRENCY=1)
+
+    max_requests здесь не применяется: процесс некому перезапустить,
+    и после N запросов сервер просто завершился бы.
+    """
+    import uvicorn
+
+    host, _, port = options["bind"].rpartition(":")
+    uvicorn.run(app_path, host=host or "0.0.0.0", port=int(port), timeout_keep_alive=options["keepalive"],
+                **event_loop_options())
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Запуск API с gunicorn и воркерами uvicorn")
+    parser.add_argument("--app", default=os.getenv("APP_MODULE", APP_PATH),
+                        help="Приложение ASGI, например app.edge:app для узла перенаправлений")
+    parser.add_argument("--bind", default=os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}"))
+    parser.add_argument("--workers", type=int, default=None, help="По умолчанию по числу доступных ядер")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("MAX_REQUESTS", "10000")),
+                        help="Перезапуск воркера после N запросов, 0 отключает")
+    parser.add_argument("--max-requests-jitter", type=int, default=None,
+                        help="Случайная добавка к --max-requests, по умолчанию 10%%")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WORKER_TIMEOUT", "30")))
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("KEEPALIVE", "5")))
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        default=_env_bool("PRELOAD_APP", True))
+    parser.add_argument("--no-gc-freeze", dest="gc_freeze", action="store_false",
+                        default=_env_bool("GC_FREEZE", True))
+    parser.add_argument("--no-shared-table", dest="shared_table", action="store_false",
+                        default=bool(os.getenv("SHARED_TABLE_PATH")),
+                        help="Не запускать обновление общей таблицы ссылок (включено при SHARED_TABLE_PATH)")
+    parser.add_argument("--print-config", action="store_true", help="Вывести настройки и выйти")
+    args = parser.parse_args(argv)
+    if args.max_requests_jitter is None:
+        args.max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", str(args.max_requests // 10)))
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    args = parse_args(argv)
+    options = build_options(args)
+    if args.print_config:
+        printable = {key: value for key, value in options.items() if not callable(value)}
+        print(json.dumps({**printable, "cpus": available_cpus(), **event_loop_options()}, indent=2))
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if options["workers"] <= 1 or UvicornWorker is None:
+        run_single(options, args.app)
+    else:
+        run_gunicorn(options, args.app)
+
+
+if __name__ == "__main__":
+    main()
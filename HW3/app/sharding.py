@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, Iterator, List, TypeVar
+from fastapi import Depends
+from sqlalchemy import ForeignKeyConstraint, MetaData
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+from .config import SHARD_DATABASE_URLS
+from .database import SessionLocal, create_instrumented_engine, get_db, get_read_db
+from . import models
+import logging
+import zlib
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Таблицы, которые хранятся на шардах; пользователи остаются в основной БД.
+# Журнал изменений и переходы лежат на шарде ссылки, журнал пишется в одной транзакции с ней
+SHARDED_TABLES = (
+    models.Link.__table__,
+    models.ExpiredLink.__table__,
+    models.LinkChange.__table__,
+    models.ClickEvent.__table__,
+    models.ClickRollup.__table__,
+    models.ClickRollupCursor.__table__,
+    models.VisitorSketch.__table__,
+    models.OwnerSummary.__table__,
+)
+
+
+def shard_index(short_code: str, shard_count: int) -> int:
+    """Номер шарда для короткого кода (стабильный CRC32, не зависит от процесса)"""
+    return zlib.crc32(short_code.encode("utf-8")) % shard_count
+
+
+def _shard_metadata() -> MetaData:
+    """
+    Схема таблиц шарда без внешних ключей на users
+
+    Пользователи хранятся в основной БД, поэтому ссылка на владельца
+    на шарде не может быть внешним ключом.
+    """
+    metadata = MetaData()
+    for table in SHARDED_TABLES:
+        copy = table.to_metadata(metadata)
+        for constraint in [c for c in copy.constraints if isinstance(c, ForeignKeyConstraint)]:
+            copy.constraints.discard(constraint)
+        copy.foreign_keys.clear()
+        for column in copy.columns:
+            column.foreign_keys.clear()
+    return metadata
+
+
+class ShardSet:
+    """
+    Набор шардов таблицы ссылок
+
+    Ссылка хранится на шарде shard_index(short_code, N). Пустой набор
+    означает, что шардирование выключено и ссылки лежат в основной БД.
+    """
+
+    def __init__(self, engines: List[Engine]) -> None:
+        self.engines = engines
+        self.session_factories = [
+            sessionmaker(autocommit=False, autoflush=False, bind=engine) for engine in engines
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    def index_for(self, short_code: str) -> int:
+        return shard_index(short_code, len(self.engines))
+
+    def create_all(self) -> None:
+        metadata = _shard_metadata()
+        for engine in self.engines:
+            metadata.create_all(bind=engine)
+
+
+shards = ShardSet([create_instrumented_engine(url, f"shard{i}") for i, url in enumerate(SHARD_DATABASE_URLS)])
+
+
+def session_factories() -> List[Callable[[], Session]]:
+    """Фабрики сессий шардов ссылок или основной БД без шардирования"""
+    if shards.enabled:
+        return list(shards.session_factories)
+    return [SessionLocal]
+
+
+class ShardSessions:
+    """
+    Сессии шардов в рамках одного запроса
+
+    Точечные запросы по short_code получают сессию ровно одного шарда
+    (открывается при первом обращении). Запросы по пользователю
+    выполняются на всех шардах параллельно, каждый шард в своем потоке
+    со своей сессией. Без шардов все методы работают с сессиями запроса.
+    """
+
+    def __init__(self, shard_set: ShardSet, db: Session, read_db: Session) -> None:
+        self.shard_set = shard_set
+        self.db = db
+        self.read_db = read_db
+        self._sessions: Dict[int, Session] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_set.enabled
+
+    def session_for(self, short_code: str) -> Session:
+        """Сессия шарда, на котором хранится (или будет храниться) short_code"""
+        if not self.enabled:
+            return self.db
+        index = self.shard_set.index_for(short_code)
+        if index not in self._sessions:
+            self._sessions[index] = self.shard_set.session_factories[index]()
+        return self._sessions[index]
+
+    def read_session_for(self, short_code: str) -> Session:
+        """Сессия для чтения short_code: реплика без шардов, иначе шард"""
+        if not self.enabled:
+            return self.read_db
+        return self.session_for(short_code)
+
+    def fan_out(self, fn: Callable[[Session], T], write: bool = False) -> List[T]:
+        """
+        Выполнение fn на каждом шарде параллельно
+
+        Args:
+            fn: Функция, получающая сессию шарда
+            write: Функция изменяет данные (без шардов - сессия основной БД вместо реплики)
+
+        Returns:
+            Результаты fn в порядке шардов
+        """
+        if not self.enabled:
+            return [fn(self.db if write else self.read_db)]
+        return run_on_shards(self.shard_set, fn)
+
+    def each_source(self) -> Iterator[Session]:
+        """
+        Сессии для последовательного чтения всех шардов (потоковая выгрузка)
+
+        Сессия шарда открывается перед чтением и закрывается после него;
+        без шардов - сессия чтения запроса.
+        """
+        if not self.enabled:
+            yield self.read_db
+            return
+        for factory in self.shard_set.session_factories:
+            session = factory()
+            try:
+                yield session
+            finally:
+                session.close()
+
+    def commit(self) -> None:
+        if not self.enabled:
+            self.db.commit()
+            return
+        for session in self._sessions.values():
+            session.commit()
+
+    def rollback(self) -> None:
+        if not self.enabled:
+            self.db.rollback()
+            return
+        for session in self._sessions.values():
+            session.rollback()
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+def run_on_shards(shard_set: ShardSet, fn: Callable[[Session], T]) -> List[T]:
+    """Выполнение fn на всех шардах в отдельных потоках с собственными сессиями"""
+
+    def run(factory: Callable[[], Session]) -> T:
+        session = factory()
+        try:
+            return fn(session)
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=len(shard_set.session_factories)) as executor:
+        return list(executor.map(run, shard_set.session_factories))
+
+
+def get_shards(
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db)
+) -> Generator[ShardSessions, None, None]:
+    sessions = ShardSessions(shards, db, read_db)
+    try:
+        yield sessions
+    finally:
+        sessions.close()
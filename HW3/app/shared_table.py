@@ -0,0 +1,335 @@
+"""
+Общая для воркеров таблица популярных ссылок в файле, отображенном в память
+
+Один процесс обновления строит из БД хеш-таблицу с открытой адресацией
+(short_code -> URL, признак активности, срок действия), записывает ее
+во временный файл и атомарно подменяет файл через os.replace. Воркеры
+отображают файл в память только для чтения: на хосте одна копия таблицы
+в страничном кэше, поиск не обращается ни к Redis, ни к БД.
+
+Формат файла:
+    заголовок: magic, версия, емкость (степень двойки), число записей, время построения
+    слоты по 32 байта: CRC32 кода, смещение и длина кода, флаги, смещение и длина URL, срок действия
+    строки кодов и URL
+
+Пример запуска:
+    python -m app.shared_table --path /dev/shm/links.table --interval 30
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from .config import SHARED_TABLE_MAX_LINKS, SHARED_TABLE_PATH, SHARED_TABLE_REFRESH_SECONDS
+from .metrics import registry as metrics_registry
+import argparse
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SLT1"
+VERSION = 1
+HEADER = struct.Struct("<4sIIId")
+SLOT = struct.Struct("<QIHHIId")
+
+OCCUPIED = 1
+ACTIVE = 2
+
+lookups = metrics_registry.counter("shared_table_lookups_total", "Shared link table lookups by result")
+table_entries = metrics_registry.gauge("shared_table_entries", "Links in the shared link table")
+table_age = metrics_registry.gauge("shared_table_age_seconds", "Seconds since the shared link table was built")
+
+
+class Entry(NamedTuple):
+    short_code: str
+    original_url: str
+    is_active: bool
+    expires_at: Optional[float]
+
+
+def _hash(short_code: bytes) -> int:
+    # CRC32 одинаков во всех процессах и быстрее криптографических хешей; коллизии разрешает сравнение кода
+    return zlib.crc32(short_code)
+
+
+def _capacity(count: int, load_factor: float) -> int:
+    capacity = 8
+    while capacity * load_factor < count:
+        capacity *= 2
+    return capacity
+
+
+def build_table(
+    path: str,
+    entries: Iterable[Entry],
+    load_factor: float = 0.5,
+    built_at: Optional[float] = None,
+) -> int:
+    """
+    Запись таблицы и атомарная подмена файла
+
+    Args:
+        path: Путь к файлу таблицы
+        entries: Записи таблицы
+        load_factor: Максимальная доля занятых слотов
+        built_at: Время чтения данных из БД (по умолчанию текущее)
+
+    Returns:
+        Количество записей
+    """
+    entries = list({entry.short_code: entry for entry in entries}.values())
+    capacity = _capacity(len(entries), load_factor)
+    mask = capacity - 1
+    slots = bytearray(capacity * SLOT.size)
+    strings = bytearray()
+    strings_offset = HEADER.size + len(slots)
+
+    for entry in entries:
+        key = entry.short_code.encode("utf-8")
+        url = entry.original_url.encode("utf-8")
+        key_offset = strings_offset + len(strings)
+        strings += key
+        url_offset = strings_offset + len(strings)
+        strings += url
+
+        key_hash = _hash(key)
+        index = key_hash & mask
+        while SLOT.unpack_from(slots, index * SLOT.size)[3] & OCCUPIED:
+            index = (index + 1) & mask
+        flags = OCCUPIED | (ACTIVE if entry.is_active else 0)
+        SLOT.pack_into(
+            slots, index * SLOT.size,
+            key_hash, key_offset, len(key), flags, url_offset, len(url), entry.expires_at or 0.0
+        )
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, capacity, len(entries), built_at or time.time()))
+        f.write(slots)
+        f.write(strings)
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+class _Mapping(NamedTuple):
+    data: Any
+    capacity: int
+    count: int
+    built_at: float
+    file_id: Tuple[int, int, int]
+
+
+class SharedLinkTable:
+    """
+    Чтение таблицы из файла, отображенного в память
+
+    Не чаще раза в check_interval секунд проверяется, не подменен ли файл;
+    новый файл отображается заново, старое отображение освобождается,
+    когда на него не остается ссылок. Коды, измененные этим процессом
+    после построения таблицы, не читаются из нее до следующего построения.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._mapping: Optional[_Mapping] = None
+        self._next_check = 0.0
+        self._invalidated: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _reload(self) -> None:
+        self._next_check = time.monotonic() + self.check_interval
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self._mapping = None
+            return
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if self._mapping is not None and self._mapping.file_id == file_id:
+            return
+
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, version, capacity, count, built_at = HEADER.unpack_from(data, 0)
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"unsupported table format {magic!r} v{version}")
+            except (OSError, ValueError, struct.error) as e:
+                logger.error(f"Cannot map shared link table {self.path}: {e}")
+                self._mapping = None
+                return
+            self._mapping = _Mapping(data, capacity, count, built_at, file_id)
+            self._invalidated = {
+                code: changed_at for code, changed_at in self._invalidated.items() if changed_at >= built_at
+            }
+        table_entries.set(count)
+        table_age.set_function(lambda: round(time.time() - built_at, 3))
+        logger.info(f"Mapped shared link table {self.path}: {count} links")
+
+    def lookup(self, short_code: str) -> Optional[Entry]:
+        """Запись таблицы или None, если кода в ней нет"""
+        if time.monotonic() >= self._next_check:
+            self._reload()
+        mapping = self._mapping
+        if mapping is None:
+            return None
+        changed_at = self._invalidated.get(short_code)
+        if changed_at is not None and changed_at >= mapping.built_at:
+            return None
+
+        data = mapping.data
+        key = short_code.encode("utf-8")
+        key_hash = _hash(key)
+        mask = mapping.capacity - 1
+        index = key_hash & mask
+        while True:
+            slot_hash, key_offset, key_length, flags, url_offset, url_length, expires_at = SLOT.unpack_from(
+                data, HEADER.size + index * SLOT.size
+            )
+            if not flags & OCCUPIED:
+                return None
+            if slot_hash == key_hash and data[key_offset:key_offset + key_length] == key:
+                return Entry(
+                    short_code,
+                    data[url_offset:url_offset + url_length].decode("utf-8"),
+                    bool(flags & ACTIVE),
+                    expires_at or None,
+                )
+            index = (index + 1) & mask
+
+    def get_url(self, short_code: str) -> Tuple[Optional[str], bool]:
+        """
+        URL активной ссылки из таблицы
+
+        Returns:
+            (URL или None, известно ли, что ссылка удалена)
+        """
+        entry = self.lookup(short_code)
+        if entry is None or (entry.expires_at is not None and entry.expires_at < time.time()):
+            # Истекшие ссылки обрабатывает обычный путь: он переносит их в архив
+            self.misses += 1
+            return None, False
+        self.hits += 1
+        if not entry.is_active:
+            return None, True
+        return entry.original_url, False
+
+    def invalidate(self, short_code: str) -> None:
+        """Не читать код из текущей таблицы: ссылка изменена этим процессом"""
+        self._invalidated[short_code] = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        mapping = self._mapping
+        if mapping is None:
+            return {"path": self.path, "mapped": False}
+        return {
+            "path": self.path,
+            "mapped": True,
+            "entries": mapping.count,
+            "capacity": mapping.capacity,
+            "built_at": datetime.fromtimestamp(mapping.built_at).isoformat(),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+link_table = SharedLinkTable(SHARED_TABLE_PATH) if SHARED_TABLE_PATH else None
+
+if link_table:
+    lookups.set_function(lambda: link_table.hits, {"result": "hit"})
+    lookups.set_function(lambda: link_table.misses, {"result": "miss"})
+
+
+def _hot_entries(db: Session, limit: int, hot_codes: Sequence[str] = ()) -> List[Entry]:
+    from . import models, warmup
+
+    query = db.query(
+        models.Link.short_code, models.Link.original_url, models.Link.is_active, models.Link.expires_at
+    )
+    rows = warmup.leaderboard_first(query, hot_codes, limit)
+    return [
+        Entry(row.short_code, row.original_url, bool(row.is_active),
+              row.expires_at.timestamp() if row.expires_at else None)
+        for row in rows
+    ]
+
+
+def refresh_table(
+    path: str = SHARED_TABLE_PATH,
+    max_links: int = SHARED_TABLE_MAX_LINKS,
+    session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+) -> Dict[str, Any]:
+    """
+    Построение таблицы из самых популярных ссылок
+
+    Сначала берутся ссылки из рейтинга за последний день (app.leaderboard),
+    затем самые популярные по БД. Деактивированные ссылки из этого набора
+    попадают в таблицу без признака активности, и воркеры отвечают 404
+    без запроса к БД. При шардировании каждый шард дает равную долю от max_links.
+
+    Returns:
+        Количество записей и затраченное время
+    """
+    from .leaderboard import hot_codes
+    from . import sharding
+
+    factories = list(session_factories or sharding.session_factories())
+    started = time.perf_counter()
+    # Изменения, сделанные воркерами во время чтения, не должны считаться учтенными
+    read_at = time.time()
+    entries: List[Entry] = []
+    codes = hot_codes(max_links)
+    for factory in factories:
+        db = factory()
+        try:
+            entries.extend(_hot_entries(db, max(1, max_links // len(factories)), codes))
+        finally:
+            db.close()
+    count = build_table(path, entries, built_at=read_at)
+    return {"links": count, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def run_refresher(
+    path: str = SHARED_TABLE_PATH,
+    interval: float = SHARED_TABLE_REFRESH_SECONDS,
+    max_links: int = SHARED_TABLE_MAX_LINKS,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """Периодическое перестроение таблицы до установки stop"""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            result = refresh_table(path, max_links)
+            logger.info(f"Shared link table rebuilt: {result['links']} links in {result['seconds']}s")
+        except Exception as e:
+            logger.error(f"Shared link table refresh failed: {e}")
+        stop.wait(interval)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Построение общей таблицы популярных ссылок")
+    parser.add_argument("--path", default=SHARED_TABLE_PATH, required=not SHARED_TABLE_PATH)
+    parser.add_argument("--interval", type=float, default=SHARED_TABLE_REFRESH_SECONDS)
+    parser.add_argument("--max-links", type=int, default=SHARED_TABLE_MAX_LINKS)
+    parser.add_argument("--once", action="store_true", help="Построить таблицу один раз и выйти")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    from .cache import init_redis
+    init_redis()
+    if args.once:
+        result = refresh_table(args.path, args.max_links)
+        logger.info(f"Shared link table built: {result['links']} links in {result['seconds']}s")
+        return
+    run_refresher(args.path, args.interval, args.max_links)
+
+
+if __name__ == "__main__":
+    main()
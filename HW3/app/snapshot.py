@@ -0,0 +1,333 @@
+"""
+Снимки ссылок для узлов, которые только перенаправляют
+
+Полный снимок содержит активные ссылки (short_code, original_url, expires_at),
+отсортированные по коду и разбитые на блоки, сжатые zlib. В конце файла
+лежит индекс блоков (первый код, смещение, длина), поэтому отдельный код
+можно найти, распаковав один блок. Дельта имеет тот же формат и содержит
+текущее состояние ссылок, упомянутых в журнале изменений (app.changes)
+после предыдущего файла: активные - с URL, остальные - как удаленные.
+Номера последних учтенных записей журнала хранятся в индексе файла.
+
+Пример запуска:
+    python -m app.snapshot --dir /var/lib/edge            # полный снимок
+    python -m app.snapshot --dir /var/lib/edge --delta    # дельта к последнему снимку
+"""
+from bisect import bisect_right
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+import argparse
+import json
+import logging
+import os
+import re
+import struct
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"LSNP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHdd")
+FOOTER = struct.Struct("<QI4s")
+
+SNAPSHOT = 0
+DELTA = 1
+
+SNAPSHOT_BLOCK_SIZE = int(os.getenv("SNAPSHOT_BLOCK_SIZE", "1024"))
+
+_FILE_NAME = re.compile(r"^(snapshot|delta)-(\d+)(?:-(\d+))?\.snap$")
+
+
+class Record(NamedTuple):
+    short_code: str
+    original_url: Optional[str]  # None - ссылка удалена (только в дельтах)
+    expires_at: Optional[float]
+
+
+def _encode(records: Sequence[Record]) -> bytes:
+    lines = [
+        f"{r.short_code}\t{r.original_url or ''}\t{r.expires_at if r.expires_at is not None else ''}"
+        for r in records
+    ]
+    return zlib.compress("\n".join(lines).encode("utf-8"))
+
+
+def _decode(block: bytes) -> List[Record]:
+    records = []
+    for line in zlib.decompress(block).decode("utf-8").split("\n"):
+        short_code, url, expires_at = line.split("\t")
+        records.append(Record(short_code, url or None, float(expires_at) if expires_at else None))
+    return records
+
+
+def write_file(
+    path: str,
+    records: Iterable[Record],
+    kind: int = SNAPSHOT,
+    created_at: Optional[float] = None,
+    base: float = 0.0,
+    block_size: int = SNAPSHOT_BLOCK_SIZE,
+    cursors: Optional[Sequence[int]] = None,
+) -> int:
+    """
+    Запись снимка или дельты с атомарной подменой файла
+
+    Args:
+        path: Путь к файлу
+        records: Записи (порядок не важен, при повторе кода остается последняя)
+        kind: SNAPSHOT или DELTA
+        created_at: Момент, на который получены данные
+        base: created_at снимка, к которому относится дельта
+        cursors: Последние учтенные записи журнала изменений каждого источника
+
+    Returns:
+        Количество записей
+    """
+    ordered = sorted({r.short_code: r for r in records}.values())
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    index = []
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, kind, created_at or time.time(), base))
+        for i in range(0, len(ordered), block_size):
+            chunk = ordered[i:i + block_size]
+            data = _encode(chunk)
+            index.append([chunk[0].short_code, f.tell(), len(data)])
+            f.write(data)
+        index_offset = f.tell()
+        meta = {"count": len(ordered), "blocks": index, "cursors": list(cursors or [])}
+        index_data = zlib.compress(json.dumps(meta).encode("utf-8"))
+        f.write(index_data)
+        f.write(FOOTER.pack(index_offset, len(index_data), MAGIC))
+    os.replace(tmp_path, path)
+    return len(ordered)
+
+
+class SnapshotFile:
+    """Чтение снимка или дельты: заголовок, индекс и блоки по требованию"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, self.kind, self.created_at, self.base = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: unsupported snapshot format {magic!r} v{version}")
+            f.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, index_length, magic = FOOTER.unpack(f.read(FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: truncated snapshot")
+            f.seek(index_offset)
+            index = json.loads(zlib.decompress(f.read(index_length)))
+        self.count: int = index["count"]
+        self.cursors: List[int] = index.get("cursors", [])
+        self.blocks: List[Tuple[str, int, int]] = [tuple(block) for block in index["blocks"]]
+        self._first_codes = [block[0] for block in self.blocks]
+
+    def _read_block(self, f: Any, block: Tuple[str, int, int]) -> List[Record]:
+        f.seek(block[1])
+        return _decode(f.read(block[2]))
+
+    def get(self, short_code: str) -> Optional[Record]:
+        """Поиск кода по индексу с распаковкой одного блока"""
+        position = bisect_right(self._first_codes, short_code) - 1
+        if position < 0:
+            return None
+        with open(self.path, "rb") as f:
+            for record in self._read_block(f, self.blocks[position]):
+                if record.short_code == short_code:
+                    return record
+        return None
+
+    def __iter__(self) -> Iterator[Record]:
+        with open(self.path, "rb") as f:
+            for block in self.blocks:
+                yield from self._read_block(f, block)
+
+
+def snapshot_name(created_at: float) -> str:
+    return f"snapshot-{int(created_at * 1000)}.snap"
+
+
+def delta_name(base: float, created_at: float) -> str:
+    return f"delta-{int(base * 1000)}-{int(created_at * 1000)}.snap"
+
+
+def latest_files(directory: str) -> Tuple[Optional[str], List[str]]:
+    """
+    Последний полный снимок в каталоге и его дельты по порядку
+
+    Returns:
+        (имя снимка или None, имена дельт)
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return None, []
+    snapshots: List[Tuple[int, str]] = []
+    deltas: Dict[int, List[Tuple[int, str]]] = {}
+    for name in names:
+        match = _FILE_NAME.match(name)
+        if not match:
+            continue
+        if match.group(1) == "snapshot":
+            snapshots.append((int(match.group(2)), name))
+        else:
+            deltas.setdefault(int(match.group(2)), []).append((int(match.group(3)), name))
+    if not snapshots:
+        return None, []
+    base, latest = max(snapshots)
+    return latest, [name for _, name in sorted(deltas.get(base, []))]
+
+
+def _record(row: Any) -> Record:
+    return Record(row.short_code, row.original_url, row.expires_at.timestamp() if row.expires_at else None)
+
+
+def _link_query(db: Session) -> Any:
+    from . import models
+
+    return db.query(models.Link.short_code, models.Link.original_url, models.Link.expires_at).filter(
+        models.Link.is_active == True
+    )
+
+
+def _changed_records(db: Session, after_id: int) -> Tuple[List[Record], int]:
+    """
+    Текущее состояние ссылок из журнала изменений после after_id и новый курсор
+
+    Курсор не продвигается за пропуски в номерах записей (changes.settled_id):
+    записи после него войдут и в следующую дельту, что безопасно, потому что
+    дельта хранит текущее состояние ссылок, а не сами изменения.
+    """
+    from . import changes, models
+
+    codes = set()
+    settled = after_id
+    while True:
+        batch = changes.read_changes(db, after_id)
+        if not batch:
+            break
+        codes.update(change.short_code for change in batch)
+        if settled == after_id:
+            settled = changes.settled_id(settled, batch)
+        after_id = batch[-1].id
+
+    records: Dict[str, Record] = {code: Record(code, None, None) for code in codes}
+    ordered = sorted(codes)
+    for i in range(0, len(ordered), SNAPSHOT_BLOCK_SIZE):
+        for row in _link_query(db).filter(models.Link.short_code.in_(ordered[i:i + SNAPSHOT_BLOCK_SIZE])):
+            records[row.short_code] = _record(row)
+    return list(records.values()), settled
+
+
+def _journal_pruned(db: Session, after_id: int) -> bool:
+    """
+    Удалены ли записи журнала после after_id (changes.prune)
+
+    Журнал после курсора цел, только если сохранилась запись after_id или
+    следующая за ней. Пустой журнал при ненулевом курсоре тоже считается
+    усеченным: номера записей могут начаться заново.
+    """
+    from .changes import oldest_id
+
+    oldest = oldest_id(db)
+    if oldest is None:
+        return after_id > 0
+    return oldest > after_id + 1
+
+
+def export_snapshot(
+    directory: str,
+    session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+) -> Dict[str, Any]:
+    """
+    Полный снимок активных ссылок (со всех шардов)
+
+    Returns:
+        Имя файла, количество ссылок и затраченное время
+    """
+    from . import sharding
+    from .changes import latest_id
+
+    started = time.perf_counter()
+    created_at = time.time()
+    records: List[Record] = []
+    cursors: List[int] = []
+    for factory in session_factories or sharding.session_factories():
+        db = factory()
+        try:
+            # Журнал читается до ссылок: изменения во время выгрузки попадут в следующую дельту
+            cursors.append(latest_id(db))
+            records.extend(_record(row) for row in _link_query(db).yield_per(SNAPSHOT_BLOCK_SIZE))
+        finally:
+            db.close()
+
+    os.makedirs(directory, exist_ok=True)
+    name = snapshot_name(created_at)
+    count = write_file(os.path.join(directory, name), records, SNAPSHOT, created_at, cursors=cursors)
+    return {"file": name, "links": count, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def export_delta(
+    directory: str,
+    session_factories: Optional[Sequence[Callable[[], Session]]] = None,
+) -> Dict[str, Any]:
+    """
+    Дельта с момента последнего снимка или дельты по журналу изменений
+
+    Если журнал какого-либо источника уже очищен дальше курсора предыдущего
+    файла, дельта была бы неполной: вместо нее выгружается полный снимок.
+
+    Returns:
+        Имя файла, количество записей и затраченное время
+    """
+    from . import sharding
+
+    snapshot, deltas = latest_files(directory)
+    if snapshot is None:
+        raise FileNotFoundError(f"No snapshot in {directory}, export a full snapshot first")
+    base = SnapshotFile(os.path.join(directory, snapshot))
+    previous = SnapshotFile(os.path.join(directory, deltas[-1])) if deltas else base
+
+    started = time.perf_counter()
+    created_at = time.time()
+    factories = list(session_factories or sharding.session_factories())
+    after_ids = previous.cursors or [0] * len(factories)
+    records: List[Record] = []
+    cursors: List[int] = []
+    for index, (factory, after_id) in enumerate(zip(factories, after_ids)):
+        db = factory()
+        try:
+            changed, cursor = _changed_records(db, after_id)
+            # Проверка после чтения: записи, удаленные во время чтения, тоже будут замечены
+            pruned = _journal_pruned(db, after_id)
+        finally:
+            db.close()
+        if pruned:
+            logger.warning(
+                f"Change journal of source {index} is pruned past cursor {after_id}, "
+                f"exporting a full snapshot instead of a delta"
+            )
+            return export_snapshot(directory, factories)
+        records.extend(changed)
+        cursors.append(cursor)
+
+    name = delta_name(base.created_at, created_at)
+    count = write_file(os.path.join(directory, name), records, DELTA, created_at, base.created_at, cursors=cursors)
+    return {"file": name, "links": count, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Экспорт снимка ссылок для узлов перенаправления")
+    parser.add_argument("--dir", required=True, help="Каталог снимков")
+    parser.add_argument("--delta", action="store_true", help="Дельта к последнему снимку вместо полного снимка")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    result = export_delta(args.dir) if args.delta else export_snapshot(args.dir)
+    logger.info(f"Exported {result['file']}: {result['links']} links in {result['seconds']}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import or_
+from sqlalchemy.orm import Query, Session
+from . import models, cache, leaderboard, sharding
+from .config import TESTING
+import logging
+import os
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.getenv("CACHE_WARMUP_ON_STARTUP", str(not TESTING)).lower() in ("true", "1", "t")
+WARMUP_TOP_N = int(os.getenv("CACHE_WARMUP_TOP_N", "10000"))
+WARMUP_CHUNK_SIZE = int(os.getenv("CACHE_WARMUP_CHUNK_SIZE", "500"))
+WARMUP_CONCURRENCY = int(os.getenv("CACHE_WARMUP_CONCURRENCY", "2"))
+WARMUP_RECENT_DAYS = int(os.getenv("CACHE_WARMUP_RECENT_DAYS", "7"))
+REDIS_WATCH_INTERVAL = float(os.getenv("REDIS_WATCH_INTERVAL", "5"))
+
+_warmup_lock = threading.Lock()
+last_warmup: Dict[str, Any] = {}
+
+# Сброшено, пока идет прогрев при запуске; до этого /readyz не принимает трафик
+startup_complete = threading.Event()
+startup_complete.set()
+
+
+def hotness_order(recent_days: int = WARMUP_RECENT_DAYS) -> Tuple[Any, ...]:
+    """
+    Порядок ссылок по популярности
+
+    Сначала идут ссылки, использованные за последние recent_days дней,
+    внутри групп - по количеству кликов и времени последнего перехода.
+    Ссылки без переходов (last_used IS NULL) идут последними и в PostgreSQL,
+    где NULL при DESC по умолчанию сортируется первым.
+    """
+    recently_used = models.Link.last_used >= datetime.now() - timedelta(days=recent_days)
+    return (recently_used.desc().nulls_last(), models.Link.clicks.desc(), models.Link.last_used.desc().nulls_last())
+
+
+def leaderboard_first(query: Query, hot_codes: Sequence[str], limit: int,
+                      recent_days: int = WARMUP_RECENT_DAYS) -> List[Any]:
+    """
+    Строки запроса ссылок: сначала коды из рейтинга (app.leaderboard) в его порядке,
+    затем остальные по hotness_order
+
+    Args:
+        query: Запрос к ссылкам, выбирающий в том числе short_code
+        hot_codes: Коды по убыванию популярности за последнее окно
+        limit: Количество строк
+    """
+    rank = {code: i for i, code in enumerate(hot_codes)}
+    codes = list(rank)
+    rows: List[Any] = []
+    for i in range(0, len(codes), WARMUP_CHUNK_SIZE):
+        rows.extend(query.filter(models.Link.short_code.in_(codes[i:i + WARMUP_CHUNK_SIZE])).all())
+    rows.sort(key=lambda row: rank[row.short_code])
+    rows = rows[:limit]
+    if len(rows) < limit:
+        seen = {row.short_code for row in rows}
+        rest = query.order_by(*hotness_order(recent_days)).limit(limit).all()
+        rows.extend(row for row in rest if row.short_code not in seen)
+    return rows[:limit]
+
+
+def hottest_link_ids(
+    db: Session,
+    top_n: int,
+    recent_days: int = WARMUP_RECENT_DAYS,
+    hot_codes: Sequence[str] = (),
+) -> List[int]:
+    """Идентификаторы самых популярных активных ссылок (см. leaderboard_first)"""
+    now = datetime.now()
+    query = db.query(models.Link.id, models.Link.short_code).filter(
+        models.Link.is_active == True,
+        or_(models.Link.expires_at.is_(None), models.Link.expires_at > now)
+    )
+    return [row.id for row in leaderboard_first(query, hot_codes, top_n, recent_days)]
+
+
+def _warm_chunk(ids: List[int], session_factory: Callable[[], Session]) -> int:
+    db = session_factory()
+    try:
+        links = db.query(models.Link).filter(models.Link.id.in_(ids)).all()
+        cache.set_many_links([cache.stats_from_link(link) for link in links])
+        return len(links)
+    finally:
+        db.close()
+
+
+def warm_cache(
+    top_n: int = WARMUP_TOP_N,
+    chunk_size: int = WARMUP_CHUNK_SIZE,
+    concurrency: int = WARMUP_CONCURRENCY,
+    session_factory: Optional[Callable[[], Session]] = None,
+    reason: str = "manual",
+) -> Dict[str, Any]:
+    """
+    Загрузка самых популярных ссылок в кэш
+
+    Сначала берутся ссылки из рейтинга за последний день (app.leaderboard),
+    затем самые популярные по БД. Ссылки читаются пачками по chunk_size, одновременно выполняется
+    не более concurrency запросов к БД, каждая пачка записывается
+    в кэш одним конвейером. При шардировании каждый шард дает
+    равную долю от top_n.
+
+    Args:
+        top_n: Количество ссылок
+        chunk_size: Размер пачки
+        concurrency: Максимальное число одновременных запросов к БД
+        session_factory: Фабрика сессий БД
+        reason: Причина прогрева для журнала
+
+    Returns:
+        Количество загруженных ссылок и затраченное время
+    """
+    factories = [session_factory] if session_factory else sharding.session_factories()
+    if not _warmup_lock.acquire(blocking=False):
+        logger.info("Cache warm-up is already running, skipping")
+        return {"status": "skipped", "reason": reason}
+
+    started = time.perf_counter()
+    try:
+        chunks = []
+        hot_codes = leaderboard.hot_codes(top_n)
+        for factory in factories:
+            db = factory()
+            try:
+                ids = hottest_link_ids(db, max(1, top_n // len(factories)), hot_codes=hot_codes)
+            finally:
+                db.close()
+            chunks.extend((ids[i:i + chunk_size], factory) for i in range(0, len(ids), chunk_size))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            warmed = sum(executor.map(lambda chunk: _warm_chunk(*chunk), chunks))
+
+        result = {
+            "status": "completed",
+            "reason": reason,
+            "links": warmed,
+            "chunks": len(chunks),
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        logger.info(f"Cache warm-up ({reason}) loaded {warmed} links in {result['seconds']}s")
+    except Exception as e:
+        logger.error(f"Cache warm-up failed: {str(e)}")
+        logger.error(traceback.format_exc())
+        result = {"status": "failed", "reason": reason, "error": str(e)}
+    finally:
+        _warmup_lock.release()
+
+    last_warmup.clear()
+    last_warmup.update(result, finished_at=datetime.now().isoformat())
+    return result
+
+
+def start_background_warmup(reason: str, gate_readiness: bool = False, **kwargs: Any) -> threading.Thread:
+    """
+    Запуск прогрева кэша в фоновом потоке
+
+    Args:
+        reason: Причина прогрева для журнала
+        gate_readiness: Считать сервис неготовым до окончания прогрева
+    """
+    if gate_readiness:
+        startup_complete.clear()
+
+    def run() -> None:
+        try:
+            warm_cache(reason=reason, **kwargs)
+        finally:
+            if gate_readiness:
+                startup_complete.set()
+
+    thread = threading.Thread(target=run, name="cache-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class RedisRestartWatcher:
+    """
+    Отслеживание переподключения и перезапуска Redis
+
+    Прогрев запускается, когда Redis снова отвечает после ошибок
+    или когда меняется run_id сервера (перезапуск или переключение на реплику).
+    """
+
+    def __init__(self, on_restart: Callable[[str], Any], interval: float = REDIS_WATCH_INTERVAL) -> None:
+        self.on_restart = on_restart
+        self.interval = interval
+        self.run_id: Optional[str] = None
+        self.available = True
+        self._stop = threading.Event()
+
+    def check(self) -> None:
+        client = cache.redis_client
+        if client is None:
+            return
+        try:
+            run_id = client.info("server").get("run_id")
+        except Exception as e:
+            if self.available:
+                logger.warning(f"Redis is unavailable: {e}")
+            self.available = False
+            return
+
+        if not self.available:
+            logger.info("Redis connection restored")
+            self.available = True
+            self.run_id = run_id
+            self.on_restart("redis-reconnect")
+        elif self.run_id is not None and run_id != self.run_id:
+            logger.info(f"Redis restart detected (run_id {self.run_id} -> {run_id})")
+            self.run_id = run_id
+            self.on_restart("redis-restart")
+        else:
+            self.run_id = run_id
+
+    def run(self) -> None:
+        self.check()
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self) -> threading.Thread:
+        thread = threading.Thread(target=self.run, name="redis-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -16,7 +16,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from app.database import Base, get_db
 from app.main import app
-from app import models, auth
+from app import models, auth, cache
 
 TEST_DATABASE_URL = "sqlite:///:memory:"
 
@@ -26,6 +26,17 @@ engine: Engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+@pytest.fixture(autouse=True)
+def reset_redis_breaker() -> Generator[None, None, None]:
+    """
+    Сбрасывает предохранитель Redis и резервный кэш между тестами
+    """
+    cache.redis_breaker.reset()
+    cache._fallback_cache.clear()
+    yield
+    cache.redis_breaker.reset()
+    cache._fallback_cache.clear()
+
 @pytest.fixture(scope="function")
 def db() -> Generator[Session, None, None]:
     """
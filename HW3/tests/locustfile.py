@@ -1,135 +1,370 @@
-from locust import HttpUser, task, between
+"""
+Нагрузочные сценарии для URL Shortener API
+
+Профили нагрузки выбираются параметром --load-profile (или LOAD_PROFILE):
+    zipf         - переходы по ссылкам с распределением Ципфа (по умолчанию)
+    read-heavy   - преимущественно чтение: переходы и статистика
+    write-heavy  - преимущественно создание и обновление ссылок
+    bulk         - массовое создание ссылок пачками
+    mixed        - все сценарии, включая сканеры и переходы на 404
+
+Пример запуска без веб-интерфейса с проверкой SLO:
+    locust -f tests/locustfile.py --host=http://localhost:8000 --headless \
+        -u 50 -r 10 -t 60s --load-profile zipf --slo-report report.json \
+        --slo-p95-ms 100 --slo-p99-ms 300 --slo-min-rps 20
+"""
+import bisect
+import json
+import logging
 import random
 import string
-import json
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from locust import HttpUser, task, between, constant, events
+from locust.runners import MasterRunner, WorkerRunner
+
+logger = logging.getLogger(__name__)
+
+PROFILES: Dict[str, Dict[str, int]] = {
+    "zipf": {"ZipfRedirectUser": 10, "CreatorUser": 1},
+    "read-heavy": {"ZipfRedirectUser": 8, "StatsReaderUser": 3, "CreatorUser": 1},
+    "write-heavy": {"CreatorUser": 6, "UpdaterUser": 3, "ZipfRedirectUser": 2},
+    "bulk": {"BulkCreatorUser": 3, "ZipfRedirectUser": 2},
+    "mixed": {
+        "ZipfRedirectUser": 10,
+        "StatsReaderUser": 3,
+        "CreatorUser": 2,
+        "UpdaterUser": 1,
+        "BulkCreatorUser": 1,
+        "ScannerUser": 1,
+    },
+}
+
+SHARED_CODES: List[str] = []
+SETTINGS: Dict[str, Any] = {"zipf_s": 1.1, "miss_ratio": 0.02, "bulk_size": 50}
+
+
+def random_string(length: int) -> str:
+    """Генерация случайной строки"""
+    letters = string.ascii_lowercase + string.digits
+    return ''.join(random.choice(letters) for _ in range(length))
+
+
+class ZipfSampler:
+    """
+    Выбор индекса 0..n-1 с вероятностью, пропорциональной 1 / (rank + 1) ** s
+
+    Индекс 0 - самая популярная ссылка. Кумулятивные веса пересчитываются
+    только при росте пула, поэтому выборка стоит O(log n).
+    """
+
+    def __init__(self, s: float = 1.1) -> None:
+        self.s = s
+        self._cumulative: List[float] = []
+
+    def _extend(self, n: int) -> None:
+        total = self._cumulative[-1] if self._cumulative else 0.0
+        for rank in range(len(self._cumulative), n):
+            total += 1.0 / (rank + 1) ** self.s
+            self._cumulative.append(total)
+
+    def sample(self, n: int) -> int:
+        if n <= 0:
+            raise ValueError("Population must not be empty")
+        if len(self._cumulative) < n:
+            self._extend(n)
+        point = random.random() * self._cumulative[n - 1]
+        return bisect.bisect_left(self._cumulative, point, 0, n - 1)
+
+
+def evaluate_slo(totals: Dict[str, float], thresholds: Dict[str, Optional[float]]) -> List[str]:
+    """
+    Сравнение итоговых метрик с порогами SLO
+
+    Args:
+        totals: Метрики прогона (p50_ms, p95_ms, p99_ms, rps, fail_ratio)
+        thresholds: Пороги; None означает, что проверка отключена
+
+    Returns:
+        Список описаний нарушенных порогов
+    """
+    violations = []
+    for metric in ("p50_ms", "p95_ms", "p99_ms"):
+        limit = thresholds.get(metric)
+        if limit is not None and totals[metric] > limit:
+            violations.append(f"{metric} {totals[metric]:.0f} > {limit:.0f}")
+    min_rps = thresholds.get("min_rps")
+    if min_rps is not None and totals["rps"] < min_rps:
+        violations.append(f"rps {totals['rps']:.2f} < {min_rps:.2f}")
+    max_fail_ratio = thresholds.get("max_fail_ratio")
+    if max_fail_ratio is not None and totals["fail_ratio"] > max_fail_ratio:
+        violations.append(f"fail_ratio {totals['fail_ratio']:.4f} > {max_fail_ratio:.4f}")
+    return violations
+
+
+def _entry_summary(entry: Any) -> Dict[str, float]:
+    return {
+        "requests": entry.num_requests,
+        "failures": entry.num_failures,
+        "p50_ms": entry.get_response_time_percentile(0.5) or 0,
+        "p95_ms": entry.get_response_time_percentile(0.95) or 0,
+        "p99_ms": entry.get_response_time_percentile(0.99) or 0,
+        "rps": entry.total_rps,
+        "fail_ratio": entry.fail_ratio,
+    }
+
+
+@events.init_command_line_parser.add_listener
+def _(parser) -> None:
+    parser.add_argument("--load-profile", choices=sorted(PROFILES), default="zipf",
+                        env_var="LOAD_PROFILE", help="Профиль нагрузки")
+    parser.add_argument("--zipf-s", type=float, default=1.1, env_var="ZIPF_S",
+                        help="Показатель распределения Ципфа")
+    parser.add_argument("--seed-links", type=int, default=200, env_var="SEED_LINKS",
+                        help="Количество ссылок, создаваемых перед стартом")
+    parser.add_argument("--miss-ratio", type=float, default=0.02, env_var="MISS_RATIO",
+                        help="Доля переходов по несуществующим кодам")
+    parser.add_argument("--bulk-size", type=int, default=50, env_var="BULK_SIZE",
+                        help="Размер пачки для BulkCreatorUser")
+    parser.add_argument("--slo-report", default="", env_var="SLO_REPORT",
+                        help="Путь к JSON-отчету с перцентилями и пропускной способностью")
+    parser.add_argument("--slo-p50-ms", type=float, default=None, env_var="SLO_P50_MS")
+    parser.add_argument("--slo-p95-ms", type=float, default=None, env_var="SLO_P95_MS")
+    parser.add_argument("--slo-p99-ms", type=float, default=None, env_var="SLO_P99_MS")
+    parser.add_argument("--slo-min-rps", type=float, default=None, env_var="SLO_MIN_RPS")
+    parser.add_argument("--slo-max-fail-ratio", type=float, default=None, env_var="SLO_MAX_FAIL_RATIO")
 
-class URLShortenerUser(HttpUser):
+
+@events.init.add_listener
+def _(environment, **kwargs) -> None:
+    options = environment.parsed_options
+    if options is None:
+        return
+    SETTINGS.update(zipf_s=options.zipf_s, miss_ratio=options.miss_ratio, bulk_size=options.bulk_size)
+
+    weights = PROFILES[options.load_profile]
+    selected = [user_class for user_class in environment.user_classes if user_class.__name__ in weights]
+    for user_class in selected:
+        user_class.weight = weights[user_class.__name__]
+    environment.user_classes = selected
+    logger.info(f"Load profile '{options.load_profile}': {weights}")
+
+
+@events.test_start.add_listener
+def _(environment, **kwargs) -> None:
+    """Создание общего пула ссылок, по которому распределяются переходы"""
+    if isinstance(environment.runner, MasterRunner) or not environment.host:
+        return
+    options = environment.parsed_options
+    count = options.seed_links if options else 200
+    session = requests.Session()
+    for _ in range(count):
+        response = session.post(
+            f"{environment.host}/links/shorten",
+            json={"original_url": f"https://example.com/seed/{random_string(12)}"},
+        )
+        if response.status_code == 200:
+            SHARED_CODES.append(response.json()["short_code"])
+    logger.info(f"Seeded {len(SHARED_CODES)} links")
+
+
+@events.quitting.add_listener
+def _(environment, **kwargs) -> None:
+    """Запись отчета и установка кода выхода при нарушении SLO"""
+    options = environment.parsed_options
+    if options is None or isinstance(environment.runner, WorkerRunner):
+        return
+
+    totals = _entry_summary(environment.stats.total)
+    thresholds = {
+        "p50_ms": options.slo_p50_ms,
+        "p95_ms": options.slo_p95_ms,
+        "p99_ms": options.slo_p99_ms,
+        "min_rps": options.slo_min_rps,
+        "max_fail_ratio": options.slo_max_fail_ratio,
+    }
+    violations = evaluate_slo(totals, thresholds)
+
+    if options.slo_report:
+        report = {
+            "profile": options.load_profile,
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total": totals,
+            "endpoints": {
+                f"{entry.method} {entry.name}": _entry_summary(entry)
+                for entry in environment.stats.entries.values()
+            },
+            "thresholds": thresholds,
+            "violations": violations,
+            "passed": not violations,
+        }
+        with open(options.slo_report, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"SLO report written to {options.slo_report}")
+
+    if violations:
+        logger.error(f"SLO violated: {'; '.join(violations)}")
+        environment.process_exit_code = 1
+
+
+class AuthenticatedUser(HttpUser):
+    """Базовый пользователь с регистрацией и токеном"""
+    abstract = True
     wait_time = between(1, 3)
-    
-    def on_start(self):
+
+    def on_start(self) -> None:
         """Выполняется при старте каждого пользователя"""
-        username = f"test_user_{random.randint(1000, 9999)}"
-        response = self.client.post(
+        self.token: Optional[str] = None
+        self.short_codes: List[str] = []
+        username = f"test_user_{random_string(10)}"
+        self.client.post(
             "/users/",
             json={
                 "username": username,
                 "email": f"{username}@example.com",
                 "password": "password123"
-            }
+            },
+            name="/users/"
         )
-        
-        if response.status_code == 400:
-            username = f"test_user_{random.randint(10000, 99999)}"
-            response = self.client.post(
-                "/users/",
-                json={
-                    "username": username,
-                    "email": f"{username}@example.com",
-                    "password": "password123"
-                }
-            )
-        
         response = self.client.post(
             "/token",
-            data={
-                "username": username,
-                "password": "password123"
-            },
+            data={"username": username, "password": "password123"},
             headers={"Content-Type": "application/x-www-form-urlencoded"}
         )
-        
         if response.status_code == 200:
             self.token = response.json()["access_token"]
         else:
-            self.token = None
-            print(f"Failed to get token: {response.text}")
-    
-    @task(3)
-    def create_short_link(self):
-        """Создание короткой ссылки"""
-        if not hasattr(self, 'token') or not self.token:
-            return
-            
-        random_url = f"https://example.com/{self._random_string(10)}"
-        random_alias = self._random_string(6)
-        
+            logger.warning(f"Failed to get token: {response.text}")
+
+    @property
+    def auth_headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"} if self.token else {}
+
+    def create_link(self, name: str = "/links/shorten") -> None:
         with self.client.post(
             "/links/shorten",
-            json={
-                "original_url": random_url,
-                "custom_alias": random_alias
-            },
-            headers={"Authorization": f"Bearer {self.token}"},
+            json={"original_url": f"https://example.com/{random_string(10)}"},
+            headers=self.auth_headers,
+            name=name,
             catch_response=True
         ) as response:
             if response.status_code == 200:
-                response.success()
-                if not hasattr(self, 'short_codes'):
-                    self.short_codes = []
-                self.short_codes.append(response.json()["short_code"])
+                short_code = response.json()["short_code"]
+                self.short_codes.append(short_code)
+                SHARED_CODES.append(short_code)
             else:
                 response.failure(f"Failed to create short link: {response.text}")
-    
-    @task(5)
-    def get_redirect(self):
-        """Переход по короткой ссылке"""
-        if hasattr(self, 'short_codes') and self.short_codes:
-            short_code = random.choice(self.short_codes)
+
+
+class ZipfRedirectUser(HttpUser):
+    """Переходы по общему пулу ссылок: несколько ссылок получают большую часть трафика"""
+    wait_time = constant(0.1)
+
+    def on_start(self) -> None:
+        self.sampler = ZipfSampler(SETTINGS["zipf_s"])
+
+    @task
+    def redirect(self) -> None:
+        if not SHARED_CODES or random.random() < SETTINGS["miss_ratio"]:
+            short_code, name = random_string(7), "/[missing]"
         else:
-            short_code = self._random_string(6)
-            
-        with self.client.get(
-            f"/{short_code}",
-            catch_response=True,
-            allow_redirects=False
-        ) as response:
-            if response.status_code == 307:
-                response.success()
-            elif response.status_code == 404:
+            short_code, name = SHARED_CODES[self.sampler.sample(len(SHARED_CODES))], "/[short_code]"
+
+        with self.client.get(f"/{short_code}", name=name, allow_redirects=False,
+                             catch_response=True) as response:
+            if response.status_code in (307, 404):
                 response.success()
             else:
                 response.failure(f"Unexpected status code: {response.status_code}")
-    
-    @task(2)
-    def get_link_stats(self):
-        """Получение статистики по ссылке"""
-        if not hasattr(self, 'token') or not self.token or not hasattr(self, 'short_codes') or not self.short_codes:
+
+
+class StatsReaderUser(HttpUser):
+    """Чтение статистики популярных ссылок"""
+    wait_time = between(0.2, 1)
+
+    def on_start(self) -> None:
+        self.sampler = ZipfSampler(SETTINGS["zipf_s"])
+
+    @task
+    def get_link_stats(self) -> None:
+        if not SHARED_CODES:
             return
-            
-        short_code = random.choice(self.short_codes)
-        
-        with self.client.get(
-            f"/links/{short_code}/stats",
-            headers={"Authorization": f"Bearer {self.token}"},
-            catch_response=True
-        ) as response:
-            if response.status_code == 200:
+        short_code = SHARED_CODES[self.sampler.sample(len(SHARED_CODES))]
+        with self.client.get(f"/links/{short_code}/stats", name="/links/[short_code]/stats",
+                             catch_response=True) as response:
+            if response.status_code in (200, 404):
                 response.success()
             else:
                 response.failure(f"Failed to get stats: {response.text}")
-    
+
+
+class CreatorUser(AuthenticatedUser):
+    """Создание ссылок по одной"""
+
+    @task
+    def create_short_link(self) -> None:
+        if self.token:
+            self.create_link()
+
+
+class UpdaterUser(AuthenticatedUser):
+    """Создание и обновление собственных ссылок"""
+
     @task(1)
-    def update_link(self):
-        """Обновление ссылки"""
-        if not hasattr(self, 'token') or not self.token or not hasattr(self, 'short_codes') or not self.short_codes:
+    def create_short_link(self) -> None:
+        if self.token:
+            self.create_link()
+
+    @task(2)
+    def update_link(self) -> None:
+        if not self.token or not self.short_codes:
             return
-            
         short_code = random.choice(self.short_codes)
-        
         with self.client.put(
             f"/links/{short_code}",
-            json={
-                "original_url": f"https://updated-example.com/{self._random_string(10)}"
-            },
-            headers={"Authorization": f"Bearer {self.token}"},
+            json={"original_url": f"https://updated-example.com/{random_string(10)}"},
+            headers=self.auth_headers,
+            name="/links/[short_code]",
             catch_response=True
         ) as response:
-            if response.status_code == 200:
+            if response.status_code != 200:
+                response.failure(f"Failed to update link: {response.text}")
+
+
+class BulkCreatorUser(AuthenticatedUser):
+    """Массовое создание ссылок пачками, как при миграции клиента"""
+    wait_time = between(5, 10)
+
+    @task
+    def create_batch(self) -> None:
+        if not self.token:
+            return
+        for _ in range(SETTINGS["bulk_size"]):
+            self.create_link(name="/links/shorten [bulk]")
+
+
+class ScannerUser(HttpUser):
+    """Перебор случайных кодов и служебных путей, почти всегда 404"""
+    wait_time = constant(0.05)
+
+    @task(5)
+    def scan_codes(self) -> None:
+        with self.client.get(f"/{random_string(random.randint(4, 8))}", name="/[scan]",
+                             allow_redirects=False, catch_response=True) as response:
+            if response.status_code in (307, 404):
                 response.success()
             else:
-                response.failure(f"Failed to update link: {response.text}")
-    
-    def _random_string(self, length):
-        """Генерация случайной строки"""
-        letters = string.ascii_lowercase + string.digits
-        return ''.join(random.choice(letters) for _ in range(length))
+                response.failure(f"Unexpected status code: {response.status_code}")
+
+    @task(1)
+    def scan_paths(self) -> None:
+        path = random.choice(["/wp-login.php", "/.env", "/admin", "/robots.txt"])
+        with self.client.get(path, name="/[scan-path]", allow_redirects=False,
+                             catch_response=True) as response:
+            if response.status_code in (307, 404):
+                response.success()
+            else:
+                response.failure(f"Unexpected status code: {response.status_code}")
+
@@ -0,0 +1,188 @@
+"""
+Сравнение памяти и пропускной способности конфигураций сервера
+
+Для каждой конфигурации запускается python -m app.server, создаются ссылки,
+затем несколько потоков в течение --duration секунд выполняют перенаправления.
+После нагрузки измеряется память мастера и воркеров: RSS и PSS (PSS делит
+общие страницы между процессами и показывает выигрыш от copy-on-write).
+
+Пример запуска:
+    python tests/server_benchmark.py --workers 4 --duration 20 --report server_report.json
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CONFIGURATIONS = {
+    "uvicorn-single": ["--workers", "1"],
+    "gunicorn": ["--no-preload", "--no-gc-freeze"],
+    "gunicorn-preload": ["--no-gc-freeze"],
+    "gunicorn-preload-freeze": [],
+}
+
+
+def _children(pid: int) -> List[int]:
+    result = []
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            for child in f.read().split():
+                result.append(int(child))
+                result.extend(_children(int(child)))
+    except OSError:
+        pass
+    return result
+
+
+def _memory_kb(pid: int) -> Dict[str, int]:
+    """RSS и PSS процесса из /proc/<pid>/smaps_rollup"""
+    values = {"rss_kb": 0, "pss_kb": 0}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("Rss", "Pss"):
+                    values[f"{name.lower()}_kb"] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def _process_memory(pid: int) -> Dict[str, Any]:
+    pids = [pid] + _children(pid)
+    per_process = [_memory_kb(p) for p in pids]
+    return {
+        "processes": len(pids),
+        "rss_mb": round(sum(m["rss_kb"] for m in per_process) / 1024, 1),
+        "pss_mb": round(sum(m["pss_kb"] for m in per_process) / 1024, 1),
+    }
+
+
+def _wait_ready(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def _seed(port: int, links: int) -> List[str]:
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    codes = []
+    for i in range(links):
+        body = json.dumps({"original_url": f"https://example.com/bench/{i}"})
+        conn.request("POST", "/links/shorten", body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        codes.append(json.loads(response.read())["short_code"])
+    return codes
+
+
+def _load(port: int, codes: List[str], duration: float, threads: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker() -> None:
+        conn = http.client.HTTPConnection("127.0.0.1", port)
+        local: List[float] = []
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", f"/{random.choice(codes)}")
+                response = conn.getresponse()
+                response.read()
+                if response.status != 307:
+                    errors[0] += 1
+            except OSError:
+                errors[0] += 1
+                conn = http.client.HTTPConnection("127.0.0.1", port)
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000, 3),
+    }
+
+
+def run_configuration(name: str, extra: List[str], args: argparse.Namespace, port: int) -> Dict[str, Any]:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(args.workdir, 'server_benchmark.db')}",
+        "LOG_LEVEL": "WARNING",
+    }
+    command = [sys.executable, "-m", "app.server", "--bind", f"127.0.0.1:{port}",
+               "--workers", str(args.workers), "--max-requests", "0"] + extra
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_ready(port)
+        idle = _process_memory(process.pid)
+        codes = _seed(port, args.links)
+        load = _load(port, codes, args.duration, args.threads)
+        loaded = _process_memory(process.pid)
+        return {"configuration": name, "idle": idle, "after_load": loaded, **load}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Память и пропускная способность конфигураций сервера")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--links", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18000)
+    parser.add_argument("--workdir", default="/tmp")
+    parser.add_argument("--configurations", nargs="+", default=list(CONFIGURATIONS), choices=list(CONFIGURATIONS))
+    parser.add_argument("--report", default="server_report.json")
+    args = parser.parse_args(argv)
+
+    subprocess.run(
+        [sys.executable, "-m", "app.migrate"], cwd=ROOT, check=True,
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(args.workdir, 'server_benchmark.db')}"}
+    )
+
+    results = []
+    for offset, name in enumerate(args.configurations):
+        result = run_configuration(name, CONFIGURATIONS[name], args, args.port + offset)
+        print(json.dumps(result))
+        results.append(result)
+
+    with open(args.report, "w") as f:
+        json.dump({"workers": args.workers, "duration": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
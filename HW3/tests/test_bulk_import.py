@@ -0,0 +1,176 @@
+import io
+import json
+import pytest
+from sqlalchemy.orm import Session
+from app import bulk_import, datagen, models, sharding
+
+
+def _factory(db):
+    """
+    Отдельные сессии на соединении теста: импорт закрывает свои сессии,
+    а откат после сбоя откатывает только точку сохранения, не данные теста
+    """
+    return lambda: Session(bind=db.get_bind(), join_transaction_mode="create_savepoint")
+
+
+@pytest.fixture
+def import_sessions(db, monkeypatch):
+    """Задачи импорта в фоне работают на соединении теста"""
+    monkeypatch.setattr(bulk_import, "_default_job_session", _factory(db))
+    monkeypatch.setattr(sharding, "session_factories", lambda: [_factory(db)])
+    return db
+
+
+def _write(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def test_read_rows_and_validate_batch():
+    """Тест: синонимы колонок, пустые ячейки и ошибки строк пачки"""
+    stream = io.StringIO(
+        "url,alias,expires_at\n"
+        "https://example.com/a,alias-a,\n"
+        "not-a-url,,\n"
+        "https://example.com/b,alias-a,\n"
+        "https://example.com/c,,2030-01-01T00:00:00Z\n"
+        "https://example.com/d,,tomorrow\n"
+        "https://example.com/e,ab,\n"
+    )
+    rows = list(bulk_import.read_rows(stream, "csv"))
+    assert rows[0] == {"original_url": "https://example.com/a", "custom_alias": "alias-a", "expires_at": None}
+
+    valid, errors = bulk_import.validate_batch(rows)
+    assert [index for index, _, _ in valid] == [0, 3]
+    assert valid[1][2].year == 2030
+    assert set(errors) == {1, 2, 4, 5}
+    assert errors[1].startswith("original_url")
+    assert errors[2] == "custom_alias: duplicated in file"
+    assert errors[4].startswith("expires_at")
+
+    ndjson = io.StringIO('{"url": "https://example.com/x"}\n\n{broken\n[1]\n')
+    assert list(bulk_import.read_rows(ndjson, "ndjson"))[1:] == [
+        {"_error": "invalid JSON: Expecting property name enclosed in double quotes: line 1 column 2 (char 1)"},
+        {"_error": "expected a JSON object"},
+    ]
+
+
+def test_run_job_imports_in_batches(db, test_user, tmp_path):
+    """Тест: пачки, коды из счетчика, конфликт алиаса и журнал изменений"""
+    db.add(models.Link(short_code="taken", original_url="https://other.com/"))
+    db.commit()
+    lines = [json.dumps({"url": f"https://example.com/{i}"}) for i in range(5)]
+    lines.append(json.dumps({"url": "https://example.com/alias", "alias": "taken"}))
+    lines.append(json.dumps({"url": "https://example.com/own", "alias": "own-alias"}))
+    path = _write(tmp_path, "links.ndjson", "\n".join(lines) + "\n")
+
+    job = bulk_import.create_job(db, path, "ndjson", test_user.id, batch_size=3)
+    result = bulk_import.run_job(job.id, _factory(db), [_factory(db)])
+
+    assert result["status"] == "completed"
+    assert result["rows_read"] == 7
+    assert result["rows_imported"] == 6
+    assert result["rows_rejected"] == 1
+    assert result["batches_committed"] == 3
+    assert result["errors"] == ["row 6: custom_alias: already in use"]
+
+    codes = [datagen.short_code_for(bulk_import.CODE_SEQUENCE_START + i) for i in range(5)]
+    links = {link.short_code: link for link in db.query(models.Link).filter(models.Link.owner_id == test_user.id)}
+    assert set(links) == set(codes) | {"own-alias"}
+    assert links[codes[4]].original_url == "https://example.com/4"
+    assert db.query(models.LinkChange).filter(models.LinkChange.short_code.in_(codes)).count() == 5
+    assert db.get(models.CodeSequence, "links").next_value == bulk_import.CODE_SEQUENCE_START + 5
+
+    # Завершенную задачу повторно не запустить
+    assert bulk_import.run_job(job.id, _factory(db), [_factory(db)]) is None
+
+
+def test_resume_repeats_unfinished_batch_without_duplicates(db, test_user, tmp_path, monkeypatch):
+    """Тест: после сбоя пачка повторяется с теми же кодами, записанные строки не дублируются"""
+    path = _write(tmp_path, "links.csv", "original_url\n" + "".join(f"https://example.com/{i}\n" for i in range(4)))
+    job = bulk_import.create_job(db, path, "csv", test_user.id, batch_size=2)
+
+    insert_links = bulk_import._insert_links
+    calls = []
+
+    def crash_after_second_batch(session, links, now):
+        inserted = insert_links(session, links, now)
+        calls.append(len(links))
+        if len(calls) == 2:
+            raise RuntimeError("worker stopped")
+        return inserted
+
+    monkeypatch.setattr(bulk_import, "_insert_links", crash_after_second_batch)
+    with pytest.raises(RuntimeError):
+        bulk_import.run_job(job.id, _factory(db), [_factory(db)])
+    db.refresh(job)
+    assert (job.status, job.rows_read, job.batches_committed) == ("failed", 2, 1)
+    assert job.pending_block is not None
+
+    monkeypatch.setattr(bulk_import, "_insert_links", insert_links)
+    result = bulk_import.run_job(job.id, _factory(db), [_factory(db)])
+    assert result["status"] == "completed"
+    assert (result["rows_read"], result["rows_imported"], result["batches_committed"]) == (4, 4, 2)
+    urls = [row.original_url for row in db.query(models.Link.original_url).filter(models.Link.owner_id == test_user.id)]
+    assert sorted(urls) == [f"https://example.com/{i}" for i in range(4)]
+
+
+def test_import_endpoint_and_progress(client, import_sessions, test_user, auth_token, tmp_path, monkeypatch):
+    """Тест: загрузка файла, фоновый импорт и прогресс задачи"""
+    monkeypatch.setattr(bulk_import, "IMPORT_DIR", str(tmp_path))
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    content = b"url,alias\nhttps://example.com/up,uploaded\nbad,\n"
+
+    response = client.post("/links/import", headers=headers, files={"file": ("links.csv", content, "text/csv")})
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    progress = client.get(f"/links/import/{job_id}", headers=headers).json()
+    assert progress["status"] == "completed"
+    assert (progress["rows_imported"], progress["rows_rejected"]) == (1, 1)
+    assert client.get("/links/uploaded").json()["owner_id"] == test_user.id
+    assert client.post(f"/links/import/{job_id}/resume", headers=headers).status_code == 409
+
+    response = client.post("/links/import", headers=headers, files={"file": ("links.txt", content, "text/plain")})
+    assert response.status_code == 400
+    assert client.get("/links/import/unknown", headers=headers).status_code == 404
+
+
+def test_import_endpoint_rejects_large_file(client, import_sessions, auth_token, tmp_path, monkeypatch):
+    """Тест: файл больше IMPORT_MAX_BYTES отклоняется с кодом 413, частично записанный файл удаляется"""
+    monkeypatch.setattr(bulk_import, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_BYTES", 64)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    content = b"url\n" + b"".join(f"https://example.com/{i}\n".encode() for i in range(10))
+
+    response = client.post("/links/import", headers=headers, files={"file": ("links.csv", content, "text/csv")})
+    assert response.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+    assert import_sessions.query(models.ImportJob).count() == 0
+
+
+def test_alias_taken_after_check_rejects_only_that_row(db, test_user, tmp_path, monkeypatch):
+    """Тест: алиас, занятый между проверкой и записью пачки, отклоняет одну строку, а не задачу"""
+    path = _write(tmp_path, "links.csv", "url,alias\nhttps://example.com/a,race-a\nhttps://example.com/b,race-b\n")
+    job = bulk_import.create_job(db, path, "csv", test_user.id)
+    db.add(models.Link(short_code="race-b", original_url="https://other.com/"))
+    db.commit()
+    existing = bulk_import._Source.existing
+
+    def existing_before_shorten(source, short_codes):
+        # Проверка выполнена до того, как /links/shorten занял race-b
+        found = existing(source, short_codes)
+        found.pop("race-b", None)
+        return found
+
+    monkeypatch.setattr(bulk_import._Source, "existing", existing_before_shorten)
+    result = bulk_import.run_job(job.id, _factory(db), [_factory(db)])
+
+    assert result["status"] == "completed"
+    assert (result["rows_imported"], result["rows_rejected"]) == (1, 1)
+    assert result["errors"] == ["row 2: custom_alias: already in use"]
+    links = {link.short_code: link for link in db.query(models.Link).filter(models.Link.short_code.like("race-%"))}
+    assert links["race-a"].owner_id == test_user.id
+    assert links["race-b"].original_url == "https://other.com/"
+    assert db.query(models.LinkChange).filter(models.LinkChange.short_code == "race-a").count() == 1
@@ -0,0 +1,117 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import cache, changes, models
+
+
+def _journal(db):
+    return [(change.short_code, change.action) for change in db.query(models.LinkChange).order_by(models.LinkChange.id)]
+
+
+def test_mutations_are_journaled_and_invalidate_cache(client, db, auth_token):
+    """Тест: создание, изменение, смена псевдонима и удаление пишутся в журнал и обновляют кэш"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = client.post("/links/shorten", json={"original_url": "https://example.com/a", "custom_alias": "ch-one"},
+                           headers=headers)
+    assert response.status_code == 200
+
+    cache._memory_cache["stats:ch-one"] = "{}"
+    client.put("/links/ch-one", json={"original_url": "https://example.com/b"}, headers=headers)
+    assert cache.get_stats_cache("ch-one")["original_url"] == "https://example.com/b"
+
+    client.put("/links/ch-one", json={"custom_alias": "ch-two"}, headers=headers)
+    cache._memory_cache["link:ch-two"] = "https://example.com/stale"
+    assert client.delete("/links/ch-two", headers=headers).status_code == 204
+    assert "link:ch-two" not in cache._memory_cache
+
+    assert _journal(db) == [
+        ("ch-one", changes.CREATE),
+        ("ch-one", changes.UPDATE),
+        ("ch-one", changes.DEACTIVATE),
+        ("ch-two", changes.UPDATE),
+        ("ch-two", changes.DEACTIVATE),
+    ]
+
+
+def test_bulk_expiry_is_journaled(client, db, test_user, auth_token):
+    """Тест: массовая деактивация истекших ссылок пишется в журнал"""
+    db.add(models.Link(short_code="ch-exp", original_url="https://example.com/exp", owner_id=test_user.id,
+                       expires_at=datetime.now() - timedelta(hours=1)))
+    db.commit()
+    client.get("/expired-links", headers={"Authorization": f"Bearer {auth_token}"})
+    assert _journal(db)[-1] == ("ch-exp", changes.DEACTIVATE)
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'feed.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_change_feed_batches_and_prune(file_session_factory):
+    """Тест: журнал читается с конца на момент запуска, по порядку и пачками; старые записи удаляются"""
+    with file_session_factory() as db:
+        db.add(models.Link(short_code="cf-before", original_url="https://example.com/before"))
+        db.commit()
+
+    batches = []
+    feed = changes.ChangeFeed([file_session_factory], handlers=[batches.append], batch_size=2)
+    assert feed.poll() == 0
+
+    with file_session_factory() as db:
+        db.add_all([models.Link(short_code=f"cf-{i}", original_url=f"https://example.com/{i}") for i in range(5)])
+        db.commit()
+
+    assert feed.poll() == 5
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [change.short_code for batch in batches for change in batch] == [f"cf-{i}" for i in range(5)]
+    assert feed.poll() == 0
+
+    with file_session_factory() as db:
+        db.query(models.LinkChange).filter(models.LinkChange.short_code == "cf-before").update(
+            {models.LinkChange.changed_at: datetime.now() - timedelta(days=2)}
+        )
+        db.commit()
+    assert feed.prune(retention_hours=24) == 1
+
+
+def test_rollback_discards_changes(file_session_factory):
+    """Тест: откат транзакции не оставляет записей журнала и не сбрасывает кэш"""
+    with file_session_factory() as db:
+        db.add(models.Link(short_code="ch-rollback", original_url="https://example.com/rb"))
+        db.flush()
+        assert changes._PENDING in db.info
+        db.rollback()
+        assert changes._PENDING not in db.info
+        assert _journal(db) == []
+
+
+def test_change_feed_rereads_out_of_order_commits(file_session_factory):
+    """Тест: запись, зафиксированная позже записи с большим номером, не пропускается"""
+    def add(change_id, short_code, changed_at=None):
+        with file_session_factory() as db:
+            db.add(models.LinkChange(id=change_id, short_code=short_code, action=changes.UPDATE,
+                                     changed_at=changed_at or datetime.now()))
+            db.commit()
+
+    handled = []
+    feed = changes.ChangeFeed([file_session_factory], handlers=[lambda batch: handled.extend(c.id for c in batch)],
+                              start_ids=[0])
+    add(1, "oo-one")
+    add(3, "oo-three")
+    assert feed.poll() == 2
+    assert feed.cursors == [1]
+
+    add(2, "oo-two")
+    assert feed.poll() == 1
+    assert handled == [1, 3, 2]
+    assert feed.cursors == [3]
+
+    # Пропуск, за которым лежит давняя запись, считается откатом
+    add(5, "oo-five", datetime.now() - timedelta(seconds=changes.CHANGE_FEED_GAP_SECONDS + 1))
+    assert feed.poll() == 1
+    assert feed.cursors == [5]
+    assert feed.poll() == 0
@@ -0,0 +1,123 @@
+import pytest
+from unittest.mock import MagicMock
+from app import cache
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError, LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fail():
+    raise ConnectionError("Redis is down")
+
+
+def test_breaker_opens_on_consecutive_failures():
+    """Тест размыкания после нескольких ошибок подряд"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", consecutive_failures=3, open_seconds=5, clock=clock)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            breaker.call(_fail)
+
+    assert breaker.state == "open"
+    fn = MagicMock()
+    with pytest.raises(CircuitOpenError):
+        breaker.call(fn)
+    fn.assert_not_called()
+    assert breaker.snapshot()["rejected_calls"] == 1
+
+
+def test_breaker_opens_on_failure_rate():
+    """Тест размыкания по доле ошибок в окне"""
+    breaker = CircuitBreaker("test", failure_rate_threshold=0.5, consecutive_failures=100,
+                             window_size=10, min_calls=10)
+    for i in range(10):
+        if i % 2:
+            with pytest.raises(ConnectionError):
+                breaker.call(_fail)
+        else:
+            breaker.call(lambda: True)
+
+    assert breaker.state == "open"
+
+
+def test_breaker_counts_slow_calls():
+    """Тест: медленные вызовы считаются ошибками"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", consecutive_failures=2, slow_call_seconds=0.0, clock=clock)
+    breaker.call(lambda: True)
+    breaker.call(lambda: True)
+    assert breaker.state == "open"
+
+
+def test_breaker_half_open_probe():
+    """Тест пробного вызова в полуоткрытом состоянии"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_seconds=5, clock=clock)
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+
+    clock.now = 6
+    assert breaker.state == "half_open"
+    with pytest.raises(ConnectionError):
+        breaker.call(_fail)
+    assert breaker.state == "open"
+
+    clock.now = 12
+    assert breaker.call(lambda: "pong") == "pong"
+    assert breaker.state == "closed"
+
+
+def test_lru_cache_bounded_and_expiring():
+    """Тест ограничения размера и времени жизни резервного кэша"""
+    clock = FakeClock()
+    lru = LRUCache(maxsize=2, ttl=10, clock=clock)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert len(lru) == 2
+
+    clock.now = 11
+    assert lru.get("a") is None
+
+
+def test_cache_serves_fallback_when_circuit_open():
+    """Тест: при разомкнутом предохранителе кэш работает из памяти процесса без обращений к Redis"""
+    original = (cache.TESTING, cache.redis_client)
+    mock_redis = MagicMock()
+    mock_redis.get.side_effect = ConnectionError("Redis is down")
+    try:
+        cache.TESTING = False
+        cache.redis_client = mock_redis
+        cache.set_link_cache("cb-link", "https://example.com/cb")
+
+        for _ in range(cache.redis_breaker.consecutive_failures):
+            assert cache.get_link_cache("cb-link") == "https://example.com/cb"
+        assert cache.redis_breaker.state == "open"
+
+        mock_redis.reset_mock()
+        assert cache.get_link_cache("cb-link") == "https://example.com/cb"
+        cache.delete_link_cache("cb-link")
+        assert cache.get_link_cache("cb-link") is None
+        mock_redis.get.assert_not_called()
+        mock_redis.delete.assert_not_called()
+    finally:
+        cache.TESTING, cache.redis_client = original
+
+
+def test_healthz_reports_circuit_state(client):
+    """Тест отображения состояния предохранителя в /healthz"""
+    response = client.get("/healthz")
+    data = response.json()
+    assert data["redis_circuit"]["state"] == "closed"
+    assert "fallback_entries" in data["redis_circuit"]
@@ -0,0 +1,148 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import clicks, models
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'clicks.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_buffer_overwrites_oldest_events():
+    """Тест: переполненный буфер вытесняет самые старые события и считает потери"""
+    buffer = clicks.ClickBuffer(maxsize=3)
+    for i in range(5):
+        buffer.record(f"code{i}", referrer="https://ref.example/" + "x" * 1000, user_agent="agent")
+    assert (len(buffer), buffer.recorded, buffer.dropped) == (3, 5, 2)
+
+    events = buffer.drain(10)
+    assert [event[0] for event in events] == ["code2", "code3", "code4"]
+    assert len(events[0][2]) == 512
+    assert len(buffer) == 0
+
+
+def test_flush_rollup_and_timeseries(file_session_factory):
+    """Тест: события записываются пачками и сворачиваются в минутные, часовые и дневные агрегаты"""
+    buffer = clicks.ClickBuffer()
+    for _ in range(3):
+        buffer.record("ck-one", user_agent="agent")
+    buffer.record("ck-two")
+    assert clicks.flush(buffer, [file_session_factory], lambda code: 0, batch_size=2) == 4
+
+    with file_session_factory() as db:
+        event = db.query(models.ClickEvent).first()
+        assert event.user_agent_hash == clicks.user_agent_hash("agent")
+        assert clicks.rollup(db, batch_size=3) == 3
+        assert clicks.rollup(db) == 1
+        assert clicks.rollup(db) == 0
+
+        now = datetime.now()
+        hourly = clicks.timeseries(db, "ck-one", "hour", now - timedelta(hours=2), now)
+        assert len(hourly) == 3
+        assert hourly[-1] == {"bucket": clicks.bucket_start(now, "hour"), "clicks": 3}
+        assert sum(point["clicks"] for point in hourly[:-1]) == 0
+        daily = clicks.timeseries(db, "ck-two", "day", now, now)
+        assert daily == [{"bucket": clicks.bucket_start(now, "day"), "clicks": 1}]
+
+        old = now - timedelta(days=30)
+        db.add(models.ClickEvent(short_code="ck-one", clicked_at=old))
+        db.add(models.ClickRollup(short_code="ck-one", granularity="minute", bucket_start=old, clicks=1))
+        db.add(models.ClickRollup(short_code="ck-one", granularity="day", bucket_start=old, clicks=1))
+        db.commit()
+        assert clicks.prune(db, retention_days=7) == 2
+
+
+def test_rollup_waits_for_out_of_order_commits(file_session_factory):
+    """Тест: событие, зафиксированное позже события с большим номером, попадает в агрегаты"""
+    now = datetime.now()
+    with file_session_factory() as db:
+        db.add_all([models.ClickEvent(id=1, short_code="oo", clicked_at=now),
+                    models.ClickEvent(id=3, short_code="oo", clicked_at=now)])
+        db.commit()
+        assert clicks.rollup(db) == 1
+
+        db.add(models.ClickEvent(id=2, short_code="oo", clicked_at=now))
+        db.commit()
+        assert clicks.rollup(db) == 2
+        assert clicks.timeseries(db, "oo", "day", now, now)[0]["clicks"] == 3
+
+        # Пропуск перед давним событием считается откатом вставки
+        old = now - timedelta(seconds=clicks.CLICK_ROLLUP_GAP_SECONDS + 1)
+        db.add(models.ClickEvent(id=5, short_code="oo", clicked_at=old))
+        db.commit()
+        assert clicks.rollup(db) == 1
+
+
+def test_rollup_updates_visitor_sketches(file_session_factory):
+    """Тест: свертка добавляет посетителей в дневные скетчи и скетч за все время, дни объединяются"""
+    yesterday = datetime.now() - timedelta(days=1)
+    with file_session_factory() as db:
+        for i in range(30):
+            db.add(models.ClickEvent(short_code="ck-uv", clicked_at=yesterday,
+                                     visitor_hash=clicks.visitor_hash(f"10.0.0.{i}", "agent")))
+        for i in range(20, 50):
+            db.add(models.ClickEvent(short_code="ck-uv", clicked_at=datetime.now(),
+                                     visitor_hash=clicks.visitor_hash(f"10.0.0.{i}", "agent")))
+        db.add(models.ClickEvent(short_code="ck-uv", clicked_at=datetime.now()))
+        db.commit()
+        assert clicks.rollup(db, batch_size=40) == 40
+        assert clicks.rollup(db) == 21
+
+        assert db.query(models.VisitorSketch).count() == 3
+        # На малых значениях оценка по линейному подсчету почти точна
+        assert abs(clicks.unique_visitors(db, "ck-uv") - 50) <= 1
+        assert abs(clicks.unique_visitors(db, "ck-uv", yesterday.date(), yesterday.date()) - 30) <= 1
+        assert abs(clicks.unique_visitors(db, "ck-uv", start=datetime.now().date()) - 30) <= 1
+        assert clicks.unique_visitors(db, "ck-uv", yesterday.date(), datetime.now().date()) == \
+            clicks.unique_visitors(db, "ck-uv")
+        assert clicks.unique_visitors(db, "ck-other") == 0
+
+
+def test_redirect_records_click_and_timeseries_endpoint(client, db, monkeypatch):
+    """Тест: перенаправление добавляет событие в буфер, /timeseries отдает агрегаты"""
+    buffer = clicks.ClickBuffer()
+    monkeypatch.setattr(clicks, "buffer", buffer)
+    monkeypatch.setattr(clicks, "CLICK_EVENTS_ENABLED", True)
+    db.add(models.Link(short_code="ck-link", original_url="https://example.com/"))
+    now = datetime.now()
+    db.add(models.ClickRollup(short_code="ck-link", granularity="hour",
+                              bucket_start=clicks.bucket_start(now, "hour"), clicks=7))
+    db.commit()
+
+    response = client.get("/ck-link", headers={"Referer": "https://ref.example/", "User-Agent": "tester"},
+                          follow_redirects=False)
+    assert response.status_code == 307
+    [event] = buffer.drain(10)
+    assert (event[0], event[2], event[3], event[4]) == ("ck-link", "https://ref.example/", "tester", "testclient")
+
+    data = client.get("/links/ck-link/timeseries").json()
+    assert data["granularity"] == "hour"
+    assert len(data["points"]) == 24 * 7 + 1
+    assert data["total"] == 7
+
+    assert client.get("/links/ck-link/timeseries?granularity=week").status_code == 400
+    assert client.get("/links/ck-link/timeseries?granularity=minute&start=2020-01-01T00:00:00").status_code == 400
+    assert client.get("/links/ck-missing/timeseries").status_code == 404
+
+    stats = client.get("/links/ck-link/stats").json()
+    assert stats["unique_visitors"] == 0
+    assert stats["unique_visitors_error"] == 0.0163
+    assert client.get("/links/ck-link/stats?start=2026-02-01&end=2026-01-01").status_code == 400
+
+
+def test_redirect_skips_buffer_when_events_disabled(client, db, monkeypatch):
+    """Тест: без конвейера событий перенаправление не копит события в буфере"""
+    buffer = clicks.ClickBuffer(maxsize=1)
+    monkeypatch.setattr(clicks, "buffer", buffer)
+    monkeypatch.setattr(clicks, "CLICK_EVENTS_ENABLED", False)
+    db.add(models.Link(short_code="ck-off", original_url="https://example.com/"))
+    db.commit()
+
+    for _ in range(3):
+        assert client.get("/ck-off", follow_redirects=False).status_code == 307
+    assert (len(buffer), buffer.recorded, buffer.dropped) == (0, 0, 0)
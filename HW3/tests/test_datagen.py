@@ -0,0 +1,51 @@
+from datetime import datetime
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from app import datagen, models
+
+
+def test_short_code_for_unique():
+    """Тест уникальности сгенерированных коротких кодов"""
+    codes = {datagen.short_code_for(i) for i in range(1, 20001)}
+    assert len(codes) == 20000
+    assert all(len(code) == datagen.CODE_LENGTH for code in codes)
+
+
+def test_generator_distributions():
+    """Тест распределений генератора"""
+    now = datetime(2025, 1, 1)
+    generator = datagen.DatasetGenerator(2000, users=50, now=now, seed=1)
+    links = list(generator.iter_links())
+
+    assert len(links) == 2000
+    assert all(link["created_at"] <= now for link in links)
+    assert all(link["last_used"] is None for link in links if link["clicks"] == 0)
+    assert all(link["last_used"] >= link["created_at"] for link in links if link["last_used"])
+    assert any(link["owner_id"] is None for link in links)
+
+    owners = [link["owner_id"] for link in links if link["owner_id"]]
+    assert max(owners) <= 50
+    assert owners.count(1) > owners.count(50)
+
+    clicks = sorted((link["clicks"] for link in links), reverse=True)
+    assert sum(clicks[:200]) > sum(clicks[200:])
+
+
+def test_generate_sqlite_file(tmp_path):
+    """Тест загрузки набора данных в SQLite-файл многострочными INSERT"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'scale.db'}")
+    generator = datagen.DatasetGenerator(1500, users=30, expired_ratio=0.1)
+
+    result = datagen.generate(engine, generator, batch_size=400)
+
+    assert result["users"] == 30
+    assert result["links"] == 1500
+    assert result["expired_links"] == 150
+
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        assert db.query(func.count(models.Link.id)).scalar() == 1500
+        assert db.query(func.count(models.ExpiredLink.id)).scalar() == 150
+        link = db.query(models.Link).filter(models.Link.short_code == datagen.short_code_for(1)).first()
+        assert link is not None
+    engine.dispose()
@@ -0,0 +1,86 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime
+from app import export, models
+
+
+def _add_data(db, owner_id):
+    created_at = datetime(2025, 12, 31)
+    for i in range(5):
+        db.add(models.Link(short_code=f"ex-{i}", original_url=f"https://example.com/{i}", clicks=i,
+                           owner_id=owner_id, created_at=created_at))
+    db.add(models.Link(short_code="ex-other", original_url="https://example.com/other", created_at=created_at))
+    db.add(models.ClickRollup(short_code="ex-1", granularity="hour", bucket_start=datetime(2026, 1, 1, 10), clicks=3))
+    db.add(models.ClickRollup(short_code="ex-other", granularity="hour", bucket_start=datetime(2026, 1, 1, 10),
+                              clicks=9))
+    db.commit()
+
+
+def test_export_streams_compressed_csv_and_ndjson(client, db, test_user, auth_token):
+    """Тест: выгрузка отдает только данные пользователя в CSV с gzip и в NDJSON без сжатия"""
+    _add_data(db, test_user.id)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    response = client.get("/users/me/export", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert 'filename="links.csv.gz"' in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+    assert [row["short_code"] for row in rows] == [f"ex-{i}" for i in range(5)]
+    assert rows[2]["clicks"] == "2" and rows[0]["last_used"] == ""
+
+    response = client.get("/users/me/export?dataset=click_rollups&format=ndjson&compression=none", headers=headers)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [{"short_code": "ex-1", "granularity": "hour", "bucket_start": "2026-01-01T10:00:00", "clicks": 3}]
+
+    assert client.get("/users/me/export?dataset=users", headers=headers).status_code == 400
+    assert client.get("/users/me/export?format=xml", headers=headers).status_code == 400
+    assert client.get("/users/me/export?compression=zip", headers=headers).status_code == 400
+    if not export.parquet_available():
+        assert client.get("/users/me/export?format=parquet", headers=headers).status_code == 400
+    assert client.get("/users/me/export").status_code == 401
+
+
+def test_export_skips_history_of_reused_code(db):
+    """Тест: переходы прежней ссылки с тем же кодом не попадают в выгрузку нового владельца"""
+    db.add(models.Link(short_code="ex-reused", original_url="https://example.com/", owner_id=7,
+                       created_at=datetime(2026, 1, 1, 10, 30)))
+    db.add_all([
+        models.ClickRollup(short_code="ex-reused", granularity="hour", bucket_start=datetime(2025, 12, 1, 10), clicks=5),
+        models.ClickRollup(short_code="ex-reused", granularity="hour", bucket_start=datetime(2026, 1, 1, 10), clicks=2),
+        models.ClickRollup(short_code="ex-reused", granularity="day", bucket_start=datetime(2026, 1, 1), clicks=2),
+        models.ClickEvent(short_code="ex-reused", clicked_at=datetime(2025, 12, 1, 10, 5)),
+        models.ClickEvent(short_code="ex-reused", clicked_at=datetime(2026, 1, 1, 10, 45)),
+    ])
+    db.commit()
+
+    rollups = [row for batch in export.batches("click_rollups", 7, [db]) for row in batch]
+    assert sorted((row.granularity, row.clicks) for row in rollups) == [("day", 2), ("hour", 2)]
+    events = [row for batch in export.batches("click_events", 7, [db]) for row in batch]
+    assert [row.clicked_at for row in events] == [datetime(2026, 1, 1, 10, 45)]
+
+
+def test_export_reads_in_batches(db):
+    """Тест: строки читаются и отдаются пачками, gzip-поток собирается из частей"""
+    _add_data(db, 7)
+    batches = list(export.batches("links", 7, [db], batch_size=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+    chunks = list(export.csv_chunks(export.DATASETS["links"], batches))
+    assert len(chunks) == 4
+    compressed = b"".join(export.gzip_chunks(iter(chunks)))
+    assert gzip.decompress(compressed) == b"".join(chunks)
+
+
+def test_export_parquet(db):
+    """Тест: Parquet пишется группами строк и читается обратно"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    _add_data(db, 7)
+    data = b"".join(export.stream("links", 7, "parquet", True, [db], batch_size=2))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 5
+    assert table.column("short_code").to_pylist()[0] == "ex-0"
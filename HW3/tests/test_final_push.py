@@ -59,12 +59,10 @@ def test_config_environment_variables():
         config.DATABASE_URL = original_database_url
 
 def test_startup_event_mock():
-    """Тест события запуска с использованием моков"""
-    from app.main import app
+    """Тест: запуск приложения выполняется через lifespan"""
+    from app.main import app, lifespan
     
-    startup_handlers = [handler for handler in app.router.on_startup]
-    
-    assert len(startup_handlers) > 0
+    assert app.router.lifespan_context is lifespan
 
 def test_simple_docs_function():
     """Тест функции simple_docs"""
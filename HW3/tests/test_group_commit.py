@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy.orm import Session
+from app import group_commit, models
+
+
+def _factory(db):
+    """Сессии потока фиксации на соединении теста"""
+    return lambda: Session(bind=db.get_bind(), join_transaction_mode="create_savepoint")
+
+
+def test_commit_group_batches_inserts(db):
+    """Тест: вставки одной пачки фиксируются вместе, конфликты получают None"""
+    db.add(models.Link(short_code="gc-taken", original_url="https://example.com/taken"))
+    db.commit()
+    group = group_commit.CommitGroup(_factory(db), max_delay=5, max_batch=4)
+    batches = group_commit.batch_sizes.count()
+
+    futures = [
+        group.submit({"short_code": code, "original_url": f"https://example.com/{code}", "owner_id": None})
+        for code in ("gc-one", "gc-two", "gc-one", "gc-taken")
+    ]
+    results = [future.result(timeout=5) for future in futures]
+    group.stop()
+
+    assert [row.short_code if row else None for row in results] == ["gc-one", "gc-two", None, None]
+    assert results[0].id is not None and results[0].created_at is not None
+    assert group_commit.batch_sizes.count() == batches + 1
+    assert {link.short_code for link in db.query(models.Link)} == {"gc-taken", "gc-one", "gc-two"}
+    assert sorted(change.short_code for change in db.query(models.LinkChange)) == ["gc-one", "gc-taken", "gc-two"]
+
+
+def test_stop_flushes_pending_inserts(db):
+    """Тест: остановка записывает вставки, которые еще ждут пачку"""
+    group = group_commit.CommitGroup(_factory(db), max_delay=60, max_batch=100)
+    future = group.submit({"short_code": "gc-late", "original_url": "https://example.com/late"})
+    group.stop()
+    assert future.result(timeout=5).short_code == "gc-late"
+
+
+def test_create_link_with_group_commit(client, db, monkeypatch):
+    """Тест: /links/shorten в режиме групповой фиксации"""
+    committer = group_commit.GroupCommitter([_factory(db)], source_index=lambda short_code: 0, max_delay=0.001)
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT_ENABLED", True)
+    monkeypatch.setattr(group_commit, "committer", committer)
+    try:
+        response = client.post("/links/shorten", json={"original_url": "https://example.com/", "custom_alias": "gc-api"})
+        assert response.status_code == 200
+        assert response.json()["short_code"] == "gc-api"
+        assert response.json()["created_at"]
+
+        response = client.post("/links/shorten", json={"original_url": "https://example.org/", "custom_alias": "gc-api"})
+        assert response.status_code == 400
+
+        assert client.post("/links/shorten", json={"original_url": "https://example.com/gen"}).status_code == 200
+    finally:
+        committer.stop()
+    assert db.query(models.Link).count() == 2
+
+
+def test_flush_errors_do_not_stop_the_thread(db):
+    """Тест: ошибка получения сессии отдается запросам пачки, следующие пачки пишутся"""
+    factory = _factory(db)
+    calls = []
+
+    def flaky_factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise TimeoutError("pool timeout")
+        return factory()
+
+    group = group_commit.CommitGroup(flaky_factory, max_delay=0.001)
+    with pytest.raises(TimeoutError):
+        group.submit({"short_code": "gc-fail", "original_url": "https://example.com/"}).result(timeout=5)
+    assert group.submit({"short_code": "gc-after", "original_url": "https://example.com/"}).result(timeout=5)
+    group.stop()
+
+
+def test_timeout_cancels_queued_insert(client, db, monkeypatch):
+    """Тест: не дождавшийся пачки запрос получает 503, а его вставка снимается с очереди"""
+    committer = group_commit.GroupCommitter([_factory(db)], source_index=lambda short_code: 0, max_delay=60)
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT_ENABLED", True)
+    monkeypatch.setattr(group_commit, "GROUP_COMMIT_TIMEOUT", 0.05)
+    monkeypatch.setattr(group_commit, "committer", committer)
+    try:
+        response = client.post("/links/shorten", json={"original_url": "https://example.com/", "custom_alias": "gc-slow"})
+        assert response.status_code == 503
+        assert response.json()["detail"] == "Link creation timed out, retry the request"
+    finally:
+        committer.stop()
+    assert db.query(models.Link).filter(models.Link.short_code == "gc-slow").count() == 0
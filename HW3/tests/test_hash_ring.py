@@ -0,0 +1,160 @@
+import pytest
+from collections import Counter
+from fnmatch import fnmatch
+from app import cache
+from app.circuit_breaker import CircuitBreaker
+from app.hash_ring import HashRing, RingRedis, routing_key
+
+
+class FakeNode:
+    """Узел Redis в памяти"""
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+        self.pipelines = 0
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("node is down")
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def set(self, key, value, **kwargs):
+        self._check()
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        self._check()
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match="*", count=None):
+        self._check()
+        return [key for key in list(self.data) if fnmatch(key, match)]
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, node):
+        self.node = node
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        self.node.pipelines += 1
+        self.node._check()
+        return [getattr(self.node, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+KEYS = [f"link:code{i}" for i in range(5000)]
+
+
+def test_ring_balance_and_minimal_remap():
+    """Тест: ключи распределены равномерно, удаление узла переносит только его ключи"""
+    ring = HashRing(["a", "b", "c", "d"], vnodes=160)
+    owners = {key: ring.node_for(key) for key in KEYS}
+    counts = Counter(owners.values())
+    assert all(0.15 < count / len(KEYS) < 0.35 for count in counts.values())
+
+    smaller = HashRing(["a", "b", "c"], vnodes=160)
+    moved = [key for key in KEYS if smaller.node_for(key) != owners[key]]
+    assert all(owners[key] == "d" for key in moved)
+    assert len(moved) == counts["d"]
+
+
+def test_service_keys_follow_base_key():
+    """Тест: блокировка, устаревшая копия и время загрузки лежат на узле ключа"""
+    ring = HashRing(["a", "b", "c"])
+    assert routing_key("stale:link:abc") == "link:abc"
+    for key in KEYS[:100]:
+        node = ring.node_for(key)
+        assert ring.node_for(f"stale:{key}") == node
+        assert ring.node_for(f"lock:{key}") == node
+        assert ring.node_for(f"delta:{key}") == node
+
+
+def test_failed_node_remaps_only_its_keys():
+    """Тест: при отказе узла его ключи обслуживает следующий узел, остальные не меняются"""
+    nodes = {name: FakeNode() for name in ("a", "b", "c")}
+    client = RingRedis(nodes)
+    for key in KEYS[:300]:
+        client.set(key, key)
+
+    nodes["a"].down = True
+    for key in KEYS[:300]:
+        owner = client.ring.node_for(key)
+        value = client.get(key)
+        if owner == "a":
+            assert value is None
+            client.set(key, key)
+            assert client.get(key) == key
+        else:
+            assert value == key
+
+    assert client.breakers["a"].state == "open"
+    assert not any(key in nodes["a"].data for key in KEYS[300:])
+
+
+def test_recovered_node_is_purged():
+    """Тест: вернувшийся узел не отдает значения, измененные или удаленные во время его отказа"""
+    now = [0.0]
+    nodes = {name: FakeNode() for name in ("a", "b")}
+    client = RingRedis(nodes, breaker_factory=lambda node: CircuitBreaker(
+        node, consecutive_failures=1, open_seconds=5, clock=lambda: now[0]
+    ))
+    edited = next(key for key in KEYS if client.ring.node_for(key) == "a")
+    deleted = next(key for key in KEYS if client.ring.node_for(key) == "a" and key != edited)
+    client.set(edited, "old")
+    client.set(deleted, "old")
+    nodes["a"].data["idem:test:key"] = "response"
+
+    nodes["a"].down = True
+    client.set(edited, "new")
+    client.delete(deleted)
+    assert client.breakers["a"].state == "open"
+
+    nodes["a"].down = False
+    now[0] += 10
+    assert client.get(deleted) is None
+    assert client.get(edited) is None
+    assert edited not in nodes["a"].data
+    assert nodes["a"].data["idem:test:key"] == "response"
+    client.set(edited, "fresh")
+    assert client.get(edited) == "fresh"
+    assert nodes["a"].data[edited] == "fresh"
+
+
+def test_pipeline_grouped_per_node():
+    """Тест: команды конвейера выполняются одним конвейером на узел и возвращаются по порядку"""
+    nodes = {name: FakeNode() for name in ("a", "b", "c")}
+    client = RingRedis(nodes)
+
+    pipe = client.pipeline(transaction=False)
+    for key in KEYS[:100]:
+        pipe.set(key, key.upper())
+        pipe.get(key)
+    results = pipe.execute()
+
+    assert results[1::2] == [key.upper() for key in KEYS[:100]]
+    assert all(node.pipelines == 1 for node in nodes.values())
+    assert client.delete(*KEYS[:100]) == 100
+
+
+def test_cache_uses_ring(monkeypatch):
+    """Тест: кэш пишет ключи с прежними префиксами на узлы кольца"""
+    nodes = {name: FakeNode() for name in ("a", "b")}
+    monkeypatch.setattr(cache, "TESTING", False)
+    monkeypatch.setattr(cache, "redis_client", RingRedis(nodes))
+
+    cache.set_link_cache("ring", "https://example.com/ring")
+    owner = cache.redis_client.ring.node_for("link:ring")
+    assert nodes[owner].data["link:ring"] == "https://example.com/ring"
+    assert cache.get_link_cache("ring") == "https://example.com/ring"
+    assert len(cache.circuit_state()["nodes"]) == 2
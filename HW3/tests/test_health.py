@@ -0,0 +1,109 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from app import health, warmup
+
+
+def test_prober_closes_sessions():
+    """Тест: проверка БД закрывает сессию"""
+    session = MagicMock()
+    prober = health.HealthProber(session_factory=lambda: session)
+
+    snapshot = prober.refresh()
+
+    assert snapshot["database"] == "healthy"
+    assert "latency_ms" in snapshot["details"]["database"]
+    session.close.assert_called_once()
+
+
+def test_prober_database_error():
+    """Тест: ошибка БД отражается в снимке, сессия закрывается"""
+    session = MagicMock()
+    session.execute.side_effect = Exception("DB is down")
+    prober = health.HealthProber(session_factory=lambda: session)
+
+    snapshot = prober.refresh()
+
+    assert snapshot["status"] == "unhealthy"
+    assert snapshot["details"]["database"]["error"] == "DB is down"
+    session.close.assert_called_once()
+
+
+def test_snapshot_does_not_probe():
+    """Тест: чтение снимка не обращается к БД"""
+    factory = MagicMock()
+    prober = health.HealthProber(session_factory=factory)
+    assert prober.is_stale()
+
+    prober.refresh()
+    assert not prober.is_stale()
+    for _ in range(10):
+        prober.snapshot()
+
+    assert factory.call_count == 1
+    assert "redis_circuit" in prober.snapshot()
+    assert "class" in prober.snapshot()["pool"]
+
+
+def test_healthz_uses_snapshot(client):
+    """Тест: /healthz отдает снимок фоновой проверки"""
+    with patch.object(health.prober, "refresh", wraps=health.prober.refresh) as mock_refresh:
+        client.get("/healthz")
+        client.get("/healthz")
+        assert mock_refresh.call_count <= 1
+
+    data = client.get("/healthz").json()
+    assert data["database"] == "healthy"
+    assert "age_seconds" in data
+
+
+def test_readyz_during_warmup(client):
+    """Тест: /readyz не принимает трафик во время прогрева кэша"""
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+    warmup.startup_complete.clear()
+    try:
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["warming_up"] is True
+    finally:
+        warmup.startup_complete.set()
+
+
+def test_first_probe_is_shared_by_concurrent_requests():
+    """Тест: одновременные запросы без снимка выполняют одну проверку"""
+    calls = []
+
+    def slow_factory():
+        calls.append(1)
+        time.sleep(0.05)
+        return MagicMock()
+
+    prober = health.HealthProber(session_factory=slow_factory)
+    threads = [threading.Thread(target=prober.ensure_snapshot) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert prober.has_snapshot()
+
+
+def test_stale_snapshot_is_served_and_thread_restarted():
+    """Тест: устаревший снимок отдается без проверки в запросе, фоновый поток перезапускается"""
+    factory = MagicMock()
+    prober = health.HealthProber(session_factory=factory)
+    prober.refresh()
+    prober._checked_at -= prober.max_age + 1
+
+    with patch.object(prober, "refresh") as mock_refresh, patch.object(prober, "start") as mock_start:
+        snapshot = prober.current()
+
+    mock_refresh.assert_not_called()
+    mock_start.assert_called_once()
+    assert snapshot["age_seconds"] > prober.max_age
+    assert snapshot["database"] == "healthy"
@@ -0,0 +1,36 @@
+import pytest
+from app import hll
+
+
+def test_estimate_within_error_bound():
+    """Тест: оценка отличается от точного числа не больше чем на 3 стандартные ошибки"""
+    sketch = hll.HyperLogLog()
+    for i in range(50000):
+        sketch.add(f"visitor-{i}")
+        sketch.add(f"visitor-{i}")
+    assert abs(sketch.count() - 50000) / 50000 < 3 * hll.relative_error()
+
+    small = hll.HyperLogLog()
+    for i in range(100):
+        small.add(f"visitor-{i}")
+    assert abs(small.count() - 100) <= 2
+    assert hll.HyperLogLog().count() == 0
+
+
+def test_merge_and_serialization():
+    """Тест: объединение скетчей равно скетчу по всем элементам, сжатое представление восстанавливается"""
+    first, second, both = hll.HyperLogLog(), hll.HyperLogLog(), hll.HyperLogLog()
+    for i in range(3000):
+        first.add(f"v{i}")
+        both.add(f"v{i}")
+    for i in range(2000, 6000):
+        second.add(f"v{i}")
+        both.add(f"v{i}")
+
+    restored = hll.HyperLogLog.from_bytes(first.to_bytes())
+    restored.merge(second)
+    assert restored.registers == both.registers
+    assert len(hll.HyperLogLog().to_bytes()) < 100
+
+    with pytest.raises(ValueError):
+        restored.merge(hll.HyperLogLog(precision=10))
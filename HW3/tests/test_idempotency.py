@@ -0,0 +1,170 @@
+import json
+import threading
+import pytest
+from fastapi import HTTPException
+from app import cache, idempotency, models
+
+
+class FakeRedis:
+    """Redis в памяти: строки с SET NX и снятие блокировки"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token:
+            del self.data[key]
+            return 1
+        return 0
+
+
+@pytest.fixture(autouse=True)
+def clear_responses():
+    idempotency._responses.clear()
+    yield
+    idempotency._responses.clear()
+
+
+def test_repeated_key_replays_first_response(client, db):
+    """Тест: повтор с тем же ключом возвращает ту же ссылку и не создает вторую"""
+    headers = {"Idempotency-Key": "retry-1"}
+    first = client.post("/links/shorten", json={"original_url": "https://example.com/"}, headers=headers)
+    second = client.post("/links/shorten", json={"original_url": "https://example.com/"}, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers[idempotency.REPLAYED_HEADER] == "true"
+    assert idempotency.REPLAYED_HEADER not in first.headers
+    assert db.query(models.Link).count() == 1
+
+    other = client.post("/links/shorten", json={"original_url": "https://example.org/"}, headers=headers)
+    assert other.status_code == 422
+
+
+def test_client_errors_are_replayed(client, db):
+    """Тест: ответ 4xx сохраняется, повтор получает ту же ошибку"""
+    client.post("/links/shorten", json={"original_url": "https://example.com/", "custom_alias": "idem-taken"})
+    headers = {"Idempotency-Key": "retry-2"}
+    body = {"original_url": "https://example.org/", "custom_alias": "idem-taken"}
+    assert client.post("/links/shorten", json=body, headers=headers).status_code == 400
+
+    db.query(models.Link).filter(models.Link.short_code == "idem-taken").delete()
+    db.commit()
+    response = client.post("/links/shorten", json=body, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Custom alias already in use"
+
+
+def test_in_flight_duplicate_waits_for_first_request():
+    """Тест: одновременный повтор ждет первый запрос вместо второго выполнения"""
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def create():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"short_code": "abc123"}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(idempotency.run("test", "key", "fp", create)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(idempotency.run("test", "key", "fp", create)))
+    second.start()
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda result: result[1]) == [({"short_code": "abc123"}, False),
+                                                            ({"short_code": "abc123"}, True)]
+
+
+def test_other_worker_response_is_awaited(monkeypatch):
+    """Тест: при блокировке другого воркера ответ читается из Redis после его записи"""
+    client = FakeRedis()
+    monkeypatch.setattr(cache, "redis_client", client)
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT", 1)
+    storage_key = idempotency._storage_key("test", "busy")
+    client.data[f"{cache.LOCK_PREFIX}{storage_key}"] = "other-worker"
+
+    def finish_other_worker():
+        client.data[storage_key] = json.dumps({"fingerprint": "fp", "status": 200, "body": {"short_code": "other"}})
+
+    timer = threading.Timer(0.05, finish_other_worker)
+    timer.start()
+    assert idempotency.run("test", "busy", "fp", lambda: pytest.fail("must not run twice")) == ({"short_code": "other"}, True)
+
+    client.data[f"{cache.LOCK_PREFIX}{idempotency._storage_key('test', 'stuck')}"] = "other-worker"
+    with pytest.raises(HTTPException) as error:
+        idempotency.run("test", "stuck", "fp", lambda: None)
+    assert error.value.status_code == 409
+
+    assert idempotency.run("test", "fresh", "fp", lambda: {"ok": True}) == ({"ok": True}, False)
+    assert json.loads(client.data[idempotency._storage_key("test", "fresh")])["body"] == {"ok": True}
+    assert f"{cache.LOCK_PREFIX}{idempotency._storage_key('test', 'fresh')}" not in client.data
+
+
+def test_import_upload_with_same_key_returns_same_job(client, test_user, auth_token, tmp_path, monkeypatch):
+    """Тест: повтор загрузки файла импорта с тем же ключом не создает вторую задачу"""
+    from app import bulk_import
+    monkeypatch.setattr(bulk_import, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(bulk_import, "run_job", lambda job_id: None)
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "upload-1"}
+    files = {"file": ("links.csv", b"url\nhttps://example.com/\n", "text/csv")}
+
+    first = client.post("/links/import", headers=headers, files=files)
+    second = client.post("/links/import", headers=headers, files=files)
+    assert first.status_code == second.status_code == 202
+    assert second.json()["id"] == first.json()["id"]
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_import_upload_is_removed_when_no_job_is_created(client, test_user, auth_token, tmp_path, monkeypatch):
+    """Тест: файл импорта удаляется при отказе (422, повтор ошибки) и при сбое создания задачи"""
+    from app import bulk_import
+    monkeypatch.setattr(bulk_import, "IMPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(bulk_import, "run_job", lambda job_id: None)
+    headers = {"Authorization": f"Bearer {auth_token}", "Idempotency-Key": "upload-2"}
+
+    first = client.post("/links/import", headers=headers,
+                        files={"file": ("links.csv", b"url\nhttps://example.com/\n", "text/csv")})
+    assert first.status_code == 202
+    mismatch = client.post("/links/import", headers=headers,
+                           files={"file": ("links.csv", b"url\nhttps://example.com/b\n", "text/csv")})
+    assert mismatch.status_code == 422
+    assert len(list(tmp_path.iterdir())) == 1
+
+    def fail(*args, **kwargs):
+        raise HTTPException(status_code=409, detail="Import rejected")
+
+    monkeypatch.setattr(bulk_import, "create_job", fail)
+    files = {"file": ("links.csv", b"url\nhttps://example.com/c\n", "text/csv")}
+    for key in ("upload-3", "upload-3", None):
+        retry_headers = {**headers, "Idempotency-Key": key} if key else {"Authorization": headers["Authorization"]}
+        assert client.post("/links/import", headers=retry_headers, files=files).status_code == 409
+    assert len(list(tmp_path.iterdir())) == 1
+
+
+def test_cors_allows_idempotency_headers(client):
+    """Тест: браузерный клиент может передать Idempotency-Key и прочитать Idempotent-Replayed"""
+    preflight = client.options("/links/shorten", headers={
+        "Origin": "https://app.example.com",
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "idempotency-key",
+    })
+    assert preflight.status_code == 200
+    assert "idempotency-key" in preflight.headers["access-control-allow-headers"].lower()
+
+    response = client.get("/", headers={"Origin": "https://app.example.com"})
+    assert "idempotent-replayed" in response.headers["access-control-expose-headers"].lower()
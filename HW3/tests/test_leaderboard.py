@@ -0,0 +1,128 @@
+import pytest
+from datetime import datetime
+from app import cache, clicks, leaderboard, models, warmup
+
+
+class FakeRedis:
+    """Redis в памяти: строки и сортированные множества"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def zincrby(self, key, amount, member):
+        zset = self.data.setdefault(key, {})
+        zset[member] = zset.get(member, 0) + amount
+        return zset[member]
+
+    def _sorted(self, key):
+        return sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrange(self, key, start, end, withscores=False):
+        items = self._sorted(key)
+        return items[start:len(items) + end + 1 if end < 0 else end + 1]
+
+    def zrevrange(self, key, start, end, withscores=False):
+        items = self._sorted(key)[::-1]
+        return items[start:len(items) + end + 1 if end < 0 else end + 1]
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.data.get(key, {})
+        removed = [member for member, score in zset.items() if score <= high]
+        for member in removed:
+            del zset[member]
+        return len(removed)
+
+    def zremrangebyrank(self, key, start, end):
+        removed = self.zrange(key, start, end)
+        for member, _ in removed:
+            del self.data[key][member]
+        return len(removed)
+
+    def pipeline(self, transaction=False):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(cache, "redis_client", client)
+    monkeypatch.setattr(leaderboard, "_rotated", {})
+    return client
+
+
+def test_window_sums_expire_by_bucket(fake_redis):
+    """Тест: интервал вычитается из суммы окна один раз, когда выходит за пределы окна"""
+    start = 1_000_000 * 300.0
+    leaderboard.add_clicks({"lb-a": 5, "lb-b": 2}, now=start)
+    leaderboard.add_clicks({"lb-b": 4}, now=start + 1800)
+    assert leaderboard.top("1h", 10) == [("lb-b", 6), ("lb-a", 5)]
+    assert leaderboard.top("1d", 1) == [("lb-b", 6)]
+
+    assert leaderboard.rotate(now=start + 3600) == 0
+    assert leaderboard.rotate(now=start + 3900) == 1
+    assert leaderboard.top("1h", 10) == [("lb-b", 4)]
+    assert leaderboard.top("1d", 10) == [("lb-b", 6), ("lb-a", 5)]
+
+    # Другой воркер после запуска проверяет прошлые интервалы, но не вычитает их повторно
+    leaderboard._rotated.clear()
+    assert leaderboard.rotate(now=start + 3900) == 0
+    assert leaderboard.top("1h", 10) == [("lb-b", 4)]
+    assert leaderboard.hot_codes(10) == ["lb-b", "lb-a"]
+
+
+def test_flush_feeds_leaderboard_and_warmup_order(fake_redis, db):
+    """Тест: переходы из буфера попадают в рейтинг, прогрев берет сначала ссылки из рейтинга"""
+    for code, clicks_count in (("lb-cold", 1), ("lb-db-hot", 100), ("lb-hot", 0)):
+        db.add(models.Link(short_code=code, original_url=f"https://example.com/{code}",
+                           clicks=clicks_count, last_used=datetime.now()))
+    db.commit()
+
+    buffer = clicks.ClickBuffer()
+    for _ in range(3):
+        buffer.record("lb-hot")
+    buffer.record("lb-cold")
+    clicks.flush(buffer, [lambda: db], lambda code: 0)
+    assert leaderboard.top("1h", 10) == [("lb-hot", 3), ("lb-cold", 1)]
+
+    ids = warmup.hottest_link_ids(db, 3, hot_codes=leaderboard.hot_codes(3))
+    codes = {link.id: link.short_code for link in db.query(models.Link).all()}
+    assert [codes[i] for i in ids] == ["lb-hot", "lb-cold", "lb-db-hot"]
+
+
+def test_top_endpoint_falls_back_to_rollups(client, db):
+    """Тест: без Redis /links/top считает рейтинг по минутным агрегатам"""
+    now = datetime.now()
+    db.add(models.ClickRollup(short_code="lb-x", granularity="minute",
+                              bucket_start=clicks.bucket_start(now, "minute"), clicks=3))
+    db.add(models.ClickRollup(short_code="lb-y", granularity="minute",
+                              bucket_start=clicks.bucket_start(now, "minute"), clicks=8))
+    db.commit()
+
+    data = client.get("/links/top?window=1d&n=1").json()
+    assert data == {"window": "1d", "source": "database", "links": [{"short_code": "lb-y", "clicks": 8}]}
+    assert client.get("/links/top?window=1w").status_code == 400
+    assert client.get("/links/top?n=0").status_code == 400
@@ -0,0 +1,141 @@
+import json
+from sqlalchemy import event
+from app import cache, models
+from app.main import parse_if_match
+from tests.conftest import engine
+
+
+class FakePipeline:
+    """Конвейер Redis, записывающий команды до execute"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def delete(self, *keys):
+        self.commands.append(("delete", keys))
+
+    def set(self, key, value, ex=None):
+        self.commands.append(("set", key, value))
+
+    def execute(self):
+        self.redis.executed.append(self.commands)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+def _create(client, headers, alias):
+    response = client.post("/links/shorten", json={"original_url": "https://example.com/a", "custom_alias": alias},
+                           headers=headers)
+    assert response.status_code == 200
+
+
+def test_parse_if_match():
+    """Тест: разбор заголовка If-Match"""
+    assert parse_if_match(None) is None
+    assert parse_if_match("*") is None
+    assert parse_if_match('"3"') == [3]
+    assert parse_if_match('"3", "4"') == [3, 4]
+    assert parse_if_match('W/"3"') == []
+    assert parse_if_match("3") == []
+
+
+def test_update_with_if_match(client, db, auth_token):
+    """Тест: ETag версии ссылки, обновление по If-Match и 412 для устаревшей версии"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _create(client, headers, "ver-one")
+    assert client.get("/links/ver-one").headers["ETag"] == '"1"'
+
+    response = client.put("/links/ver-one", json={"original_url": "https://example.com/b"},
+                          headers={**headers, "If-Match": '"1"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"2"'
+    assert client.get("/links/ver-one").headers["ETag"] == '"2"'
+
+    response = client.put("/links/ver-one", json={"original_url": "https://example.com/c"},
+                          headers={**headers, "If-Match": '"1"'})
+    assert response.status_code == 412
+    assert db.query(models.Link).filter(models.Link.short_code == "ver-one").one().original_url == "https://example.com/b"
+
+    response = client.put("/links/ver-one", json={"original_url": "https://example.com/c"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"3"'
+
+    assert client.put("/links/missing", json={"original_url": "https://example.com/"},
+                      headers={**headers, "If-Match": '"1"'}).status_code == 404
+
+
+def test_update_is_single_statement(client, auth_token, monkeypatch):
+    """Тест: изменение ссылки - один UPDATE без чтения ссылки до и после него"""
+    monkeypatch.setattr("app.background_tasks.cleanup_expired_links", lambda db: None)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _create(client, headers, "ver-single")
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", collect)
+    try:
+        response = client.put("/links/ver-single", json={"custom_alias": "ver-renamed"},
+                              headers={**headers, "If-Match": '"1"'})
+    finally:
+        event.remove(engine, "before_cursor_execute", collect)
+    assert response.status_code == 200
+    updates = [statement for statement in statements if statement.startswith("UPDATE")]
+    assert len(updates) == 1 and updates[0].startswith("UPDATE links")
+    assert not [statement for statement in statements if statement.startswith("SELECT") and "FROM links" in statement]
+
+
+def test_update_refreshes_cache(client, auth_token):
+    """Тест: после смены псевдонима кэш содержит новые значения, прежний код удален"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    _create(client, headers, "ver-old")
+    client.get("/links/ver-old")
+    assert cache.get_stats_cache("ver-old") is not None
+
+    response = client.put("/links/ver-old", json={"custom_alias": "ver-new", "original_url": "https://example.com/b"},
+                          headers=headers)
+    assert response.status_code == 200
+    assert cache.get_link_cache("ver-old") is None
+    assert cache.get_stats_cache("ver-old") is None
+    assert cache.get_link_cache("ver-new") == "https://example.com/b"
+    assert cache.get_stats_cache("ver-new")["version"] == 2
+
+
+def test_refresh_link_uses_one_pipeline(monkeypatch):
+    """Тест: удаление прежних ключей и запись новых значений - один конвейер Redis"""
+    redis = FakeRedis()
+    monkeypatch.setattr(cache, "TESTING", False)
+    monkeypatch.setattr(cache, "redis_client", redis)
+    stats = {"short_code": "ver-new", "original_url": "https://example.com/", "version": 2}
+
+    cache.refresh_link(stats, removed=["ver-old"])
+
+    assert len(redis.executed) == 1
+    commands = redis.executed[0]
+    deleted = commands[0][1]
+    assert "link:ver-old" in deleted and "stats:ver-old" in deleted
+    assert ("set", "link:ver-new", "https://example.com/") in commands
+    assert ("set", "stats:ver-new", json.dumps(stats)) in commands
+    assert cache._fallback_cache.get("link:ver-new") == "https://example.com/"
+
+
+def test_cors_allows_version_headers(client):
+    """Тест: браузерный клиент может передать If-Match и прочитать ETag"""
+    preflight = client.options("/links/ver-one", headers={
+        "Origin": "https://app.example.com",
+        "Access-Control-Request-Method": "PUT",
+        "Access-Control-Request-Headers": "if-match",
+    })
+    assert preflight.status_code == 200
+    assert "if-match" in preflight.headers["access-control-allow-headers"].lower()
+
+    response = client.get("/", headers={"Origin": "https://app.example.com"})
+    assert "etag" in response.headers["access-control-expose-headers"].lower()
@@ -0,0 +1,71 @@
+from unittest.mock import patch
+from sqlalchemy import event
+from app import changes, models
+from app.main import insert_link, update_owned_link
+from tests.conftest import engine
+
+
+def _statements(monkeypatch):
+    """SQL-запросы, выполненные во время теста (фоновая очистка отключена)"""
+    monkeypatch.setattr("app.background_tasks.cleanup_expired_links", lambda db: None)
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[0].upper())
+
+    event.listen(engine, "before_cursor_execute", collect)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", collect)
+
+
+def test_insert_link_returns_server_defaults_and_detects_conflict(db):
+    """Тест: вставка возвращает id и created_at без refresh, занятый код дает None"""
+    link = insert_link(db, short_code="ins-one", original_url="https://example.com/1")
+    assert link.id is not None
+    assert link.created_at is not None
+    assert link.clicks == 0 and link.is_active
+    db.commit()
+
+    assert insert_link(db, short_code="ins-one", original_url="https://example.com/2") is None
+    db.commit()
+    assert db.query(models.Link).filter(models.Link.short_code == "ins-one").one().original_url == "https://example.com/1"
+    assert [change.action for change in db.query(models.LinkChange)] == [changes.CREATE]
+
+
+def test_create_link_without_lookups(client, monkeypatch):
+    """Тест: создание ссылки - вставка и журнал, без SELECT перед вставкой и после нее"""
+    statements, stop = _statements(monkeypatch)
+    try:
+        response = client.post("/links/shorten", json={"original_url": "https://example.com/", "custom_alias": "one-trip"})
+    finally:
+        stop()
+    assert response.status_code == 200
+    assert response.json()["created_at"]
+    assert "SELECT" not in statements
+    assert statements.count("INSERT") == 2
+
+
+def test_generated_code_collision_retries(client, db):
+    """Тест: при занятом сгенерированном коде берется следующий"""
+    db.add(models.Link(short_code="abcdef", original_url="https://example.com/taken"))
+    db.commit()
+
+    with patch("shortuuid.uuid", side_effect=["abcdefXYZ", "ghijklXYZ"]):
+        response = client.post("/links/shorten", json={"original_url": "https://example.com/new"})
+    assert response.status_code == 200
+    assert response.json()["short_code"] == "ghijkl"
+
+
+def test_rename_link_conflict(db, test_user):
+    """Тест: смена кода одним UPDATE не затрагивает чужую ссылку и увеличивает версию"""
+    db.add_all([
+        models.Link(short_code="ren-one", original_url="https://example.com/1", owner_id=test_user.id),
+        models.Link(short_code="ren-two", original_url="https://example.com/2", owner_id=test_user.id),
+    ])
+    db.commit()
+
+    rename = {"short_code": "ren-two", "custom_alias": "ren-two"}
+    assert update_owned_link(db, "ren-one", test_user.id, rename) is None
+    row = update_owned_link(db, "ren-one", test_user.id, {"short_code": "ren-three", "custom_alias": "ren-three"})
+    assert (row.short_code, row.original_url, row.version) == ("ren-three", "https://example.com/1", 2)
+    db.commit()
+    assert db.query(models.Link.short_code).order_by(models.Link.short_code).all() == [("ren-three",), ("ren-two",)]
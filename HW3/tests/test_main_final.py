@@ -132,6 +132,7 @@ def test_startup_event_with_mocks():
             mock_execute.return_value.fetchone.return_value = (1,)
             mock_redis.ping.return_value = True
             
-            startup_handlers = [handler for handler in app.router.on_startup]
+            with TestClient(app) as startup_client:
+                assert startup_client.get("/").status_code == 200
             
-            assert len(startup_handlers) > 0
+            assert "schema" in app.state.startup_timings
@@ -0,0 +1,28 @@
+from sqlalchemy import create_engine, inspect, text
+from app import migrate, models
+from app.sharding import ShardSet
+
+
+def _old_database():
+    """БД с таблицей links без колонки version"""
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE links DROP COLUMN version"))
+        conn.execute(text("INSERT INTO links (short_code, original_url) VALUES ('old', 'https://example.com/')"))
+    return engine
+
+
+def test_create_schema_adds_missing_columns(monkeypatch):
+    """Тест: миграция добавляет новые колонки в существующие таблицы основной БД и шардов"""
+    main_engine, shard_engine = _old_database(), _old_database()
+    monkeypatch.setattr(migrate, "engine", main_engine)
+    monkeypatch.setattr(migrate, "shards", ShardSet([shard_engine]))
+
+    migrate.create_schema()
+
+    for engine in (main_engine, shard_engine):
+        assert "version" in {column["name"] for column in inspect(engine).get_columns("links")}
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT version FROM links WHERE short_code = 'old'")).scalar() == 1
+    assert migrate.add_missing_columns(main_engine, models.Base.metadata) == []
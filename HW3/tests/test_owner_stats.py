@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app import cache, clicks, models, owner_stats
+
+
+def _add_links(db, owner_id):
+    now = datetime.now()
+    db.add_all([
+        models.Link(short_code="os-a", original_url="https://example.com/a", clicks=5, owner_id=owner_id),
+        models.Link(short_code="os-b", original_url="https://example.com/b", clicks=2, owner_id=owner_id),
+        models.Link(short_code="os-exp", original_url="https://example.com/e", clicks=1, owner_id=owner_id,
+                    expires_at=now - timedelta(days=1)),
+        models.Link(short_code="os-off", original_url="https://example.com/o", clicks=3, owner_id=owner_id,
+                    is_active=False),
+        models.Link(short_code="os-other", original_url="https://example.com/x", clicks=50),
+        models.ExpiredLink(short_code="os-old", original_url="https://example.com/old", total_clicks=7,
+                           owner_id=owner_id),
+        models.ClickRollup(short_code="os-a", granularity="day", bucket_start=clicks.bucket_start(now, "day"),
+                           clicks=4),
+        models.ClickRollup(short_code="os-a", granularity="day",
+                           bucket_start=clicks.bucket_start(now - timedelta(days=1), "day"), clicks=9),
+    ])
+    db.commit()
+
+
+def test_my_stats_cached_and_invalidated(client, db, test_user, auth_token):
+    """Тест: сводка по ссылкам пользователя считается группировкой, кэшируется и сбрасывается при изменении"""
+    _add_links(db, test_user.id)
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    data = client.get("/users/me/stats", headers=headers).json()
+    assert {key: data[key] for key in owner_stats.COUNTERS} == {
+        "active_links": 2, "expired_links": 1, "inactive_links": 1, "archived_links": 1,
+        "total_clicks": 11, "clicks_today": 4,
+    }
+    assert data["total_links"] == 4
+    assert data["top_links"][:2] == [{"short_code": "os-a", "clicks": 5}, {"short_code": "os-b", "clicks": 2}]
+
+    # Массовый UPDATE мимо журнала изменений не сбрасывает кэш
+    db.execute(update(models.Link).where(models.Link.short_code == "os-b").values(clicks=100))
+    db.commit()
+    assert client.get("/users/me/stats", headers=headers).json()["total_clicks"] == 11
+
+    link = db.query(models.Link).filter(models.Link.short_code == "os-a").first()
+    link.is_active = False
+    db.commit()
+    data = client.get("/users/me/stats", headers=headers).json()
+    assert (data["active_links"], data["inactive_links"], data["total_clicks"]) == (1, 2, 109)
+    assert client.get("/users/me/stats").status_code == 401
+
+
+def test_summary_maintained_for_large_owners(db):
+    """Тест: сводка хранится для владельцев с большим числом ссылок и используется, пока свежая"""
+    _add_links(db, 42)
+    assert owner_stats.refresh_summaries(db, [42, None], min_links=10) == 0
+    assert db.get(models.OwnerSummary, 42) is None
+
+    assert owner_stats.refresh_summaries(db, [42], min_links=4) == 1
+    summary = db.get(models.OwnerSummary, 42)
+    assert (summary.active_links, summary.total_clicks, summary.clicks_today) == (2, 11, 4)
+
+    db.execute(update(models.Link).where(models.Link.short_code == "os-b").values(clicks=100))
+    db.commit()
+    assert owner_stats.source_stats(db, 42)["total_clicks"] == 11
+    assert owner_stats.source_stats(db, 42, max_age=0)["total_clicks"] == 109
+
+    # Свертка не пересчитывает свежую сводку, задача очистки пересчитывает сразу
+    assert owner_stats.refresh_for_codes(db, ["os-b"], min_age=60) == 0
+    assert owner_stats.refresh_summaries(db, [42], min_links=4) == 1
+    assert db.get(models.OwnerSummary, 42).total_clicks == 109
+
+    assert owner_stats.refresh_summaries(db, [42], min_links=100) == 0
+    assert db.get(models.OwnerSummary, 42) is None
+    merged = owner_stats.merge([owner_stats.compute(db, 42), owner_stats.compute(db, 42)], top_n=3)
+    assert merged["total_links"] == 8
+    assert [link["short_code"] for link in merged["top_links"]] == ["os-b", "os-b", "os-a"]
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app import database
+
+
+def test_engine_options_from_config(monkeypatch):
+    """Тест: настройки пула применяются к PostgreSQL, режим PgBouncer отключает подготовку выражений"""
+    options = database.engine_options("postgresql://user:pass@db/app")
+    assert options["poolclass"] is database.InstrumentedQueuePool
+    assert options["pool_size"] == database.DB_POOL_SIZE
+    assert options["pool_pre_ping"] is database.DB_POOL_PRE_PING
+    assert "connect_args" not in options
+
+    monkeypatch.setattr(database, "DB_PGBOUNCER", True)
+    options = database.engine_options("postgresql+psycopg://user:pass@db/app")
+    assert options["connect_args"] == {"prepare_threshold": None}
+
+    assert "pool_size" not in database.engine_options("sqlite:///local.db")
+
+
+def test_pool_telemetry_counts_waits_and_timeouts(tmp_path):
+    """Тест: ожидание соединения и таймауты пула попадают в счетчики и метрики"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path}/pool.db", poolclass=database.InstrumentedQueuePool,
+        pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    telemetry = database.instrument_engine(engine, "pool-test")
+
+    first = engine.connect()
+    with pytest.raises(PoolTimeoutError):
+        engine.connect()
+    snapshot = telemetry.snapshot()
+    assert snapshot["checked_out"] == 1
+    assert snapshot["timeouts"] == 1
+    assert snapshot["wait_max_ms"] >= 50
+
+    first.close()
+    assert telemetry.snapshot()["checked_out"] == 0
+    assert database.pool_checked_out.value({"engine": "pool-test"}) == 0
+
+    engine.dispose()
+    with engine.connect():
+        assert telemetry.snapshot()["checkouts"] == 2
+    database.pool_telemetry.pop("pool-test")
+
+
+def test_metrics_endpoint(client):
+    """Тест: /metrics отдает метрики пула в формате Prometheus, /healthz - счетчики пула"""
+    client.get("/healthz")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "# TYPE db_pool_checkout_wait_seconds histogram" in response.text
+    assert "db_pool_timeouts_total" in response.text
+
+    assert "primary" in client.get("/healthz").json()["pool"]["telemetry"]
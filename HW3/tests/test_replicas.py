@@ -0,0 +1,64 @@
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app import cache, database, models
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    """Реплика в отдельной базе в памяти с пустыми таблицами"""
+    replica_engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=replica_engine)
+    monkeypatch.setattr(database, "read_router", database.ReplicaRouter(database.engine, [replica_engine]))
+    session = sessionmaker(bind=replica_engine)()
+    yield session
+    session.close()
+    replica_engine.dispose()
+
+
+def test_router_round_robin_and_unhealthy():
+    """Тест: реплики выбираются по кругу, недоступные пропускаются"""
+    primary, first, second = MagicMock(), MagicMock(), MagicMock()
+    router = database.ReplicaRouter(primary, [first, second], retry_seconds=60)
+
+    assert {router.choose() for _ in range(4)} == {first, second}
+
+    router.mark_unhealthy(first)
+    assert {router.choose() for _ in range(4)} == {second}
+
+    router.mark_unhealthy(second)
+    assert router.choose() is primary
+
+
+def test_reads_go_to_replica(client, db, replica):
+    """Тест: статистика читается с реплики, заголовок X-Read-Primary направляет на основную БД"""
+    replica.add(models.Link(short_code="rr-stale", original_url="https://replica.example.com"))
+    replica.commit()
+
+    response = client.get("/links/rr-stale/stats")
+    assert response.status_code == 200
+    assert response.json()["original_url"] == "https://replica.example.com"
+
+    cache.delete_link_cache("rr-stale")
+    response = client.get("/links/rr-stale/stats", headers={database.PRIMARY_READ_HEADER: "1"})
+    assert response.status_code == 404
+
+
+def test_replica_lag_falls_back_to_primary(client, db, replica):
+    """Тест: ссылка, еще не попавшая на реплику, читается с основной БД, клик пишется на основную"""
+    response = client.post("/links/shorten", json={"original_url": "https://example.com/lag"})
+    assert response.status_code == 200
+    assert database.PRIMARY_READ_COOKIE in response.cookies
+    short_code = response.json()["short_code"]
+    cache.delete_link_cache(short_code)
+    client.cookies.clear()
+
+    response = client.get(f"/{short_code}", follow_redirects=False)
+    assert response.status_code == 307
+
+    link = db.query(models.Link).filter(models.Link.short_code == short_code).first()
+    assert link.clicks == 1
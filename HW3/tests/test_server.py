@@ -0,0 +1,89 @@
+import pytest
+from app import server
+
+
+def _write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_cgroup_cpu_limit(tmp_path):
+    """Тест: квота CPU из cgroup v2 и v1, отсутствие ограничения"""
+    v2 = tmp_path / "v2"
+    _write(v2 / "cpu.max", "250000 100000\n")
+    assert server._cgroup_cpu_limit(str(v2)) == 2.5
+
+    _write(tmp_path / "v2max" / "cpu.max", "max 100000\n")
+    assert server._cgroup_cpu_limit(str(tmp_path / "v2max")) is None
+
+    v1 = tmp_path / "v1"
+    _write(v1 / "cpu" / "cpu.cfs_quota_us", "150000\n")
+    _write(v1 / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert server._cgroup_cpu_limit(str(v1)) == 1.5
+
+    _write(tmp_path / "v1none" / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    _write(tmp_path / "v1none" / "cpu" / "cpu.cfs_period_us", "100000\n")
+    assert server._cgroup_cpu_limit(str(tmp_path / "v1none")) is None
+    assert server._cgroup_cpu_limit(str(tmp_path / "missing")) is None
+
+    # Квота 2.5 ядра округляется вверх, но не больше привязанных ядер
+    assert 1 <= server.available_cpus(str(v2)) <= 3
+
+
+@pytest.mark.parametrize("env, cpus, expected", [
+    ({}, 1, 2),
+    ({}, 8, 8),
+    ({"WORKERS_PER_CORE": "2"}, 4, 8),
+    ({"MAX_WORKERS": "4"}, 16, 4),
+    ({"WEB_CONCURRENCY": "3"}, 16, 3),
+])
+def test_default_workers(monkeypatch, env, cpus, expected):
+    """Тест: число воркеров по ядрам и переменным окружения"""
+    for name in ("WEB_CONCURRENCY", "WORKERS_PER_CORE", "MAX_WORKERS"):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert server.default_workers(cpus) == expected
+
+
+def test_build_options():
+    """Тест: разброс перезапуска воркеров и gc.freeze только вместе с preload"""
+    options = server.build_options(server.parse_args(["--workers", "3", "--max-requests", "5000"]))
+    assert options["workers"] == 3
+    assert options["preload_app"] is True
+    assert options["max_requests_jitter"] == 500
+    assert options["when_ready"] is server.freeze_heap
+    assert options["worker_class"] == "app.server.FastWorker"
+
+    options = server.build_options(server.parse_args(["--no-gc-freeze"]))
+    assert "when_ready" not in options
+
+    options = server.build_options(server.parse_args(["--no-preload"]))
+    assert options["preload_app"] is False
+    assert "when_ready" not in options
+
+    options = server.build_options(server.parse_args([]))
+    assert "on_exit" not in options or options["on_exit"] is server.stop_table_refresher
+
+    with_table = server.parse_args(["--no-gc-freeze"])
+    with_table.shared_table = True
+    options = server.build_options(with_table)
+    assert options["when_ready"] is server.start_table_refresher
+    assert options["on_exit"] is server.stop_table_refresher
+
+    assert server.parse_args([]).app == server.APP_PATH
+    assert server.parse_args(["--app", "app.edge:app"]).app == "app.edge:app"
+
+    loop = server.event_loop_options()
+    assert loop["loop"] in ("uvloop", "asyncio")
+    assert loop["http"] in ("httptools", "h11")
+
+
+def test_single_process_has_no_request_limit(monkeypatch):
+    """Тест: один процесс uvicorn не завершается после max_requests запросов"""
+    import uvicorn
+    calls = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: calls.append(kwargs))
+    server.run_single(server.build_options(server.parse_args(["--workers", "1", "--bind", "127.0.0.1:9000"])))
+    assert calls[0]["port"] == 9000
+    assert "limit_max_requests" not in calls[0]
@@ -0,0 +1,113 @@
+import pytest
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from app import cache, models, sharding
+
+
+@pytest.fixture
+def shard_set(tmp_path, monkeypatch):
+    """Три файла SQLite вместо шардов"""
+    engines = [
+        create_engine(f"sqlite:///{tmp_path}/shard{i}.db", connect_args={"check_same_thread": False})
+        for i in range(3)
+    ]
+    shard_set = sharding.ShardSet(engines)
+    shard_set.create_all()
+    monkeypatch.setattr(sharding, "shards", shard_set)
+    yield shard_set
+    for engine in engines:
+        engine.dispose()
+
+
+def alias_on_shard(shard_set, index, prefix="alias"):
+    return next(f"{prefix}{i}" for i in range(1000) if shard_set.index_for(f"{prefix}{i}") == index)
+
+
+def stored_on(shard_set, short_code):
+    """Номера шардов, на которых лежит ссылка"""
+    result = []
+    for index, factory in enumerate(shard_set.session_factories):
+        session = factory()
+        try:
+            if session.query(models.Link).filter(models.Link.short_code == short_code).first():
+                result.append(index)
+        finally:
+            session.close()
+    return result
+
+
+def test_shard_index_is_stable():
+    """Тест: номер шарда не зависит от процесса и лежит в диапазоне"""
+    assert sharding.shard_index("abc123", 4) == zlib.crc32(b"abc123") % 4
+    indexes = {sharding.shard_index(f"code{i}", 4) for i in range(100)}
+    assert indexes == {0, 1, 2, 3}
+
+
+def test_point_lookups_use_one_shard(client, db, auth_token, shard_set):
+    """Тест: ссылка создается, читается и обновляется на своем шарде"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for index in range(3):
+        alias = alias_on_shard(shard_set, index)
+        response = client.post("/links/shorten", json={
+            "original_url": f"https://example.com/{index}", "custom_alias": alias
+        }, headers=headers)
+        assert response.status_code == 200
+        assert stored_on(shard_set, alias) == [index]
+
+        cache.delete_link_cache(alias)
+        assert client.get(f"/{alias}", follow_redirects=False).status_code == 307
+        assert client.get(f"/links/{alias}").json()["clicks"] == 1
+
+    response = client.post("/links/shorten", json={"original_url": "https://example.com/generated"})
+    short_code = response.json()["short_code"]
+    assert stored_on(shard_set, short_code) == [shard_set.index_for(short_code)]
+    assert db.query(models.Link).count() == 0
+
+    alias = alias_on_shard(shard_set, 0)
+    assert client.delete(f"/links/{alias}", headers=headers).status_code == 204
+    cache.delete_link_cache(alias)
+    assert client.get(f"/{alias}", follow_redirects=False).status_code == 404
+
+
+def test_update_moves_link_between_shards(client, auth_token, shard_set):
+    """Тест: новый псевдоним с другого шарда переносит ссылку"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    source = alias_on_shard(shard_set, 0, "src")
+    target = alias_on_shard(shard_set, 2, "dst")
+    client.post("/links/shorten", json={"original_url": "https://example.com/move", "custom_alias": source},
+                headers=headers)
+
+    response = client.put(f"/links/{source}", json={"custom_alias": target}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["short_code"] == target
+    assert stored_on(shard_set, source) == []
+    assert stored_on(shard_set, target) == [2]
+
+
+def test_user_queries_fan_out(client, test_user, auth_token, shard_set):
+    """Тест: поиск и истекшие ссылки собираются со всех шардов"""
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    for index, factory in enumerate(shard_set.session_factories):
+        session = factory()
+        session.add(models.Link(
+            short_code=alias_on_shard(shard_set, index, "old"),
+            original_url=f"https://example.com/old/{index}",
+            expires_at=datetime.now() - timedelta(days=1),
+            owner_id=test_user.id
+        ))
+        session.commit()
+        session.close()
+
+    response = client.get("/links/search", params={"original_url": "https://example.com/old/2"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["short_code"] == alias_on_shard(shard_set, 2, "old")
+
+    response = client.get("/expired-links", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+
+    session = shard_set.session_factories[1]()
+    assert session.query(models.Link).filter(models.Link.is_active == True).count() == 0
+    session.close()
@@ -0,0 +1,89 @@
+import time
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import cache, models, shared_table
+from app.shared_table import Entry, SharedLinkTable, build_table
+
+
+@pytest.fixture
+def table_path(tmp_path):
+    return str(tmp_path / "links.table")
+
+
+def test_build_and_lookup(table_path):
+    """Тест: поиск по таблице с коллизиями, удаленные и истекшие ссылки"""
+    entries = [Entry(f"code{i}", f"https://example.com/{i}", True, None) for i in range(1000)]
+    entries.append(Entry("gone", "https://example.com/gone", False, None))
+    entries.append(Entry("old", "https://example.com/old", True, time.time() - 60))
+    assert build_table(table_path, entries) == 1002
+
+    table = SharedLinkTable(table_path)
+    for i in (0, 1, 500, 999):
+        assert table.get_url(f"code{i}") == (f"https://example.com/{i}", False)
+    assert table.get_url("missing") == (None, False)
+    assert table.get_url("gone") == (None, True)
+    assert table.get_url("old") == (None, False)
+    assert table.snapshot()["entries"] == 1002
+
+
+def test_swap_and_invalidate(table_path):
+    """Тест: подмена файла подхватывается читателем, измененные коды не читаются до перестроения"""
+    assert SharedLinkTable(table_path).lookup("a") is None
+
+    build_table(table_path, [Entry("a", "https://example.com/1", True, None)])
+    table = SharedLinkTable(table_path, check_interval=0)
+    assert table.get_url("a")[0] == "https://example.com/1"
+
+    table.invalidate("a")
+    assert table.lookup("a") is None
+
+    build_table(table_path, [Entry("a", "https://example.com/2", True, None)])
+    assert table.get_url("a")[0] == "https://example.com/2"
+
+
+def test_refresh_table_from_db(tmp_path, table_path):
+    """Тест: таблица строится из популярных ссылок, удаленные попадают без признака активности"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'links.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    now = datetime.now()
+    with Session() as db:
+        db.add_all([
+            models.Link(short_code="st-hot", original_url="https://example.com/hot", clicks=10, last_used=now),
+            models.Link(short_code="st-gone", original_url="https://example.com/gone", clicks=5,
+                        last_used=now, is_active=False),
+            models.Link(short_code="st-cold", original_url="https://example.com/cold", clicks=0,
+                        expires_at=now + timedelta(days=1)),
+        ])
+        db.commit()
+
+    result = shared_table.refresh_table(table_path, max_links=2, session_factories=[Session])
+    engine.dispose()
+
+    assert result["links"] == 2
+    table = SharedLinkTable(table_path)
+    assert table.get_url("st-hot") == ("https://example.com/hot", False)
+    assert table.get_url("st-gone") == (None, True)
+    assert table.lookup("st-cold") is None
+
+
+def test_redirect_uses_shared_table(client, db, test_user, table_path, monkeypatch):
+    """Тест: перенаправление берет URL из таблицы, изменение ссылки в процессе обходит таблицу"""
+    db.add(models.Link(short_code="st-link", original_url="https://example.com/db", owner_id=test_user.id))
+    db.commit()
+    build_table(table_path, [
+        Entry("st-link", "https://example.com/table", True, None),
+        Entry("st-deleted", "https://example.com/deleted", False, None),
+    ])
+    monkeypatch.setattr(shared_table, "link_table", SharedLinkTable(table_path))
+
+    response = client.get("/st-link", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/table"
+    assert client.get("/st-deleted", follow_redirects=False).status_code == 404
+
+    cache.delete_link_cache("st-link")
+    response = client.get("/st-link", follow_redirects=False)
+    assert response.headers["location"] == "https://example.com/db"
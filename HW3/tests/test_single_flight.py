@@ -0,0 +1,112 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+from app import cache, models
+
+
+def test_single_flight_concurrent_misses():
+    """Тест: одновременные промахи по одному ключу выполняют одну загрузку"""
+    calls = []
+    barrier = threading.Barrier(8)
+    results = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"short_code": "hot", "clicks": 1}
+
+    def worker():
+        barrier.wait()
+        results.append(cache.load_stats("sf-hot", loader))
+
+    cache._memory_cache.pop(f"{cache.STATS_PREFIX}sf-hot", None)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result == {"short_code": "hot", "clicks": 1} for result in results)
+    assert cache.get_stats_cache("sf-hot") == {"short_code": "hot", "clicks": 1}
+    cache.delete_link_cache("sf-hot")
+
+
+def test_single_flight_propagates_errors():
+    """Тест: ошибка загрузки передается всем ожидающим и не блокирует ключ"""
+    with pytest.raises(ValueError):
+        cache.single_flight("sf-error", lambda: (_ for _ in ()).throw(ValueError("boom")))
+
+    assert "sf-error" not in cache._inflight
+    assert cache.single_flight("sf-error", lambda: 42) == 42
+
+
+def test_load_link_not_found_is_not_cached():
+    """Тест: отсутствующая ссылка не попадает в кэш"""
+    assert cache.load_link("sf-missing", lambda: None) is None
+    assert cache.get_link_cache("sf-missing") is None
+
+
+def test_should_refresh_early():
+    """Тест вероятностного досрочного обновления (XFetch)"""
+    assert cache.should_refresh_early(0.05, 10, beta=0) is False
+    assert cache.should_refresh_early(0.05, 0, beta=1.0) is True
+    assert cache.should_refresh_early(0.001, 3600, beta=1.0) is False
+
+    refreshes = sum(cache.should_refresh_early(1.0, 1.0, beta=1.0) for _ in range(2000))
+    assert 500 < refreshes < 1000
+
+
+def _with_redis(mock_redis):
+    original = (cache.TESTING, cache.redis_client)
+    cache.TESTING = False
+    cache.redis_client = mock_redis
+    return original
+
+
+def test_lock_holder_loads_and_stores():
+    """Тест: воркер, получивший блокировку в Redis, загружает значение"""
+    mock_redis = MagicMock()
+    mock_redis.get.return_value = None
+    mock_redis.set.return_value = True
+    original = _with_redis(mock_redis)
+    try:
+        assert cache.load_link("sf-lock", lambda: "https://example.com/lock") == "https://example.com/lock"
+        lock_args = mock_redis.set.call_args
+        assert lock_args.args[0] == "lock:link:sf-lock"
+        assert lock_args.kwargs["nx"] is True
+        mock_redis.pipeline.return_value.set.assert_any_call(
+            "link:sf-lock", "https://example.com/lock", ex=cache.CACHE_TTL
+        )
+        mock_redis.eval.assert_called_once()
+    finally:
+        cache.TESTING, cache.redis_client = original
+
+
+def test_lock_waiter_gets_stale_value():
+    """Тест: без блокировки воркер получает устаревшую копию без обращения к БД"""
+    mock_redis = MagicMock()
+    mock_redis.set.return_value = False
+    mock_redis.get.side_effect = lambda key: "https://example.com/stale" if key.startswith("stale:") else None
+    loader = MagicMock(return_value="https://example.com/fresh")
+    original = _with_redis(mock_redis)
+    try:
+        assert cache.load_link("sf-stale", loader) == "https://example.com/stale"
+        loader.assert_not_called()
+    finally:
+        cache.TESTING, cache.redis_client = original
+
+
+def test_get_link_info_loads_once(client, db):
+    """Тест: статистика загружается из БД при промахе и кэшируется"""
+    db.add(models.Link(short_code="sf-info", original_url="https://example.com/info", is_active=True))
+    db.commit()
+    cache.delete_link_cache("sf-info")
+
+    response = client.get("/links/sf-info")
+    assert response.status_code == 200
+    assert cache.get_stats_cache("sf-info")["original_url"] == "https://example.com/info"
+
+    response = client.get("/links/sf-missing-info")
+    assert response.status_code == 404
@@ -0,0 +1,163 @@
+import os
+import time
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import edge, models, snapshot
+from app.snapshot import DELTA, Record, SnapshotFile, write_file
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'links.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def test_write_and_read_blocks(tmp_path):
+    """Тест: записи сортируются по коду, поиск по индексу распаковывает нужный блок"""
+    path = str(tmp_path / "snapshot-1.snap")
+    records = [Record(f"c{i:04d}", f"https://example.com/{i}", None) for i in reversed(range(250))]
+    records.append(Record("gone", None, None))
+    records.append(Record("c0007", "https://example.com/new", 1234.5))
+    assert write_file(path, records, DELTA, created_at=10.0, base=5.0, block_size=16) == 251
+
+    reader = SnapshotFile(path)
+    assert (reader.kind, reader.created_at, reader.base, reader.count) == (DELTA, 10.0, 5.0, 251)
+    assert len(reader.blocks) == 16
+    codes = [record.short_code for record in reader]
+    assert codes == sorted(codes)
+    assert reader.get("c0100") == Record("c0100", "https://example.com/100", None)
+    assert reader.get("c0007") == Record("c0007", "https://example.com/new", 1234.5)
+    assert reader.get("gone") == Record("gone", None, None)
+    assert reader.get("a") is None
+    assert reader.get("zzz") is None
+
+
+def test_export_snapshot_and_delta(tmp_path, file_session_factory):
+    """Тест: снимок содержит активные ссылки, дельта - ссылки из журнала изменений"""
+    directory = str(tmp_path / "edge")
+    old = datetime.now() - timedelta(days=1)
+    with file_session_factory() as db:
+        db.add_all([
+            models.Link(short_code="sn-keep", original_url="https://example.com/keep", created_at=old),
+            models.Link(short_code="sn-delete", original_url="https://example.com/delete", created_at=old),
+            models.Link(short_code="sn-expire", original_url="https://example.com/expire", created_at=old),
+            models.Link(short_code="sn-off", original_url="https://example.com/off", created_at=old,
+                        is_active=False),
+        ])
+        db.commit()
+
+    result = snapshot.export_snapshot(directory, [file_session_factory])
+    assert result["links"] == 3
+    assert snapshot.latest_files(directory) == (result["file"], [])
+
+    now = datetime.now()
+    with file_session_factory() as db:
+        db.add(models.Link(short_code="sn-new", original_url="https://example.com/new", created_at=now))
+        deleted = db.query(models.Link).filter_by(short_code="sn-delete").one()
+        deleted.is_active, deleted.last_used = False, now
+        db.query(models.Link).filter_by(short_code="sn-expire").one().is_active = False
+        db.add(models.ExpiredLink(short_code="sn-expire", original_url="https://example.com/expire",
+                                  created_at=old, expired_at=now))
+        db.query(models.Link).filter_by(short_code="sn-keep").one().original_url = "https://example.com/moved"
+        db.commit()
+
+    delta = snapshot.export_delta(directory, [file_session_factory])
+    assert snapshot.latest_files(directory) == (result["file"], [delta["file"]])
+    records = {record.short_code: record.original_url for record in SnapshotFile(os.path.join(directory, delta["file"]))}
+    assert records == {
+        "sn-new": "https://example.com/new",
+        "sn-keep": "https://example.com/moved",
+        "sn-delete": None,
+        "sn-expire": None,
+    }
+    assert snapshot.export_delta(directory, [file_session_factory])["links"] == 0
+
+
+def test_changed_records_stop_cursor_at_gap(file_session_factory):
+    """Тест: курсор дельты не уходит за номер записи, которая еще не зафиксирована"""
+    with file_session_factory() as db:
+        db.add_all([
+            models.LinkChange(id=1, short_code="gap-one", action="update", changed_at=datetime.now()),
+            models.LinkChange(id=3, short_code="gap-three", action="update", changed_at=datetime.now()),
+        ])
+        db.commit()
+        records, cursor = snapshot._changed_records(db, 0)
+    assert {record.short_code for record in records} == {"gap-one", "gap-three"}
+    assert cursor == 1
+
+
+def test_export_delta_requires_snapshot(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        snapshot.export_delta(str(tmp_path), [])
+
+
+def test_edge_store_and_redirects(tmp_path, monkeypatch):
+    """Тест: узел загружает снимок и дельты, новый снимок подменяет ссылки"""
+    directory = str(tmp_path)
+    write_file(os.path.join(directory, snapshot.snapshot_name(1.0)), [
+        Record("e-one", "https://example.com/one", None),
+        Record("e-two", "https://example.com/two", None),
+        Record("e-old", "https://example.com/old", time.time() - 60),
+    ], created_at=1.0)
+    store = edge.EdgeStore(directory)
+    monkeypatch.setattr(edge, "store", store)
+    assert store.reload() is True
+    assert store.reload() is False
+
+    client = TestClient(edge.app)
+    response = client.get("/e-one", follow_redirects=False)
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/one"
+    assert client.get("/e-old", follow_redirects=False).json()["detail"] == "Link has expired"
+    assert client.get("/missing", follow_redirects=False).status_code == 404
+
+    write_file(os.path.join(directory, snapshot.delta_name(1.0, 2.0)), [
+        Record("e-two", None, None),
+        Record("e-three", "https://example.com/three", None),
+    ], DELTA, created_at=2.0, base=1.0)
+    assert store.reload() is True
+    assert client.get("/e-two", follow_redirects=False).status_code == 404
+    assert client.get("/e-three", follow_redirects=False).status_code == 307
+
+    write_file(os.path.join(directory, snapshot.snapshot_name(3.0)), [
+        Record("e-four", "https://example.com/four", None),
+    ], created_at=3.0)
+    assert store.reload() is True
+    assert set(store.links) == {"e-four"}
+    assert client.get("/healthz").json()["links"] == 1
+
+
+def test_export_delta_falls_back_to_snapshot_after_prune(tmp_path, file_session_factory):
+    """Тест: если журнал очищен дальше курсора последнего файла, выгружается полный снимок"""
+    from app import changes
+
+    directory = str(tmp_path / "edge")
+    old = datetime.now() - timedelta(days=2)
+    with file_session_factory() as db:
+        db.add(models.Link(short_code="pr-one", original_url="https://example.com/one", created_at=old))
+        db.add(models.Link(short_code="pr-two", original_url="https://example.com/two", created_at=old))
+        db.commit()
+    first = snapshot.export_snapshot(directory, [file_session_factory])
+
+    with file_session_factory() as db:
+        db.query(models.Link).filter_by(short_code="pr-one").one().is_active = False
+        db.commit()
+        db.query(models.Link).filter_by(short_code="pr-two").one().original_url = "https://example.com/moved"
+        db.commit()
+        # Все записи, кроме последней, старше срока хранения журнала
+        last = changes.latest_id(db)
+        db.query(models.LinkChange).filter(models.LinkChange.id < last).update({"changed_at": old})
+        db.commit()
+        assert changes.prune(db, retention_hours=24) > 0
+
+    time.sleep(0.01)
+    result = snapshot.export_delta(directory, [file_session_factory])
+    assert result["file"].startswith("snapshot-") and result["file"] != first["file"]
+    assert snapshot.latest_files(directory) == (result["file"], [])
+    records = {record.short_code: record.original_url for record in SnapshotFile(os.path.join(directory, result["file"]))}
+    assert records == {"pr-two": "https://example.com/moved"}
@@ -0,0 +1,38 @@
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from app import cache, main, migrate
+
+
+def test_lifespan_skips_schema_by_default():
+    """Тест: при запуске воркера схема БД не создается, этапы запуска замеряются"""
+    with patch.object(migrate, "create_schema") as mock_create_schema:
+        with TestClient(main.app) as client:
+            assert client.get("/").status_code == 200
+
+    mock_create_schema.assert_not_called()
+    timings = main.app.state.startup_timings
+    assert set(timings) == {"import", "schema", "redis", "background"}
+    assert "app_startup_seconds" in main.metrics_registry.render()
+
+
+def test_lifespan_creates_schema_when_enabled(monkeypatch):
+    """Тест: DB_CREATE_SCHEMA включает создание схемы при запуске"""
+    monkeypatch.setattr(main, "DB_CREATE_SCHEMA", True)
+    with patch.object(migrate, "create_schema", return_value=0.01) as mock_create_schema:
+        with TestClient(main.app):
+            pass
+
+    mock_create_schema.assert_called_once()
+
+
+def test_init_redis_is_lazy(monkeypatch):
+    """Тест: клиент Redis создается при запуске, а не при импорте, и только один раз"""
+    monkeypatch.setattr(cache, "TESTING", False)
+    monkeypatch.setattr(cache, "redis_client", None)
+    with patch("redis.Redis") as mock_redis:
+        cache.init_redis()
+        cache.init_redis()
+
+    mock_redis.assert_called_once()
+    assert cache.redis_client is mock_redis.return_value
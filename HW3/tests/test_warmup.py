@@ -0,0 +1,112 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from app import auth, cache, models, warmup
+
+
+@pytest.fixture
+def file_session_factory(tmp_path):
+    """Фабрика сессий для SQLite-файла, доступного из нескольких потоков"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'warmup.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _add_links(Session):
+    now = datetime.now()
+    with Session() as db:
+        db.add_all([
+            models.Link(short_code="wu-hot", original_url="https://example.com/hot",
+                        clicks=500, last_used=now, is_active=True),
+            models.Link(short_code="wu-warm", original_url="https://example.com/warm",
+                        clicks=50, last_used=now - timedelta(days=1), is_active=True),
+            models.Link(short_code="wu-old", original_url="https://example.com/old",
+                        clicks=10000, last_used=now - timedelta(days=60), is_active=True),
+            models.Link(short_code="wu-inactive", original_url="https://example.com/inactive",
+                        clicks=900, last_used=now, is_active=False),
+            models.Link(short_code="wu-expired", original_url="https://example.com/expired",
+                        clicks=900, last_used=now, expires_at=now - timedelta(hours=1), is_active=True),
+        ])
+        db.commit()
+
+
+def test_hottest_link_ids_order(file_session_factory):
+    """Тест порядка отбора популярных ссылок"""
+    _add_links(file_session_factory)
+    with file_session_factory() as db:
+        ids = warmup.hottest_link_ids(db, top_n=10)
+        codes = [db.get(models.Link, link_id).short_code for link_id in ids]
+
+    assert codes == ["wu-hot", "wu-warm", "wu-old"]
+
+
+def test_hotness_order_puts_unused_links_last():
+    """Тест: ссылки без переходов идут последними и в PostgreSQL"""
+    sql = str(select(models.Link.id).order_by(*warmup.hotness_order()).compile(dialect=postgresql.dialect()))
+    assert sql.count("DESC NULLS LAST") == 2
+
+
+def test_warm_cache_loads_links(file_session_factory):
+    """Тест загрузки популярных ссылок в кэш пачками"""
+    _add_links(file_session_factory)
+    for code in ("wu-hot", "wu-warm", "wu-old", "wu-inactive"):
+        cache.delete_link_cache(code)
+
+    result = warmup.warm_cache(top_n=2, chunk_size=1, concurrency=2, session_factory=file_session_factory)
+
+    assert result["status"] == "completed"
+    assert result["links"] == 2
+    assert result["chunks"] == 2
+    assert cache.get_link_cache("wu-hot") == "https://example.com/hot"
+    assert cache.get_stats_cache("wu-warm")["clicks"] == 50
+    assert cache.get_link_cache("wu-old") is None
+    assert cache.get_link_cache("wu-inactive") is None
+    assert warmup.last_warmup["links"] == 2
+
+
+def test_redis_restart_watcher():
+    """Тест обнаружения переподключения и перезапуска Redis"""
+    mock_redis = MagicMock()
+    mock_redis.info.return_value = {"run_id": "a"}
+    on_restart = MagicMock()
+    watcher = warmup.RedisRestartWatcher(on_restart=on_restart)
+
+    with patch.object(cache, "redis_client", mock_redis):
+        watcher.check()
+        watcher.check()
+        on_restart.assert_not_called()
+
+        mock_redis.info.return_value = {"run_id": "b"}
+        watcher.check()
+        on_restart.assert_called_once_with("redis-restart")
+
+        mock_redis.info.side_effect = ConnectionError("down")
+        watcher.check()
+        assert watcher.available is False
+
+        mock_redis.info.side_effect = None
+        watcher.check()
+        on_restart.assert_called_with("redis-reconnect")
+
+
+def test_admin_warmup_endpoint(client, auth_token, test_user):
+    """Тест запуска прогрева через административный эндпоинт"""
+    with patch.object(warmup, "warm_cache") as mock_warm:
+        response = client.post(
+            "/admin/cache/warmup?top_n=100",
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 403
+        mock_warm.assert_not_called()
+
+        with patch.object(auth, "ADMIN_USERNAMES", [test_user.username]):
+            response = client.post(
+                "/admin/cache/warmup?top_n=100",
+                headers={"Authorization": f"Bearer {auth_token}"}
+            )
+        assert response.status_code == 202
+        mock_warm.assert_called_once_with(top_n=100, reason="admin")